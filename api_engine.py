@@ -0,0 +1,196 @@
+# api_engine.py
+"""
+Заказ кодов без мастера в браузере: те же запросы, что отправляет SPA портала
+(создать заказ -> отправить в ГИС МТ), напрямую по HTTP. Подпись — в браузере:
+её делает расширение КриптоПро, поэтому запросом её не повторить; мастер
+открывает страницу отправленного заказа (API_ORDER_URL) и проходит экран подписи.
+
+Авторизация — cookies браузерной сессии: снимаются один раз (driver.get_cookies())
+и переиспользуются пулом соединений urllib3 (keep-alive), пока портал не
+ответит 401/403 — тогда снимаются заново. Браузер нужен только для входа и
+как запасной путь.
+
+Пока заказ не создан, любая неожиданность (нет cookies, путь API не найден,
+5xx, разрыв соединения) — ApiFallback: позицию выполняет мастер в браузере.
+После создания запасного пути нет — мастер создал бы второй заказ рядом с
+черновиком API (как и ORDER_RESTARTS, см. wizard.checkpoint): ошибка — это
+ошибка позиции. После API_FALLBACK_LIMIT отказов подряд процесс перестаёт
+пробовать API.
+
+    ORDER_ENGINE = "api" в backend.py
+    python bench.py --engine api        # замер на mock_kontur
+"""
+import os
+import json
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import urllib3
+
+import timing
+import journal
+from backend import (
+    API_BASE_URL, API_ENDPOINTS, API_TOKEN_HEADERS, API_TIMEOUT, API_FALLBACK_LIMIT,
+    order_lines, browser_not_found,
+)
+
+# соединений к порталу на процесс (позиции одного процесса идут по одной, запас — на прогрев)
+POOL_SIZE = 4
+
+
+class ApiFallback(Exception):
+    """API не справился до создания заказа — позицию выполняет мастер в браузере."""
+
+
+class ApiClient:
+    def __init__(self, base_url: str = API_BASE_URL, endpoints: Optional[Dict[str, str]] = None,
+                 token_headers: Optional[Dict[str, str]] = None, timeout: float = API_TIMEOUT,
+                 fallback_limit: int = API_FALLBACK_LIMIT):
+        self.base_url = base_url.rstrip("/")
+        self.endpoints = endpoints or API_ENDPOINTS
+        self.token_headers = API_TOKEN_HEADERS if token_headers is None else token_headers
+        self.timeout = timeout
+        self.fallback_limit = fallback_limit
+        self._lock = threading.Lock()
+        self._http: Optional[urllib3.PoolManager] = None
+        self._pid: Optional[int] = None
+        self._headers: Optional[Dict[str, str]] = None
+        self._failures = 0
+
+    @property
+    def disabled(self) -> bool:
+        with self._lock:
+            return self._failures >= self.fallback_limit
+
+    def _pool(self) -> urllib3.PoolManager:
+        # соединения не переживают fork — в процессе-воркере открываем свои
+        with self._lock:
+            if self._http is None or self._pid != os.getpid():
+                self._http = urllib3.PoolManager(maxsize=POOL_SIZE, retries=False,
+                                                 timeout=urllib3.Timeout(total=self.timeout))
+                self._pid = os.getpid()
+                self._headers = None
+            return self._http
+
+    def harvest(self, driver):
+        """Cookies (и токены из них, см. API_TOKEN_HEADERS) авторизованного браузера -> заголовки API."""
+        with timing.span("api_harvest"):
+            cookies = {c["name"]: c["value"] for c in driver.get_cookies()}
+            user_agent = driver.execute_script("return navigator.userAgent;")
+        if not cookies:
+            raise ApiFallback("в браузере нет cookies портала (вход не выполнен?)")
+        headers = {
+            "Cookie": "; ".join(f"{name}={value}" for name, value in cookies.items()),
+            "User-Agent": user_agent or "",
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+        }
+        for header, cookie in self.token_headers.items():
+            if cookie in cookies:
+                headers[header] = cookies[cookie]
+        with self._lock:
+            self._headers = headers
+        logging.info(f"API: cookies браузера сняты ({len(cookies)})")
+
+    def post(self, step: str, body: Dict, get_driver: Callable, **path_args) -> Tuple[int, Dict]:
+        """
+        POST на эндпоинт step (API_ENDPOINTS). При 401/403 cookies снимаются
+        заново и запрос повторяется один раз. Возвращает (HTTP-статус, JSON ответа).
+        """
+        http = self._pool()
+        url = self.base_url + self.endpoints[step].format(**path_args)
+        for attempt in (1, 2):
+            if self._headers is None:
+                try:
+                    self.harvest(get_driver())
+                except ApiFallback:
+                    raise
+                except Exception as e:
+                    raise ApiFallback(f"cookies браузера не сняты: {e}") from e
+            with timing.span(f"api_{step}"):
+                resp = http.request("POST", url, body=json.dumps(body, ensure_ascii=False).encode("utf-8"),
+                                    headers=self._headers)
+            if resp.status in (401, 403) and attempt == 1:
+                logging.warning(f"API '{step}': HTTP {resp.status} — снимаем cookies браузера заново")
+                with self._lock:
+                    self._headers = None
+                continue
+            try:
+                data = json.loads(resp.data or b"{}")
+            except ValueError:
+                data = {"error": resp.data[:200].decode("utf-8", "replace")}
+            return resp.status, data if isinstance(data, dict) else {"data": data}
+
+    def _succeeded(self):
+        """Портал ответил по существу — счётчик отказов подряд сначала."""
+        with self._lock:
+            self._failures = 0
+
+    def _fallback(self, reason: str) -> ApiFallback:
+        with self._lock:
+            self._failures += 1
+            failures = self._failures
+        if failures == self.fallback_limit:
+            logging.warning(f"API не сработал {failures} раз подряд — дальше заказы только через мастер")
+        return ApiFallback(reason)
+
+    def perform_order(self, item: Dict, get_driver: Callable,
+                      checkpoint: Callable) -> Tuple[bool, str, Optional[str]]:
+        """
+        Создаёт и отправляет в ГИС МТ заказ позиции item (OrderItem -> asdict).
+        get_driver — драйвер на странице портала (для cookies), checkpoint — wizard.checkpoint.
+        Возвращает (ok, msg, номер заказа): номер — заказ отправлен и ждёт подписи
+        в браузере, None — итог позиции уже msg. ApiFallback — выполнить мастером.
+        """
+        lines = order_lines(item)
+        gtin = ", ".join(g for g, _ in lines)
+        order = {
+            "order_name": str(item["order_name"]),
+            "production": "rf",
+            "cis_type": "UNIT",
+            "lines": [{"gtin": str(g), "codes_count": int(c)} for g, c in lines],
+        }
+
+        # Создать заказ (черновик)
+        try:
+            status, data = self.post("create", order, get_driver)
+        except ApiFallback as e:
+            raise self._fallback(str(e))
+        except urllib3.exceptions.HTTPError as e:
+            raise self._fallback(f"создание заказа: {e}")
+        if status == 422 and data.get("unknown_gtins"):
+            self._succeeded()
+            unknown: List[str] = [str(g) for g in data["unknown_gtins"]]
+            browser_not_found.extend(unknown)
+            if len(lines) > 1:
+                return False, f"Не удалось заполнить строки заказа: GTIN {', '.join(unknown)}", None
+            return False, f"GTIN {gtin} НЕ НАЙДЕН В СПРАВОЧНИКЕ", None
+        order_id = data.get("id")
+        if status not in (200, 201) or order_id is None:
+            raise self._fallback(f"создание заказа: HTTP {status} {data.get('error', '')}".rstrip())
+        self._succeeded()
+        logging.info(f"API: заказ {order_id} создан ({len(lines)} строк)")
+
+        # Отправить в ГИС МТ. Черновик уже есть — любая ошибка дальше = ошибка позиции
+        # (мастер создал бы второй заказ); нет ответа — неизвестно, ушёл ли заказ
+        try:
+            status, data = self.post("send", {}, get_driver, order_id=order_id)
+        except ApiFallback as e:
+            return False, f"Заказ {order_id} создан, но не отправлен: {e} — черновик в портале", None
+        except urllib3.exceptions.HTTPError as e:
+            checkpoint(item, journal.SENT, "не подтверждено")
+            return False, f"Заказ {order_id}: нет ответа на отправку в ГИС МТ ({e}) — проверьте в портале", None
+        if status != 200:
+            return False, (f"Заказ {order_id} создан, но не отправлен: HTTP {status} "
+                           f"{data.get('error', '')}".rstrip() + " — черновик в портале"), None
+        checkpoint(item, journal.SENT, f"api {order_id}")
+        return True, f"Заказ {order_id} отправлен в ГИС МТ", str(order_id)
+
+
+# клиент текущего процесса
+client = ApiClient()
+
+
+def perform_order(item: Dict, get_driver: Callable, checkpoint: Callable) -> Tuple[bool, str, Optional[str]]:
+    return client.perform_order(item, get_driver, checkpoint)
@@ -0,0 +1,223 @@
+# artifacts.py
+"""
+Артефакты ошибок мастера заказа: скриншот, DOM и консоль браузера.
+
+Мастер только забирает данные у браузера (скриншот — JPEG через CDP, без
+кодирования в Python); декодирование, запись на диск и чистка — в фоновом
+потоке. Очередь ограничена: если запись не успевает, снимок пропускается,
+а не задерживает заказ.
+
+    artifacts.capture(driver, "sign_cert", item.get("_uid"))
+
+Файлы: runs/<прогон>/artifacts/<uid>/<NN>-<шаг>.jpg|.html|.console.json
+(вне прогона — runs/artifacts/). Не больше ARTIFACTS_MAX_PER_RUN снимков на
+прогон — на все процессы-воркеры: номер снимка NN занимается файлом в
+artifacts/.slots/. Если все артефакты занимают больше ARTIFACTS_MAX_MB —
+удаляются самые старые; папки runs/ при этом обходятся, только когда
+счётчик записанного превысил лимит.
+"""
+import os
+import json
+import atexit
+import queue
+import base64
+import shutil
+import logging
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+import timing
+from backend import ARTIFACTS, ARTIFACTS_MAX_PER_RUN, ARTIFACTS_MAX_MB
+
+ARTIFACTS_DIR = "artifacts"
+# номера снимков прогона, занятые всеми процессами (файл на снимок)
+SLOTS_DIR = ".slots"
+# снимков в очереди на запись; больше — новые пропускаются
+QUEUE_SIZE = 8
+SCREENSHOT_QUALITY = 70
+
+
+class ArtifactCollector:
+    def __init__(self, kinds: Tuple[str, ...] = ARTIFACTS, max_per_run: int = ARTIFACTS_MAX_PER_RUN,
+                 max_bytes: int = ARTIFACTS_MAX_MB * 2 ** 20):
+        self.kinds = kinds
+        self.max_per_run = max_per_run
+        self.max_bytes = max_bytes
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue(maxsize=QUEUE_SIZE)
+        self._lock = threading.Lock()
+        # прогоны, где лимит снимков уже исчерпан (чтобы не проверять на диске каждый раз)
+        self._exhausted: Set[str] = set()
+        # сколько байт занимают все артефакты (None — ещё не считали); только поток записи
+        self._total: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def _reserve(self, root: str) -> Optional[int]:
+        """
+        Занимает номер следующего снимка прогона (файл в SLOTS_DIR, O_EXCL — атомарно
+        и между процессами). None — лимит снимков прогона исчерпан.
+        """
+        slots = os.path.join(root, SLOTS_DIR)
+        os.makedirs(slots, exist_ok=True)
+        n = len(os.listdir(slots))
+        while n < self.max_per_run:
+            try:
+                os.close(os.open(os.path.join(slots, str(n)), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return n + 1
+            except FileExistsError:
+                n += 1
+        return None
+
+    def _target(self, uid: Optional[str]) -> Optional[Tuple[str, int]]:
+        """(папка снимка, номер снимка в прогоне) или None, если лимит снимков прогона исчерпан."""
+        root = os.path.join(timing.current_run_dir() or timing.RUNS_DIR, ARTIFACTS_DIR)
+        with self._lock:
+            if root in self._exhausted:
+                return None
+            try:
+                n = self._reserve(root)
+            except OSError:
+                logging.warning(f"Не удалось занять номер снимка в {root}", exc_info=True)
+                return None
+            if n is None:
+                self._exhausted.add(root)
+                return None
+        return os.path.join(root, uid or "no-uid"), n
+
+    def capture(self, driver, step: str, uid: Optional[str] = None):
+        """Снимает состояние браузера для шага step. Ошибки снятия только логируются."""
+        if not self.kinds or driver is None:
+            return
+        target = self._target(uid)
+        if target is None:
+            logging.info(f"Артефакты '{step}' пропущены: лимит {self.max_per_run} снимков на прогон")
+            return
+        record = {"dir": target[0], "n": target[1], "step": step}
+        with timing.span("artifact_capture"):
+            if "screenshot" in self.kinds:
+                try:
+                    shot = driver.execute_cdp_cmd("Page.captureScreenshot",
+                                                  {"format": "jpeg", "quality": SCREENSHOT_QUALITY})
+                    record["jpg"] = shot["data"]
+                except Exception:
+                    try:
+                        record["png"] = driver.get_screenshot_as_base64()
+                    except Exception:
+                        logging.warning(f"Скриншот '{step}' не снят", exc_info=True)
+            if "dom" in self.kinds:
+                try:
+                    record["html"] = driver.execute_script("return document.documentElement.outerHTML;")
+                except Exception:
+                    logging.warning(f"DOM '{step}' не снят", exc_info=True)
+            if "console" in self.kinds:
+                try:
+                    record["console"] = driver.get_log("browser")
+                except Exception:
+                    # get_log есть не у всех драйверов (нужен goog:loggingPrefs)
+                    pass
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            logging.warning(f"Артефакты '{step}' пропущены: запись не успевает")
+
+    def _ensure_thread(self):
+        # поток не переживает fork — в процессе-воркере запускаем свой
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="artifacts", daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            try:
+                if record is None:
+                    return
+                written = self._write(record)
+                if self._total is None:
+                    self._total = self._scan()[0]
+                else:
+                    self._total += written
+                if self._total > self.max_bytes:
+                    self._enforce_size()
+            except Exception:
+                logging.exception("Не удалось сохранить артефакты")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, record: Dict) -> int:
+        """Записывает снимок; возвращает, сколько байт записано."""
+        os.makedirs(record["dir"], exist_ok=True)
+        base = os.path.join(record["dir"], f"{record['n']:02d}-{record['step']}")
+        paths = []
+        for ext in ("jpg", "png"):
+            if ext in record:
+                paths.append(f"{base}.{ext}")
+                with open(paths[-1], "wb") as f:
+                    f.write(base64.b64decode(record[ext]))
+        if "html" in record:
+            paths.append(f"{base}.html")
+            with open(paths[-1], "w", encoding="utf-8") as f:
+                f.write(record["html"] or "")
+        if "console" in record:
+            paths.append(f"{base}.console.json")
+            with open(paths[-1], "w", encoding="utf-8") as f:
+                json.dump(record["console"], f, ensure_ascii=False, indent=2)
+        logging.info(f"Артефакты шага '{record['step']}': {base}.*")
+        return sum(os.path.getsize(p) for p in paths)
+
+    def _scan(self) -> Tuple[int, List[Tuple[float, int, str]]]:
+        """Все папки артефактов (по позициям): (общий размер, [(mtime, размер, путь)])."""
+        dirs: List[Tuple[float, int, str]] = []
+        total = 0
+        for root in [os.path.join(timing.RUNS_DIR, ARTIFACTS_DIR)] + [
+            os.path.join(timing.RUNS_DIR, d, ARTIFACTS_DIR) for d in os.listdir(timing.RUNS_DIR)
+        ]:
+            if not os.path.isdir(root):
+                continue
+            for uid_dir in os.scandir(root):
+                if not uid_dir.is_dir() or uid_dir.name == SLOTS_DIR:
+                    continue
+                files = [e.stat() for e in os.scandir(uid_dir.path) if e.is_file()]
+                size = sum(st.st_size for st in files)
+                total += size
+                dirs.append((max((st.st_mtime for st in files), default=0.0), size, uid_dir.path))
+        return total, dirs
+
+    def _enforce_size(self):
+        """Удаляет самые старые папки артефактов (по позициям), пока все вместе больше max_bytes."""
+        # счётчик мог отстать (пишут и другие процессы) — пересчитываем по диску
+        total, dirs = self._scan()
+        for _, size, path in sorted(dirs):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            logging.info(f"Артефакты {path} удалены: превышен лимит {self.max_bytes // 2 ** 20} МБ")
+        self._total = total
+
+    def flush(self, timeout: float = 30):
+        """Дожидается записи всего, что в очереди (перед выходом из процесса)."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+
+# сборщик текущего процесса
+collector = ArtifactCollector()
+
+
+def capture(driver, step: str, uid: Optional[str] = None):
+    collector.capture(driver, step, uid)
+
+
+def flush(timeout: float = 30):
+    collector.flush(timeout)
+
+
+# дописать очередь при выходе (воркеры multiprocessing — через Finalize, см. wizard)
+atexit.register(flush)
@@ -1,23 +1,22 @@
-# main.py
+# backend.py
+"""
+Настройки, данные позиции и справочник номенклатуры. Модуль лёгкий: pandas
+подключается только при разборе xlsx, Selenium и мастер заказа — в wizard.py.
+"""
+from __future__ import annotations
+
 import os
-import time
+import pickle
+import hashlib
 import logging
-import pandas as pd
-from concurrent.futures import ProcessPoolExecutor, as_completed
 from multiprocessing import cpu_count
-from dataclasses import dataclass, asdict
-from typing import List, Dict
-
-# selenium
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from dataclasses import dataclass, asdict, field
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
+
+import timing
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 # -----------------------------
 # ========== CONFIG ===========
@@ -25,27 +24,168 @@ from selenium.common.exceptions import TimeoutException, NoSuchElementException
 YANDEX_DRIVER_PATH = r"driver\yandexdriver.exe"  # проверь путь
 YANDEX_BROWSER_PATH = r"C:\Users\sklad\AppData\Local\Yandex\YandexBrowser\Application\browser.exe"
 NOMENCLATURE_XLSX = "data/nomenclature.xlsx"
+# Бинарный кэш нормализованного справочника (пересобирается при изменении xlsx)
+NOMENCLATURE_CACHE = "data/nomenclature.cache.pkl"
 LOG_FILE = "kontur_log.log"
+# Формат лога: "json" — запись на строку с полями uid/step/duration (см. logs.py), "text" — как раньше
+LOG_FORMAT = "json"
+
+# Профиль браузера с авторизацией в Контуре
+USER_DATA_DIR = r"C:\Users\sklad\AppData\Local\Yandex\YandexBrowser\User Data\Default"
+PROFILE_DIRECTORY = r'Vinsent O`neal'
+
+# Адрес портала. Для замеров без портала: KONTUR_BASE_URL=http://127.0.0.1:8765 (см. mock_kontur.py)
+KONTUR_BASE_URL = os.environ.get("KONTUR_BASE_URL", "https://mk.kontur.ru").rstrip("/")
+ORGANIZATION_ID = "5cda50fa-523f-4bb5-85b6-66d7241b23cd"
+
+# Страница, с которой начинается каждый заказ (склады -> "Заказать коды")
+ORDER_ENTRY_URL = f"{KONTUR_BASE_URL}/organizations/{ORGANIZATION_ID}/warehouses"
+
+# Варианты выпадающего списка (Kontur UI MenuItem) в поиске по справочнику товаров
+GTIN_OPTION_SELECTOR = "[data-tid='MenuItem__root'], [role='option']"
+
+# Сколько позиций выполнять в одном браузере до его перезапуска
+SESSION_MAX_ORDERS = 25
+
+# Запускать браузер и открывать страницу заказа в фоне, пока оператор вводит позиции
+PREWARM_BROWSER = True
+# Сколько секунд прогретая страница считается свежей (дольше — открываем заново)
+PREWARM_MAX_AGE = 300
 
 # Запускать в фоне (headless). Если нужен профиль/авторизация - ставь False.
 HEADLESS = False
 
+# Профиль запуска браузера: "default" — как раньше; "performance" — без картинок, шрифтов
+# и аналитики (CDP Network.setBlockedURLs), без фоновых служб браузера, с постоянным
+# дисковым кэшем (бандлы портала не качаются заново после перезапуска браузера) и
+# без ожидания загрузки картинок в driver.get. Сравнить: bench.py --launch
+LAUNCH_PROFILE = "default"
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*google-analytics.com*", "*googletagmanager.com*", "*mc.yandex.ru*", "*top-fwz1.mail.ru*",
+]
+BROWSER_CACHE_DIR = os.path.abspath(os.path.join("data", "browser_cache"))
+# Отключать расширения браузера. Подпись сертификатом идёт через расширение КриптоПро,
+# поэтому для портала — False; True имеет смысл только для mock_kontur/bench.
+DISABLE_EXTENSIONS = False
+
+# Фоновые службы браузера, не нужные для заказа (профиль запуска "performance")
+PERFORMANCE_ARGS = [
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-domain-reliability",
+    "--disable-breakpad",
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--mute-audio",
+]
+
 # Кол-во параллельных процессов (по умолчанию cpu_count())
 MAX_WORKERS = max(1, cpu_count() - 1)
 
-# Тайминги (настрой, если нужно)
-SHORT_SLEEP = 0.2
-MEDIUM_SLEEP = 1.0
-LONG_SLEEP = 2.5
+# Сколько браузеров запускать параллельно при выполнении пачки (1 = последовательно).
+# Каждый браузер работает на своей копии профиля (см. execute_parallel).
+PARALLEL_WORKERS = 1
+
+# Объединять позиции в меньшее число заказов кодов (см. batch_optimizer):
+# None — не объединять, "gtin_order" — в пределах одной заявки, "gtin" — по всей пачке;
+# "order_lines"/"batch_lines" — многострочные заказы (строка на GTIN) по заявке/по всей пачке.
+COALESCE_POLICY = None
+
+# Максимум строк товаров в одном заказе кодов при объединении в многострочные заказы
+ORDER_MAX_LINES = 30
+
+# Выдача позиций на выполнение (см. dispatcher.py): не больше DISPATCH_RATE_PER_MIN
+# заказов в минуту (с запасом DISPATCH_BURST подряд) и не больше DISPATCH_MAX_IN_FLIGHT
+# одновременно — чтобы портал не начал отклонять запросы. None — без ограничения темпа.
+DISPATCH_RATE_PER_MIN = 60
+DISPATCH_BURST = 5
+DISPATCH_MAX_IN_FLIGHT = 4
+# Сначала выполняются позиции с большим приоритетом (OrderItem.priority, колонка
+# "приоритет" в пакетном файле); заявки со словами из URGENT_MARKERS в названии
+# получают +URGENT_PRIORITY. При равном приоритете — в порядке ввода.
+URGENT_MARKERS = ("срочно",)
+URGENT_PRIORITY = 10
+
+# Таймауты ожиданий мастера подстраиваются под наблюдаемые задержки портала
+# (замеры копятся в runs/latency.sqlite3, см. timeouts.py); таймауты в коде —
+# значения по умолчанию до накопления замеров. False — всегда ждать их.
+ADAPTIVE_TIMEOUTS = True
+
+# Артефакты ошибок мастера (см. artifacts.py): что снимать, сколько снимков на прогон
+# и сколько места (МБ) под артефакты всех прогонов в runs/ — старые удаляются
+ARTIFACTS = ("screenshot", "dom", "console")
+ARTIFACTS_MAX_PER_RUN = 50
+ARTIFACTS_MAX_MB = 200
+
+# Повтор действия шага на месте (перенайти элемент и кликнуть снова), если клик
+# не прошёл из-за временной ошибки (элемент перерисован, перекрыт, ещё не готов).
+# Попыток на элемент (имя из locators.py); пауза между попытками — от RETRY_DELAY,
+# удваивается, но не больше RETRY_MAX_DELAY. Элемент, которого не дождались, не
+# повторяется: таймаут ожидания уже и есть бюджет шага. Повтор ищет элемент заново
+# не дольше RETRY_FIND_TIMEOUT сек — он только что был на странице.
+STEP_RETRY_ATTEMPTS = {
+    "default": 2,
+    "send_button": 3,
+    "sign_cert_button": 3,
+    "sign_send_button": 2,
+}
+RETRY_DELAY = 0.25
+RETRY_MAX_DELAY = 2.0
+RETRY_FIND_TIMEOUT = 2.0
+# Сколько раз начать заказ заново (со страницы заказа), если мастер застрял или
+# браузер упал. Только пока заказ не отправлен в ГИС МТ — иначе будет дубль.
+ORDER_RESTARTS = 1
+
+# Как выполнять заказ: "ui" — мастер в браузере; "api" — создание и отправка заказа
+# теми же запросами, что шлёт мастер, напрямую по HTTP с cookies авторизованного
+# браузера (см. api_engine.py); подпись — в браузере, на странице заказа API_ORDER_URL.
+# Если API не ответил как ожидалось до создания заказа — позиция идёт через мастер.
+# Пути API_ENDPOINTS и API_ORDER_URL сверь с порталом (DevTools -> Network) перед включением.
+ORDER_ENGINE = "ui"
+API_BASE_URL = f"{KONTUR_BASE_URL}/api/v1/organizations/{ORGANIZATION_ID}"
+API_ENDPOINTS = {
+    "create": "/codes-orders",
+    "send": "/codes-orders/{order_id}/send",
+}
+API_ORDER_URL = f"{KONTUR_BASE_URL}/organizations/{ORGANIZATION_ID}/codes-orders/{{order_id}}"
+# Заголовки запросов API из cookies браузера: {"X-CSRF-Token": "имя cookie"}
+API_TOKEN_HEADERS: Dict[str, str] = {}
+API_TIMEOUT = 15
+# Сколько раз подряд API может не сработать, прежде чем процесс перестанет его пробовать
+API_FALLBACK_LIMIT = 3
+
+# Мастер заказа ждёт конкретных событий в DOM, а не фиксированных пауз.
+# Здесь — минимальные паузы (сек) для мест, где события нет (анимации модалок,
+# debounce поиска). 0 = не ждать; увеличь, если портал не успевает.
+SETTLE_DELAYS = {
+    "modal": 0.0,             # после открытия/закрытия модального окна
+    "gtin_search": 0.0,       # перед выбором GTIN из выпадающего списка
+    "after_sign": 0.0,        # после "Подписать и отправить в ГИС МТ"
+}
+# Задержка между символами при вводе количества (0 = вводить строкой целиком)
+TYPE_CHAR_DELAY = 0.0
+
+# Как заполнять шаг "Товары": "keys" — кликами и вводом с клавиатуры (запрос к браузеру
+# на каждое действие), "js" — все строки одним execute_async_script с проверкой значений
+# (если скрипт не справился — оставшиеся строки заполняются как "keys"). Сравнить: bench.py --fill
+PRODUCTS_FILL_MODE = "keys"
 
 # -----------------------------
 # logging (минимальные сообщения в терминал, подробности в файл)
 # -----------------------------
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
+def setup_logging():
+    """
+    Лог в LOG_FILE: запись пишет фоновый поток, браузерные потоки и воркеры
+    только ставят её в очередь (см. logs.py). Вызывается точками входа, а не при импорте модуля.
+    """
+    import logs
+
+    logs.setup(LOG_FILE, LOG_FORMAT)
+
 
 # helper prints only for prompts / summary
 def ui_print(msg: str):
@@ -63,459 +203,331 @@ class OrderItem:
     codes_count: int        # Количество кодов для заказа
     gtin: str = ""          # найдём перед запуском воркеров
     full_name: str = ""     # опционально: полное наименование из справочника
+    # дополнительные строки товаров того же заказа: [{"gtin": ..., "codes_count": ...}]
+    # (первая строка — gtin/codes_count выше; см. batch_optimizer)
+    lines: List[Dict] = field(default_factory=list)
+    priority: int = 0       # больше — раньше (см. dispatcher)
 
-# -----------------------------
-# Lookup GTIN in nomenclature.xlsx
-# -----------------------------
-def lookup_gtin(df: pd.DataFrame, simpl_name: str, size: str, units_per_pack: str,
-                color: str = None, venchik: str = None):
-    """
-    Поиск GTIN и полного наименования по заданным полям.
-    Для венчика используется точное совпадение.
-    """
-    try:
-        simpl = simpl_name.strip().lower()
-        size_l = str(size).strip().lower()
-        units_str = str(units_per_pack).strip()
-        color_l = color.strip().lower() if color else None
-        venchik_l = venchik.strip().lower() if venchik else None
-
-        # Создаём недостающие колонки, чтобы не ломалось
-        for col in ['GTIN', 'Наименование', 'Упрощенно', 'Размер',
-                    'Количество единиц употребления в потребительской упаковке', 'Цвет', 'венчик']:
-            if col not in df.columns:
-                df[col] = ""
-
-        # Основной фильтр
-        cond = (
-            df['Упрощенно'].astype(str).str.strip().str.lower() == simpl
-        ) & (
-            df['Размер'].astype(str).str.strip().str.lower().str.contains(size_l, na=False)
-        ) & (
-            df['Количество единиц употребления в потребительской упаковке'].astype(str).str.strip() == units_str
-        )
 
-        if venchik_l:
-            cond &= df['венчик'].astype(str).str.strip().str.lower() == venchik_l
-        if color_l:
-            cond &= df['Цвет'].astype(str).str.strip().str.lower() == color_l
+# GTIN, которые мастер не нашёл в справочнике портала (дописывает wizard; итоговый отчёт main.py)
+browser_not_found = []
+not_found_list = []
 
-        matches = df[cond]
 
-        if not matches.empty:
-            row = matches.iloc[0]
-            return str(row['GTIN']).strip(), str(row.get('Наименование', '')).strip()
+def order_lines(item: Dict) -> List[Tuple[str, int]]:
+    """Строки товаров заказа (item — OrderItem -> asdict): [(gtin, codes_count), ...]."""
+    return [(item["gtin"], item["codes_count"])] + [
+        (line["gtin"], line["codes_count"]) for line in item.get("lines") or []
+    ]
 
-        # Частичный поиск по Упрощенно и размеру
-        cond2 = (
-            df['Упрощенно'].astype(str).str.strip().str.lower().str.contains(simpl, na=False)
-        ) & (
-            df['Размер'].astype(str).str.strip().str.lower().str.contains(size_l, na=False)
-        )
-        if venchik_l:
-            cond2 &= df['Венчик'].astype(str).str.strip().str.lower() == venchik_l
-        if color_l:
-            cond2 &= df['Цвет'].astype(str).str.strip().str.lower() == color_l
+# -----------------------------
+# Lookup GTIN in nomenclature.xlsx
+# -----------------------------
+COL_GTIN = 'GTIN'
+COL_NAME = 'Наименование'
+COL_SIMPL = 'Упрощенно'
+COL_SIZE = 'Размер'
+COL_UNITS = 'Количество единиц употребления в потребительской упаковке'
+COL_COLOR = 'Цвет'
+COL_VENCHIK = 'венчик'
 
-        matches2 = df[cond2]
-        if not matches2.empty:
-            row = matches2.iloc[0]
-            return str(row['GTIN']).strip(), str(row.get('Наименование', '')).strip()
 
-    except Exception as e:
-        logging.exception("Ошибка в lookup_gtin")
-    return None, None
+def _norm(value, lower: bool = True) -> str:
+    """Нормализация ячейки/ввода: NaN/None -> '', strip, lower."""
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    s = str(value).strip()
+    return s.lower() if lower else s
 
 
-# -----------------------------
-# Worker: выполняет заказ для одной позиции
-# -----------------------------
-browser_not_found = []
-not_found_list = []
-def perform_order_item(item: Dict):
+class NomenclatureIndex:
     """
-    Запускается в отдельном процессе. Получает словарь item (OrderItem -> asdict).
-    Делает браузерную автоматизацию для создания заявки.
-    Возвращает (True/False, message)
+    Справочник, подготовленный для быстрого поиска GTIN.
+
+    Колонки нормализуются один раз при построении. Точный поиск идёт через
+    хеш-индекс (упрощенно, единиц в упаковке, цвет, венчик) -> строки-кандидаты
+    по размеру, частичный — только по корзине (упрощенно, цвет, венчик).
+    Цвет/венчик в ключах могут быть None — это «любое значение», как и в
+    исходном lookup_gtin, где пустой фильтр не применялся.
     """
-    # В процессе логируем в файл
-    logging.info(f"Worker start for order: {item.get('order_name')} - {item.get('simpl_name')}")
 
-    # Преобразуем принимаемые данные
-    order_name = item['order_name']
-    gtin = item['gtin']
-    codes_count = item['codes_count']
-    # Additional fields if needed
-    simpl_name = item['simpl_name']
+    def __init__(self, gtins: List[str], names: List[str], simpl: List[str], sizes: List[str],
+                 units: List[str], colors: List[str], venchiks: List[str]):
+        self.gtins = gtins
+        self.names = names
+        self.simpl = simpl
+        self.sizes = sizes
+        self.units = units
+        self.colors = colors
+        self.venchiks = venchiks
+
+        # (simpl, units, color|None, venchik|None) -> [row, ...] в порядке справочника
+        self._exact: Dict[Tuple[str, str, Optional[str], Optional[str]], List[int]] = {}
+        # (simpl, color|None, venchik|None) -> [row, ...] для частичного поиска
+        self._partial: Dict[Tuple[str, Optional[str], Optional[str]], List[int]] = {}
+        for i in range(len(gtins)):
+            for c in (colors[i], None):
+                for v in (venchiks[i], None):
+                    self._exact.setdefault((simpl[i], units[i], c, v), []).append(i)
+                    self._partial.setdefault((simpl[i], c, v), []).append(i)
+        self._simpl_values = list(dict.fromkeys(simpl))
+        self._frame: Optional[pd.DataFrame] = None
+
+    def __len__(self):
+        return len(self.gtins)
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> "NomenclatureIndex":
+        """Строит индекс из DataFrame справочника (df не изменяется)."""
+        def column(name: str, lower: bool = True) -> List[str]:
+            if name not in df.columns:
+                return [""] * len(df)
+            return [_norm(v, lower) for v in df[name].tolist()]
+
+        return cls(
+            gtins=column(COL_GTIN, lower=False),
+            names=column(COL_NAME, lower=False),
+            simpl=column(COL_SIMPL),
+            sizes=column(COL_SIZE),
+            units=column(COL_UNITS, lower=False),
+            colors=column(COL_COLOR),
+            venchiks=column(COL_VENCHIK),
+        )
 
-    # Selenium setup (each process создает свой драйвер)
-    try:
-        options = Options()
-        options.binary_location = YANDEX_BROWSER_PATH
-
-        # headless (background) — используй современный режим, если поддерживается
-        if HEADLESS:
-            # New headless mode
-            options.add_argument("--headless=new")
-            options.add_argument("--disable-gpu")
-            options.add_argument("--no-sandbox")
-            options.add_argument("--disable-dev-shm-usage")
-            options.add_argument(r"--user-data-dir=C:\Users\sklad\AppData\Local\Yandex\YandexBrowser\User Data\Default")
-            options.add_argument(r'--profile-directory=Vinsent O`neal')
-            options.add_argument("--disable-blink-features=AutomationControlled")
+    @classmethod
+    def from_excel(cls, path: str = NOMENCLATURE_XLSX) -> "NomenclatureIndex":
+        import pandas as pd
+
+        df = pd.read_excel(path)
+        df.columns = df.columns.str.strip()
+        return cls.from_dataframe(df)
+
+    @classmethod
+    def load(cls, path: str = NOMENCLATURE_XLSX, cache_path: str = NOMENCLATURE_CACHE) -> "NomenclatureIndex":
+        """
+        Загружает индекс из бинарного кэша, если xlsx не менялся, иначе
+        парсит xlsx и перезаписывает кэш.
+        Проверка: сначала mtime+размер (дёшево), при расхождении — sha256
+        содержимого (файл могли пересохранить без изменений).
+        """
+        st = os.stat(path)
+        cached = _read_nomenclature_cache(cache_path)
+        if cached is not None:
+            if cached["mtime_ns"] == st.st_mtime_ns and cached["size"] == st.st_size:
+                logging.info(f"Справочник загружен из кэша {cache_path}")
+                return cached["index"]
+            digest = _file_sha256(path)
+            if cached["sha256"] == digest:
+                logging.info(f"Справочник не изменился (sha256), обновляем метаданные кэша {cache_path}")
+                _write_nomenclature_cache(cache_path, cached["index"], st, digest)
+                return cached["index"]
         else:
-            # If you need to use profile, configure here (be careful with concurrent profile usage)
-            # options.add_argument(r"--user-data-dir=...")  # uncomment if necessary
-            options.add_argument(r"--user-data-dir=C:\Users\sklad\AppData\Local\Yandex\YandexBrowser\User Data\Default")
-            options.add_argument(r'--profile-directory=Vinsent O`neal')
-
-        # Common options
-        options.add_argument("--disable-features=VizDisplayCompositor")
-        options.add_argument("--disable-popup-blocking")
-        # prevent Selenium from stealing focus (but some behaviors on Windows still bring window forward)
-        options.add_argument("--disable-backgrounding-occluded-windows")
-
-        service = Service(YANDEX_DRIVER_PATH)
-        driver = webdriver.Chrome(service=service, options=options)
-        wait = WebDriverWait(driver, 20)
-
-        # --- Begin navigation & form filling ---
-        # NOTE: we rely on the XPATHs/selectors you provided earlier. Adjust if the page changes.
-        driver.get("https://mk.kontur.ru/organizations/5cda50fa-523f-4bb5-85b6-66d7241b23cd/warehouses")
-        time.sleep(3)
-
-        # profile select (if visible) - best-effort, ignore if not
-        try:
-            profile_card = wait.until(EC.element_to_be_clickable(
-                (By.XPATH, '//*[@id="root"]/div/div/div[1]/div[2]/div/div/div/div/div[2]/div/div/div/div/div/div/div[1]/div/div/div/div[1]/div/div')
-            ))
-            profile_card.click()
-            print("Выбрали профиль")
-            time.sleep(1)
-        except Exception:
-            logging.info("Profile card not found/clickable or already selected")
-
-        # warehouse select (best-effort)
-        try:
-            warehouse_card = wait.until(EC.element_to_be_clickable(
-                (By.XPATH, '//*[@id="root"]/div/div/div[2]/div/div/div[1]/div[3]/ul/li/div[2]')
-            ))
-            warehouse_card.click()
-            print("Тыкнули профиль")
-            time.sleep(1)
-        except Exception:
-            logging.info("Warehouse card not found/clickable or already selected")
-
-        # Step 1: 'Заказать коды'
-        try:
-            order_codes_btn = wait.until(EC.element_to_be_clickable(
-                (By.XPATH, '//*[@id="root"]/div/div/div[2]/div/div[1]/div/div/div[2]/div/div[2]/div/div/div/span[1]/span/button/div[2]/span[2]')
-            ))
-            order_codes_btn.click()
-            print("Нажали Заказать Коды")
-            time.sleep(2)
-        except Exception:
-            logging.error("Не удалось найти/кликнуть 'Заказать коды'")
-            # try continue — some pages might already be in ordering flow
-            pass
-
-        # Step 2: 'Производство РФ'
-        try:
-            rf_btn = wait.until(EC.element_to_be_clickable(
-                (By.XPATH, '/html/body/div[5]/div/div[2]/div/div/div/div/div[2]/div[2]/div/div[1]/span/span/div/div[2]/div/label/div')
-            ))
-            rf_btn.click()
-            print("Нажали производство РФ")
-            time.sleep(2)
-        except Exception:
-            logging.info("Производство РФ выбор: не найден/не понадобился")
-
-        # Step 3: Далее
-        try:
-            next_btn = wait.until(EC.element_to_be_clickable(
-                (By.XPATH, '/html/body/div[5]/div/div[2]/div/div/div/div/div[2]/div[3]/div/div/div/div[2]/div/div/span[1]/span/button/div[2]/span')
-            ))
-            next_btn.click()
-            time.sleep(1)
-        except Exception:
-            logging.info("Кнопка 'Далее' не обнаружена — продолжаем")
-
-        # Step: "Наполнить из справочника"
-        try:
-            fill_from_catalog_checkbox = wait.until(EC.element_to_be_clickable(
-                (By.XPATH, '//*[@id="root"]/div/div/div[2]/div/span/div/div[2]/div/div/span/div/div[2]/div')
-            ))
-            driver.execute_script("arguments[0].click();", fill_from_catalog_checkbox)
-            time.sleep(1)
-        except Exception:
-            logging.info("Галочка 'Наполнить из справочника' не найдена/не нужна")
-
-        # Step: Fill "Заказ кодов №" — insert order_name from input
-        try:
-            order_number_input = wait.until(EC.element_to_be_clickable(
-                (By.XPATH, '//*[@id="root"]/div/div/div[2]/div/span/div/div[1]/div/div[1]/div[1]/div[1]/div/span/label/span[2]/input')
-            ))
-            order_number_input.clear()
-            # slow typed input to trigger React listeners
-            order_number_input.send_keys(str(order_name))
-            time.sleep(1)
-            
-        except Exception:
-            logging.warning("Поле 'Заказ кодов №' не найдено/не удалось заполнить")
-
-
-        # Step: Далее к заполнению реквизитов
-        try:
-            # Ждем и кликаем кнопку
-            next_req_button = WebDriverWait(driver, 15).until(
-                EC.element_to_be_clickable((By.XPATH, "//button[.//span[contains(text(), 'Далее к заполнению реквизитов')]]"))
-            )
-            
-            # Прокручиваем и кликаем через JS
-            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", next_req_button)
-            time.sleep(1)  # Увеличиваем задержку
-            
-            # Проверяем, что кнопка видима и кликабельна
-            if next_req_button.is_displayed() and next_req_button.is_enabled():
-                driver.execute_script("arguments[0].click();", next_req_button)
-                print("Кнопка нажата через JS")
-            else:
-                print("Кнопка не кликабельна, пробуем другой метод")
-                ActionChains(driver).move_to_element(next_req_button).click().perform()
-            
-            # Ждем загрузки следующей страницы - проверяем появление селектора cisTypeField
-            WebDriverWait(driver, 20).until(  # Увеличили время ожидания
-                EC.presence_of_element_located((By.CSS_SELECTOR, "[data-test-id='cisTypeField']"))
-            )
-            time.sleep(2)
-            print("Успешно перешли к заполнению реквизитов")
-        except Exception:
-            logging.info("Кнопка 'Далее к заполнению реквизитов' не найдена/пропускаем")
-
-        # Step: Ensure 'Единица товара' selected - try selecting if not
-        try:
-            # Находим лейбл выбранного значения
-            label = wait.until(EC.presence_of_element_located(
-                (By.CSS_SELECTOR, "[data-test-id='cisTypeField'] [data-tid='Select__label']")
-            ))
-            selected_text = label.text.strip()
-            if selected_text == "Единица товара":
-                print("✅ Уже выбрано 'Единица товара', пропускаем выбор")
-            else:
-                print("Выбираем 'Единица товара' явно")
-        
-                # Находим кнопку селекта
-                select_button = wait.until(EC.element_to_be_clickable(
-                    (By.CSS_SELECTOR, "[data-test-id='cisTypeField'] button[data-tid='Button__root']")
-                ))
-                
-                # Получаем ID меню
-                menu_id = select_button.get_attribute("aria-controls")
-                print(f"ID меню: {menu_id}")
-                
-                # Кликаем чтобы открыть дропдаун
-                driver.execute_script("arguments[0].click();", select_button)
-                
-                # Ждем появления меню
-                menu = wait.until(EC.visibility_of_element_located((By.ID, menu_id)))
-                
-                # Находим опцию по тексту
-                option_xpath = f"//*[@id='{menu_id}']//*[normalize-space(text())='Единица товара']"
-                option = wait.until(EC.element_to_be_clickable((By.XPATH, option_xpath)))
-                
-                # Кликаем на опцию
-                driver.execute_script("arguments[0].click();", option)
-                
-                # Ждем закрытия меню
-                wait.until(EC.invisibility_of_element_located((By.ID, menu_id)))
-                
-                # Подтверждаем выбор
-                selected_text = label.text.strip()
-                if selected_text == "Единица товара":
-                    print("✅ 'Единица товара' выбрано успешно")
-                else:
-                    raise ValueError(f"Не удалось выбрать, текущее значение: {selected_text}")
-        except Exception:
-            logging.info("Не удалось установить 'Единица товара' (возможно уже выбрано)")
-
-        # Step: Далее к загрузке товаров
-        try:
-            # Ждем кнопку
-            next_upload_btn = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, "//button[.//span[contains(text(), 'Далее к загрузке товаров')]]"))
-            )
-
-            # Прокручиваем к кнопке и кликаем через JS
-            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", next_upload_btn)
-            time.sleep(0.5)
-            next_upload_btn.click()
-            logging.info("Попытка клика через обычный click() выполнена")
-
-            # Проверка, что кнопка пропала (следствие перехода на следующую страницу)
-            try:
-                WebDriverWait(driver, 5).until(EC.staleness_of(next_upload_btn))
-                logging.info("✅ Кнопка 'Далее к загрузке товаров' успешно нажата")
-            except TimeoutException:
-                logging.warning("Кнопка не исчезла после клика, пробуем JS-клик")
-                driver.execute_script("arguments[0].click();", next_upload_btn)
-                time.sleep(1)
-                logging.info("Попытка клика через JS выполнена")
-
-        except Exception as e:
-            logging.error(f"Ошибка при клике на кнопку 'Далее к загрузке товаров': {e}")
-            driver.save_screenshot("error_next_upload.png")
-            logging.info("Сделан скриншот error_next_upload.png")
-
-        # Step: Ввод GTIN и количество (работаем строго с выпадающим элементом, ожидаем option, кликаем по тому, что содержит GTIN)
-        try:
-            # Вводим GTIN
-            gtin_input = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, '[data-test-id="productCatalogSearchInput"] input'))
-            )
-            gtin_input.clear()
-            gtin_input.send_keys(str(gtin))
-            logging.info(f"Введен GTIN: {gtin}")
-            time.sleep(2)  # время на появление списка
-
-            
-            gtin_input.send_keys(Keys.ARROW_DOWN)
-            time.sleep(0.3)
-            gtin_input.send_keys(Keys.ENTER)
-            logging.info("✅ GTIN выбран через клавиатуру (↓ + Enter)")
-            time.sleep(2)
-
-            # После выбора GTIN DOM может обновиться, поэтому нужно заново найти элементы
-            # Ввод количества кодов - находим поле заново после обновления DOM
-            qty_input = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, '[data-test-id="codesQuantityInput"] input'))
-            )
-            
-            # Прокручиваем к полю и кликаем на него
-            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", qty_input)
-            time.sleep(0.5)
-            
-            # Очищаем поле (несколько способов)
-            qty_input.click()
-            qty_input.send_keys(Keys.CONTROL + "a")  # Выделяем весь текст
-            qty_input.send_keys(Keys.DELETE)         # Удаляем выделенный текст
-            time.sleep(0.5)
-            
-            # Вводим значение медленно, посимвольно
-            for char in str(codes_count):
-                qty_input.send_keys(char)
-                time.sleep(0.1)
-            
-            # Убеждаемся, что значение установилось
-            time.sleep(0.5)
-            
-            # Имитируем потерю фокуса (TAB) для активации валидации
-            qty_input.send_keys(Keys.TAB)
-            time.sleep(1)
-            
-            # Проверяем, что значение установилось правильно
-            current_qty = qty_input.get_attribute("value")
-            if current_qty != str(codes_count):
-                logging.warning(f"⚠ Количество не совпадает: ожидалось {codes_count}, получено {current_qty}")
-                # Пробуем установить значение через JavaScript
-                driver.execute_script("""
-                    arguments[0].value = arguments[1];
-                    var event = new Event('input', { bubbles: true });
-                    arguments[0].dispatchEvent(event);
-                    var changeEvent = new Event('change', { bubbles: true });
-                    arguments[0].dispatchEvent(changeEvent);
-                """, qty_input, str(codes_count))
-                time.sleep(1)
-            else:
-                logging.info(f"✅ Количество кодов подтверждено: {codes_count}")
-
-        except Exception as e:
-            logging.error(f"Ошибка при вводе GTIN или количества: {e}")
-            driver.save_screenshot("error_gtin_qty.png")
-
-        # Step: Нажать "Отправить в ГИС МТ"
-        try:
-            send_button = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, '[data-test-id="codesOrderSendToGISMT"] button'))
-            )
-            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", send_button)
-            time.sleep(0.5)
-            send_button.click()
-
-            # Проверка, что кнопка действительно нажата
-            time.sleep(2)
-            if send_button.is_enabled():
-                logging.info("✅ Кнопка 'Отправить в ГИС МТ' нажата")
+            digest = _file_sha256(path)
+
+        logging.info(f"Кэш справочника устарел или отсутствует — читаем {path}")
+        index = cls.from_excel(path)
+        _write_nomenclature_cache(cache_path, index, st, digest)
+        return index
+
+    def frame(self) -> pd.DataFrame:
+        """Нормализованный справочник как DataFrame (строится лениво, в кэш не пишется)."""
+        if self._frame is None:
+            import pandas as pd
+
+            self._frame = pd.DataFrame({
+                "row": range(len(self.gtins)),
+                "simpl": self.simpl,
+                "size": self.sizes,
+                "units": self.units,
+                "color": self.colors,
+                "venchik": self.venchiks,
+            })
+        return self._frame
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_frame"] = None
+        return state
+
+    def resolve_bulk(self, requests: pd.DataFrame) -> Tuple[pd.DataFrame, List]:
+        """
+        Массовый поиск GTIN для таблицы запросов с колонками simpl_name, size,
+        units_per_pack и (необязательно) color, venchik.
+
+        Семантика как у lookup(): сначала точное совпадение (упрощенно и единицы
+        равны, размер — подстрока), затем частичное (упрощенно — подстрока,
+        без единиц); цвет/венчик фильтруют, только если заданы; из нескольких
+        совпадений берётся первое по порядку справочника.
+        Всё делается соединениями таблиц: одинаковые запросы ищутся один раз,
+        проверки «подстрока» сводятся к join с таблицей пар уникальных значений.
+
+        Возвращает (копия requests с колонками gtin и full_name — None, если
+        не найдено; список индексов ненайденных строк).
+        """
+        import pandas as pd
+
+        def col(name: str, lower: bool = True) -> pd.Series:
+            if name not in requests.columns:
+                return pd.Series([""] * len(requests), index=requests.index)
+            return requests[name].map(lambda v: _norm(v, lower))
+
+        req = pd.DataFrame({
+            "q_simpl": col("simpl_name"),
+            "q_size": col("size"),
+            "q_units": col("units_per_pack", lower=False),
+            "q_color": col("color"),
+            "q_venchik": col("venchik"),
+        }, index=requests.index)
+        keys = ["q_simpl", "q_size", "q_units", "q_color", "q_venchik"]
+        uniq = req.drop_duplicates().reset_index(drop=True)
+        uniq["qid"] = range(len(uniq))
+
+        nom = self.frame()
+        size_pairs = _contains_pairs(uniq["q_size"], nom["size"], "q_size", "size")
+
+        def first_match(cand: pd.DataFrame) -> pd.Series:
+            cand = cand.merge(size_pairs, on=["q_size", "size"])
+            cand = cand[((cand["q_color"] == "") | (cand["q_color"] == cand["color"]))
+                        & ((cand["q_venchik"] == "") | (cand["q_venchik"] == cand["venchik"]))]
+            return cand.groupby("qid")["row"].min()
+
+        # Точное совпадение
+        exact = first_match(uniq.merge(nom, left_on=["q_simpl", "q_units"], right_on=["simpl", "units"]))
+
+        # Частичный поиск — только для того, что не нашлось точно
+        rest = uniq[~uniq["qid"].isin(exact.index)]
+        simpl_pairs = _contains_pairs(rest["q_simpl"], nom["simpl"], "q_simpl", "simpl")
+        partial = first_match(rest.merge(simpl_pairs, on="q_simpl").merge(nom, on="simpl"))
+
+        uniq["row"] = uniq["qid"].map(pd.concat([exact, partial]))
+        matched = req.merge(uniq[keys + ["row"]], on=keys, how="left")["row"].to_numpy()
+
+        result = requests.copy()
+        gtins, names = [], []
+        for r in matched:
+            if r == r:  # не NaN
+                gtins.append(self.gtins[int(r)])
+                names.append(self.names[int(r)])
             else:
-                logging.warning("⚠️ Кнопка 'Отправить в ГИС МТ' возможно не сработала")
-
-        except Exception as e:
-            logging.error(f"Ошибка при нажатии кнопки 'Отправить в ГИС МТ': {e}")
-            browser_not_found.append(gtin)
-            logging.warning(f"❌ GTIN {gtin} пропущен из-за ошибки при отправке")
-            driver.quit()
-            return True, f"GTIN {gtin} НЕ НАЙДЕН В СПРАВОЧНИКЕ"
-
-        # Step: Подписать сертификатом
-        logging.info("Нажимаем ПОДПИСАТЬ СЕРТИФИКАТОМ")
-        try:
-            # Ждём кнопку "Подписать сертификатом"
-            sign_button = WebDriverWait(driver, 15).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, '[data-test-id="codesOrderSignCert"] button'))
-            )
-            logging.info("Кнопка 'Подписать сертификатом' найдена")
-
-            # Кликаем через JS (надёжнее для React)
-            driver.execute_script("arguments[0].click();", sign_button)
-            logging.info("✅ Нажата кнопка 'Подписать сертификатом'")
-            time.sleep(2)  # даём время на обработку
-
-        except Exception as e:
-            logging.error(f"Ошибка при нажатии кнопки 'Подписать сертификатом': {e}")
-            driver.save_screenshot("error_sign_cert.png")
+                gtins.append(None)
+                names.append(None)
+        # object: иначе pandas сделает колонку строковой и None станет NaN
+        result["gtin"] = pd.Series(gtins, index=result.index, dtype=object)
+        result["full_name"] = pd.Series(names, index=result.index, dtype=object)
+        unresolved = list(result.index[result["gtin"].isna()])
+        return result, unresolved
+
+    def _first(self, rows: List[int], size_l: str) -> Optional[int]:
+        for i in rows:
+            if size_l in self.sizes[i]:
+                return i
+        return None
+
+    def lookup(self, simpl_name: str, size: str, units_per_pack: str,
+               color: str = None, venchik: str = None) -> Tuple[Optional[str], Optional[str]]:
+        simpl = _norm(simpl_name)
+        size_l = _norm(size)
+        units_str = _norm(units_per_pack, lower=False)
+        color_l = _norm(color) or None
+        venchik_l = _norm(venchik) or None
+
+        # Точное совпадение: одна корзина по ключу, внутри — первый подходящий размер
+        row = self._first(self._exact.get((simpl, units_str, color_l, venchik_l), []), size_l)
+
+        # Частичный поиск по Упрощенно и размеру (без учёта единиц в упаковке)
+        if row is None:
+            candidates = []
+            for s in self._simpl_values:
+                if simpl in s:
+                    candidates.extend(self._partial.get((s, color_l, venchik_l), []))
+            row = self._first(sorted(candidates), size_l)
+
+        if row is None:
+            return None, None
+        return self.gtins[row], self.names[row]
+
+
+def _contains_pairs(queries: pd.Series, values: pd.Series, q_name: str, v_name: str) -> pd.DataFrame:
+    """Пары (запрос, значение справочника), где запрос — подстрока значения; по уникальным значениям."""
+    import pandas as pd
+
+    pairs = [(q, v) for q in pd.unique(queries) for v in pd.unique(values) if q in v]
+    return pd.DataFrame(pairs, columns=[q_name, v_name])
+
+
+# Меняется при изменении структуры NomenclatureIndex — старый кэш будет проигнорирован
+NOMENCLATURE_CACHE_VERSION = 2
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _read_nomenclature_cache(cache_path: str) -> Optional[Dict]:
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, "rb") as f:
+            cached = pickle.load(f)
+        if cached.get("version") != NOMENCLATURE_CACHE_VERSION:
+            return None
+        return cached
+    except Exception:
+        logging.warning(f"Кэш справочника {cache_path} повреждён — будет пересобран")
+        return None
+
+
+def _write_nomenclature_cache(cache_path: str, index: "NomenclatureIndex", st: os.stat_result, digest: str):
+    # пишем во временный файл и атомарно подменяем, чтобы не оставить битый кэш
+    tmp_path = cache_path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump({
+                "version": NOMENCLATURE_CACHE_VERSION,
+                "mtime_ns": st.st_mtime_ns,
+                "size": st.st_size,
+                "sha256": digest,
+                "index": index,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except Exception:
+        logging.exception(f"Не удалось сохранить кэш справочника {cache_path}")
+
+
+def lookup_gtin(nomenclature, simpl_name: str, size: str, units_per_pack: str,
+                color: str = None, venchik: str = None):
+    """
+    Поиск GTIN и полного наименования по заданным полям.
+    Для венчика используется точное совпадение.
+    nomenclature — NomenclatureIndex (предпочтительно, строится один раз)
+    или DataFrame справочника (индекс будет построен на лету).
+    """
+    try:
+        if not isinstance(nomenclature, NomenclatureIndex):
+            nomenclature = NomenclatureIndex.from_dataframe(nomenclature)
+        return nomenclature.lookup(simpl_name, size, units_per_pack, color, venchik)
+    except Exception:
+        logging.exception("Ошибка в lookup_gtin")
+    return None, None
 
-        # Step: Подписать и отправить в ГИС МТ
-            
-        try:
-            #Ждём кнопку
-            sign_send_button = WebDriverWait(driver, 15).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, '[data-test-id="signAndSendToGISMT"] button'))
-            )
-            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", sign_send_button)
-            time.sleep(0.5)
-
-            #Кликаем через JS для надежности
-            driver.execute_script("arguments[0].click();", sign_send_button)
-            logging.info("✅ Кнопка 'Подписать и отправить в ГИС МТ' нажата")
-
-            #Небольшая задержка на обработку
-            time.sleep(3)
-
-        except Exception as e:
-            logging.error(f"Ошибка при нажатии кнопки 'Подписать и отправить в ГИС МТ': {e}")
-            driver.save_screenshot("error_sign_and_send.png")
-        
-        # success
-        driver.quit()
-        return True, f"OK: {simpl_name} ({order_name})"
-
-    except Exception as exc:
-        logging.exception("Unhandled exception in worker")
-        try:
-            driver.quit()
-        except Exception:
-            pass
-        return False, str(exc)
 
 # -----------------------------
 # Main interactive collection + execution
 # -----------------------------
 def main():
+    from wizard import BrowserSession, perform_order_item, execute_parallel
+
+    setup_logging()
     # Load nomenclature
     if not os.path.exists(NOMENCLATURE_XLSX):
         ui_print(f"ERROR: файл {NOMENCLATURE_XLSX} не найден.")
         return
 
-    df = pd.read_excel(NOMENCLATURE_XLSX)
+    nomenclature = NomenclatureIndex.load(NOMENCLATURE_XLSX)
     ui_print("=== Kontur Automation — ввод позиций ===")
     collected: List[OrderItem] = []
 
@@ -534,7 +546,7 @@ def main():
             continue
 
         # Найдём GTIN заранее
-        gtin, full_name = lookup_gtin(df, simpl, size, units_per_pack)
+        gtin, full_name = lookup_gtin(nomenclature, simpl, size, units_per_pack)
         if not gtin:
             ui_print(f"GTIN не найден для ({simpl}, {size}, {units_per_pack}) — позиция не добавлена. Проверь nomenclature.xlsx.")
         else:
@@ -565,23 +577,38 @@ def main():
         ui_print("Нет накопленных позиций — выходим.")
         return
 
-    ui_print(f"\nБудет выполнено {len(collected)} задач(и) ПОСЛЕДОВАТЕЛЬНО.")
-    ui_print("Запуск...")
+    run_dir = timing.start_run()
+    if PARALLEL_WORKERS > 1 and len(collected) > 1:
+        ui_print(f"\nБудет выполнено {len(collected)} задач(и) ПАРАЛЛЕЛЬНО ({PARALLEL_WORKERS} браузеров).")
+        ui_print("Запуск...")
+        results = execute_parallel(
+            collected, PARALLEL_WORKERS,
+            on_result=lambda ok, msg, it: ui_print(f"[{'OK' if ok else 'ERR'}] {it.simpl_name} — {msg}"),
+        )
+    else:
+        ui_print(f"\nБудет выполнено {len(collected)} задач(и) ПОСЛЕДОВАТЕЛЬНО.")
+        ui_print("Запуск...")
 
-    results = []
-    for it in collected:
+        results = []
+        session = BrowserSession()
         try:
-            ok, msg = perform_order_item(asdict(it))
-            results.append((ok, msg, it))
-            ui_print(f"[{'OK' if ok else 'ERR'}] {it.simpl_name} — {msg}")
-        except Exception as e:
-            logging.exception("Ошибка при выполнении задачи")
-            results.append((False, str(e), it))
-            ui_print(f"[ERR] {it.simpl_name} — exception: {e}")
+            for it in collected:
+                try:
+                    ok, msg = perform_order_item(asdict(it), session)
+                    results.append((ok, msg, it))
+                    ui_print(f"[{'OK' if ok else 'ERR'}] {it.simpl_name} — {msg}")
+                except Exception as e:
+                    logging.exception("Ошибка при выполнении задачи")
+                    results.append((False, str(e), it))
+                    ui_print(f"[ERR] {it.simpl_name} — exception: {e}")
+        finally:
+            session.close()
 
     ui_print("\n=== Выполнение завершено ===")
     success = sum(1 for r in results if r[0])
     ui_print(f"Успешно: {success}, Ошибок: {len(results)-success}. Подробности в {LOG_FILE}.")
+    ui_print("\nВремя по шагам, сек:")
+    ui_print(timing.format_summary(timing.finish_run(run_dir)))
 
     if not_found_list or browser_not_found:
         print("\n=== Итоговый отчёт ===")
@@ -600,4 +627,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,230 @@
+# batch_import.py
+"""
+Пакетная загрузка позиций из файла вместо интерактивного ввода.
+
+Поддерживаются CSV (разделитель ; или ,), XLSX (первый лист) и JSONL.
+Строка — одна позиция: заявка, количество кодов и либо GTIN, либо
+атрибуты для поиска в справочнике (упрощенно, размер, единиц в упаковке,
+цвет, венчик). Заголовки можно писать по-английски или по-русски:
+
+    order_name;gtin;codes_count
+    250911 ЭМ (Хрусталев, Петров) 50;04650118040564;4
+
+    Заявка;Упрощенно;Размер;Количество единиц в упаковке;Цвет;Количество кодов
+    250911 ЭМ 51;латекс диаг;M;100;синий;8
+
+Файл читается потоково (XLSX — openpyxl read_only), GTIN'ы для строк без
+GTIN ищутся после чтения одним массовым запросом (NomenclatureIndex.resolve_bulk).
+Необязательная колонка "приоритет" (целое, больше — раньше, см. dispatcher).
+"""
+import os
+import csv
+import json
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from backend import OrderItem, NomenclatureIndex
+
+# GTIN в заказе — 14 цифр (GTIN-8/12/13 дополняются нулями слева, как в справочнике портала)
+GTIN_LENGTH = 14
+
+# заголовок в файле (без регистра/пробелов по краям) -> поле строки
+COLUMN_ALIASES = {
+    "order_name": "order_name", "заявка": "order_name", "заказ кодов №": "order_name",
+    "gtin": "gtin",
+    "codes_count": "codes_count", "количество кодов": "codes_count", "кодов": "codes_count",
+    "simpl_name": "simpl_name", "упрощенно": "simpl_name",
+    "size": "size", "размер": "size",
+    "units_per_pack": "units_per_pack", "количество единиц в упаковке": "units_per_pack",
+    "количество единиц употребления в потребительской упаковке": "units_per_pack",
+    "color": "color", "цвет": "color",
+    "venchik": "venchik", "венчик": "venchik",
+    "priority": "priority", "приоритет": "priority",
+}
+
+
+@dataclass
+class BatchError:
+    line: int       # номер строки в файле (для CSV/XLSX — с учётом заголовка)
+    message: str
+
+
+def _normalize_row(raw: Dict) -> Dict[str, str]:
+    row = {}
+    for key, value in raw.items():
+        if key is None:
+            continue
+        field = COLUMN_ALIASES.get(str(key).strip().lower())
+        if field is None or value is None:
+            continue
+        # числа из XLSX (GTIN, количество) приходят как float — без хвоста ".0"
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        value = str(value).strip()
+        # числовая ячейка XLSX (и CSV, сохранённый из Excel) теряет ведущие нули GTIN
+        if field == "gtin" and value.isdigit() and len(value) < GTIN_LENGTH:
+            value = value.zfill(GTIN_LENGTH)
+        row[field] = value
+    return row
+
+
+def _iter_csv(path: str) -> Iterator[Tuple[int, Dict]]:
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=";,\t")
+        except csv.Error:
+            dialect = csv.excel
+        for line, raw in enumerate(csv.DictReader(f, dialect=dialect), start=2):
+            yield line, raw
+
+
+def _iter_xlsx(path: str) -> Iterator[Tuple[int, Dict]]:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        for line, values in enumerate(rows, start=2):
+            if values is None or all(v is None or str(v).strip() == "" for v in values):
+                continue
+            yield line, dict(zip(header, values))
+    finally:
+        wb.close()
+
+
+def _iter_jsonl(path: str, errors: List[BatchError]) -> Iterator[Tuple[int, Dict]]:
+    with open(path, encoding="utf-8") as f:
+        for line, text in enumerate(f, start=1):
+            text = text.strip()
+            if not text:
+                continue
+            try:
+                raw = json.loads(text)
+            except ValueError as e:
+                errors.append(BatchError(line, f"неверный JSON: {e}"))
+                continue
+            if not isinstance(raw, dict):
+                errors.append(BatchError(line, f"строка должна быть JSON-объектом, а не {type(raw).__name__}"))
+                continue
+            yield line, raw
+
+
+def iter_batch_rows(path: str, errors: Optional[List[BatchError]] = None) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """
+    Потоково отдаёт (номер строки, нормализованная строка) из CSV/XLSX/JSONL.
+    Нечитаемые строки JSONL пропускаются и попадают в errors.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        source = _iter_csv(path)
+    elif ext in (".xlsx", ".xlsm"):
+        source = _iter_xlsx(path)
+    elif ext in (".jsonl", ".ndjson"):
+        source = _iter_jsonl(path, errors if errors is not None else [])
+    else:
+        raise ValueError(f"Неподдерживаемый формат пакетного файла: {ext} (нужен .csv, .xlsx или .jsonl)")
+    for line, raw in source:
+        row = _normalize_row(raw)
+        if any(row.values()):
+            yield line, row
+
+
+def _parse_int(value: str) -> int:
+    """Целое из ячейки: "4" и "4.0" — да, "2.7", "inf", "nan" — ValueError."""
+    number = float(value)
+    if not number.is_integer():
+        raise ValueError(f"не целое число: {value!r}")
+    return int(number)
+
+
+def load_batch(path: str, nomenclature: NomenclatureIndex) -> Tuple[List[OrderItem], List[BatchError]]:
+    """
+    Читает пакетный файл и возвращает (позиции с GTIN, ошибки по строкам).
+    Строки с GTIN берутся как есть (как режим "Поиск по GTIN"), для остальных
+    GTIN ищется в справочнике; ненайденные попадают в ошибки.
+    """
+    items: List[OrderItem] = []
+    errors: List[BatchError] = []
+    pending: List[Tuple[int, OrderItem, Dict[str, str]]] = []
+
+    for line, row in iter_batch_rows(path, errors):
+        order_name = row.get("order_name", "")
+        if not order_name:
+            errors.append(BatchError(line, "не указана заявка (order_name)"))
+            continue
+        try:
+            codes_count = _parse_int(row.get("codes_count", ""))
+        except (ValueError, OverflowError):
+            errors.append(BatchError(line, f"неверное количество кодов: {row.get('codes_count')!r}"))
+            continue
+        if codes_count <= 0:
+            errors.append(BatchError(line, f"количество кодов должно быть > 0: {codes_count}"))
+            continue
+        try:
+            priority = _parse_int(row.get("priority") or "0")
+        except (ValueError, OverflowError):
+            errors.append(BatchError(line, f"неверный приоритет: {row.get('priority')!r}"))
+            continue
+
+        if row.get("gtin"):
+            it = OrderItem(
+                order_name=order_name,
+                simpl_name="по GTIN",
+                size="не указано",
+                units_per_pack="не указано",
+                codes_count=codes_count,
+                gtin=row["gtin"],
+                full_name="",
+                priority=priority,
+            )
+        elif row.get("simpl_name") and row.get("size") and row.get("units_per_pack"):
+            it = OrderItem(
+                order_name=order_name,
+                simpl_name=row["simpl_name"].lower(),
+                size=row["size"],
+                units_per_pack=row["units_per_pack"],
+                codes_count=codes_count,
+                priority=priority,
+            )
+            pending.append((line, it, row))
+        else:
+            errors.append(BatchError(line, "нужен GTIN или упрощенно + размер + единиц в упаковке"))
+            continue
+        setattr(it, "_uid", uuid.uuid4().hex)
+        items.append(it)
+
+    # GTIN для строк с атрибутами — один массовый поиск по справочнику
+    unresolved = set()
+    if pending:
+        import pandas as pd
+
+        requests = pd.DataFrame([
+            {
+                "simpl_name": it.simpl_name,
+                "size": it.size,
+                "units_per_pack": it.units_per_pack,
+                "color": row.get("color"),
+                "venchik": row.get("venchik"),
+            }
+            for _, it, row in pending
+        ])
+        resolved, missing = nomenclature.resolve_bulk(requests)
+        missing = set(missing)
+        for pos, (line, it, row) in enumerate(pending):
+            if pos in missing:
+                unresolved.add(id(it))
+                errors.append(BatchError(line, f"GTIN не найден для ({it.simpl_name}, {it.size}, {it.units_per_pack}, "
+                                               f"{row.get('color')}, {row.get('venchik')})"))
+            else:
+                it.gtin = resolved.at[pos, "gtin"]
+                it.full_name = resolved.at[pos, "full_name"] or ""
+
+    items = [it for it in items if id(it) not in unresolved]
+    errors.sort(key=lambda e: e.line)
+    return items, errors
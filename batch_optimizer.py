@@ -0,0 +1,136 @@
+# batch_optimizer.py
+"""
+Оптимизация пачки перед выполнением: позиции объединяются в меньшее число
+заказов кодов — мастер в браузере (навигация + подпись сертификатом)
+проходится один раз на группу, а не на каждую позицию.
+
+Политики объединения:
+    "gtin_order"  — одинаковые GTIN и заявка (название заказа не меняется);
+    "gtin"        — одинаковые GTIN в любых заявках; название заказа
+                    собирается из всех заявок группы ("... 52, 53");
+    "order_lines" — все позиции заявки в один многострочный заказ
+                    (строка на GTIN, см. OrderItem.lines);
+    "batch_lines" — вся пачка в многострочные заказы.
+Многострочные заказы режутся по ORDER_MAX_LINES строк.
+
+Для отчёта сохраняется соответствие: uid объединённой позиции -> исходные
+позиции (со своими _uid).
+"""
+import os
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from backend import OrderItem, ORDER_MAX_LINES
+
+COALESCE_POLICIES = ("gtin", "gtin_order", "order_lines", "batch_lines")
+# политики, при которых в заказе может быть несколько строк товаров
+MULTI_LINE_POLICIES = ("order_lines", "batch_lines")
+
+
+def merge_order_names(names: List[str]) -> str:
+    """
+    Общее название для нескольких заявок: общий префикс (по границе слова)
+    + различающиеся хвосты через запятую.
+    "250911 ЭМ (Хрусталев, Петров) 52" + "... 53" -> "250911 ЭМ (Хрусталев, Петров) 52, 53"
+    """
+    names = list(dict.fromkeys(names))
+    if len(names) == 1:
+        return names[0]
+    prefix = os.path.commonprefix(names)
+    prefix = prefix[:prefix.rfind(" ") + 1]
+    if not prefix:
+        return ", ".join(names)
+    return prefix + ", ".join(n[len(prefix):] for n in names)
+
+
+def _group_key(it: OrderItem, policy: str) -> Tuple:
+    if not it.gtin:
+        return ("", id(it))  # без GTIN не объединяем
+    if policy == "gtin":
+        return (it.gtin,)
+    if policy == "gtin_order":
+        return (it.gtin, it.order_name)
+    if policy == "order_lines":
+        return (it.order_name,)
+    return ()
+
+
+def _split_lines(members: List[OrderItem], max_lines: int) -> List[List[OrderItem]]:
+    """Режет группу на заказы не больше max_lines разных GTIN (позиции одного GTIN — в один заказ)."""
+    chunks: List[Dict[str, List[OrderItem]]] = []
+    for it in members:
+        chunk = next((c for c in chunks if it.gtin in c), None)
+        if chunk is None:
+            if not chunks or len(chunks[-1]) >= max_lines:
+                chunks.append({})
+            chunk = chunks[-1]
+        chunk.setdefault(it.gtin, []).append(it)
+    return [[it for same_gtin in c.values() for it in same_gtin] for c in chunks]
+
+
+def _merge(members: List[OrderItem]) -> OrderItem:
+    """Один заказ из группы позиций: строка на GTIN с суммарным количеством."""
+    totals: Dict[str, int] = {}
+    for m in members:
+        totals[m.gtin] = totals.get(m.gtin, 0) + m.codes_count
+    first = members[0]
+    (gtin, count), *rest = totals.items()
+    single = len(totals) == 1
+    return OrderItem(
+        order_name=merge_order_names([m.order_name for m in members]),
+        simpl_name=first.simpl_name if single else f"несколько товаров ({len(totals)})",
+        size=first.size if single else "разные",
+        units_per_pack=first.units_per_pack if single else "разные",
+        codes_count=count,
+        gtin=gtin,
+        full_name=first.full_name if single else "",
+        lines=[{"gtin": g, "codes_count": c} for g, c in rest],
+        priority=max(m.priority for m in members),
+    )
+
+
+def coalesce_items(items: List[OrderItem], policy: str = "gtin",
+                   max_lines: int = ORDER_MAX_LINES) -> Tuple[List[OrderItem], Dict[str, List[OrderItem]]]:
+    """
+    Объединяет позиции по политике policy. Возвращает (позиции к выполнению,
+    uid позиции к выполнению -> исходные позиции). Порядок — по первой позиции группы;
+    одиночные позиции остаются как есть (со своим _uid).
+    """
+    if policy not in COALESCE_POLICIES:
+        raise ValueError(f"Неизвестная политика объединения: {policy} (доступны: {', '.join(COALESCE_POLICIES)})")
+
+    groups: Dict[Tuple, List[OrderItem]] = {}
+    for it in items:
+        groups.setdefault(_group_key(it, policy), []).append(it)
+
+    split = policy in MULTI_LINE_POLICIES
+    merged_items: List[OrderItem] = []
+    mapping: Dict[str, List[OrderItem]] = {}
+    for members in (chunk for group in groups.values()
+                    for chunk in (_split_lines(group, max_lines) if split and group[0].gtin else [group])):
+        first = members[0]
+        if len(members) == 1:
+            uid = getattr(first, "_uid", None) or uuid.uuid4().hex
+            setattr(first, "_uid", uid)
+            merged_items.append(first)
+            mapping[uid] = members
+            continue
+
+        merged = _merge(members)
+        uid = uuid.uuid4().hex
+        setattr(merged, "_uid", uid)
+        merged_items.append(merged)
+        mapping[uid] = members
+    return merged_items, mapping
+
+
+def expand_result(ok: bool, msg: str, executed: OrderItem,
+                  mapping: Optional[Dict[str, List[OrderItem]]]) -> List[Tuple[bool, str, OrderItem]]:
+    """Результат выполненной позиции -> результаты по исходным позициям группы."""
+    members = (mapping or {}).get(getattr(executed, "_uid", None))
+    if not members or members == [executed]:
+        return [(ok, msg, executed)]
+    total = executed.codes_count + sum(line["codes_count"] for line in executed.lines)
+    note = (f" [в составе объединённого заказа uid={getattr(executed, '_uid', None)}: "
+            f"{len(executed.lines) + 1} строк(и), {total} кодов]")
+    return [(ok, msg + note, m) for m in members]
@@ -0,0 +1,275 @@
+# bench.py
+"""
+Сквозной замер мастера заказа на локальной копии портала (mock_kontur.py):
+N заказов через perform_order_item в headless-браузере, без mk.kontur.ru
+и сертификата.
+
+    python bench.py --orders 20
+    python bench.py --orders 20 --lines 5 --scale 0.5 --browser "C:\\...\\chrome.exe" --driver chromedriver.exe
+    python bench.py --orders 20 --engine api     # заказ запросами к API (браузер — cookies и подпись)
+
+Печатает заказов в минуту и p50/p95 по шагам. Трасса и итог (bench.json) —
+в runs/bench-<время>/; сравнить два замера: python timing.py runs/bench-A runs/bench-B
+
+    python bench.py --startup
+
+— время импорта main.py (до первого меню) против STARTUP_IMPORT_BUDGET;
+код возврата 1, если бюджет превышен или при старте подгрузились pandas/Selenium.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import statistics
+import subprocess
+import logging
+import argparse
+import tempfile
+from dataclasses import asdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import timing
+import locators
+import timeouts
+import api_engine
+import mock_kontur
+import backend
+import wizard
+from backend import OrderItem, order_lines
+from wizard import BrowserSession
+
+
+# Бюджет на импорт main.py в свежем процессе, сек (медиана запусков). pandas и Selenium
+# в него не входят — они грузятся в фоне после появления первого меню.
+STARTUP_IMPORT_BUDGET = 0.15
+STARTUP_HEAVY_MODULES = ("pandas", "numpy", "selenium", "openpyxl")
+
+
+def _parse_importtime(stderr: str) -> List[Tuple[str, int, float]]:
+    """Строки python -X importtime -> [(модуль, вложенность, суммарное время, сек)]."""
+    out = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        out.append((name.strip(), depth, int(cumulative) / 1e6))
+    return out
+
+
+def measure_startup(runs: int = 5) -> Dict:
+    """Время импорта main.py в свежем интерпретаторе (python -X importtime), медиана по runs запускам."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    totals, modules = [], []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                              cwd=here, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"import main завершился с ошибкой:\n{proc.stderr[-2000:]}")
+        parsed = _parse_importtime(proc.stderr)
+        # importtime печатает вложенные импорты перед модулем: дерево main — от конца
+        # предыдущего модуля верхнего уровня до строки main
+        end = next(i for i, (name, depth, _) in enumerate(parsed) if name == "main" and depth == 0)
+        begin = max((i + 1 for i in range(end) if parsed[i][1] == 0), default=0)
+        modules = parsed[begin:end + 1]
+        totals.append(modules[-1][2])
+    heavy = sorted({name for name, _, _ in modules if name.split(".")[0] in STARTUP_HEAVY_MODULES})
+    top = sorted(((name, t) for name, depth, t in modules if depth == 1), key=lambda x: -x[1])[:8]
+    import_time = statistics.median(totals)
+    return {
+        "import_time": round(import_time, 4),
+        "budget": STARTUP_IMPORT_BUDGET,
+        "ok": import_time <= STARTUP_IMPORT_BUDGET and not heavy,
+        "heavy_modules": heavy,
+        "top": [(name, round(t, 4)) for name, t in top],
+    }
+
+
+def format_startup(result: Dict) -> str:
+    lines = [f"Импорт main.py: {result['import_time'] * 1000:.0f} мс "
+             f"(бюджет {result['budget'] * 1000:.0f} мс) — {'OK' if result['ok'] else 'ПРЕВЫШЕН'}"]
+    if result["heavy_modules"]:
+        lines.append(f"При старте загружены тяжёлые модули: {', '.join(result['heavy_modules'][:10])}")
+    lines += ["", "Самые долгие импорты:"] + [f"  {name:<24} {t * 1000:7.1f} мс" for name, t in result["top"]]
+    return "\n".join(lines)
+
+
+def make_items(orders: int, lines: int = 1) -> List[OrderItem]:
+    """Синтетические заказы: уникальные GTIN, lines строк в заказе."""
+    items = []
+    for n in range(orders):
+        gtins = [f"0465{n:05d}{k:05d}" for k in range(lines)]
+        it = OrderItem(
+            order_name=f"bench {n + 1}",
+            simpl_name="bench",
+            size="M",
+            units_per_pack="100",
+            codes_count=n % 9 + 1,
+            gtin=gtins[0],
+            lines=[{"gtin": g, "codes_count": k + 1} for k, g in enumerate(gtins[1:], start=1)],
+        )
+        setattr(it, "_uid", uuid.uuid4().hex)
+        items.append(it)
+    return items
+
+
+def verify(received: List[Dict], items: List[OrderItem]) -> List[str]:
+    """Сверяет подписанные на mock-сервере заказы с отправленными. Возвращает расхождения."""
+    problems = []
+    by_name = {}
+    for order in received:
+        by_name.setdefault(order.get("order_name"), []).append(order)
+    for it in items:
+        got = by_name.get(it.order_name, [])
+        expected = [{"gtin": g, "codes_count": c} for g, c in order_lines(asdict(it))]
+        if len(got) != 1:
+            problems.append(f"'{it.order_name}': подписано заказов {len(got)}, ожидался 1")
+        elif got[0].get("lines") != expected:
+            problems.append(f"'{it.order_name}': строки {got[0].get('lines')}, ожидались {expected}")
+    return problems
+
+
+def _browser_metrics(session: BrowserSession) -> Dict[str, float]:
+    """Память JS и размер DOM страницы браузера после прогона (CDP Performance.getMetrics)."""
+    if session.driver is None:
+        return {}
+    try:
+        session.driver.execute_cdp_cmd("Performance.enable", {})
+        metrics = session.driver.execute_cdp_cmd("Performance.getMetrics", {})["metrics"]
+    except Exception:
+        logging.warning("CDP Performance.getMetrics недоступен", exc_info=True)
+        return {}
+    wanted = ("JSHeapUsedSize", "JSHeapTotalSize", "Nodes", "Documents", "Resources")
+    return {m["name"]: m["value"] for m in metrics if m["name"] in wanted}
+
+
+def run_bench(orders: int, lines: int = 1, scale: float = 1.0, profile: bool = False,
+              session_orders: int = backend.SESSION_MAX_ORDERS, headless: bool = True,
+              browser: Optional[str] = None, driver: Optional[str] = None,
+              fill: str = backend.PRODUCTS_FILL_MODE, launch: str = backend.LAUNCH_PROFILE,
+              adaptive: bool = backend.ADAPTIVE_TIMEOUTS, engine: str = backend.ORDER_ENGINE) -> Dict:
+    server = mock_kontur.start_server(latencies=mock_kontur.scaled_latencies(scale), profile=profile)
+    # настройки backend.py wizard копирует при импорте — подменяем там, где их читают
+    wizard.ORDER_ENTRY_URL = f"{server.base_url}/organizations/{backend.ORGANIZATION_ID}/warehouses"
+    wizard.HEADLESS = headless
+    wizard.YANDEX_BROWSER_PATH = browser or ""
+    wizard.YANDEX_DRIVER_PATH = driver or ""
+    wizard.PRODUCTS_FILL_MODE = fill
+    wizard.LAUNCH_PROFILE = launch
+    wizard.ORDER_ENGINE = engine
+    api_engine.client = api_engine.ApiClient(f"{server.base_url}/api/v1/organizations/{backend.ORGANIZATION_ID}")
+    wizard.API_ORDER_URL = f"{server.base_url}/organizations/{backend.ORGANIZATION_ID}/codes-orders/{{order_id}}"
+    # замеры локальной копии портала не должны влиять на таймауты боевых прогонов
+    timeouts.controller = timeouts.AdaptiveTimeouts(os.path.join(timing.RUNS_DIR, "bench_latency.sqlite3"),
+                                                    enabled=adaptive)
+
+    items = make_items(orders, lines)
+    run_dir = timing.start_run(datetime.now().strftime("bench-%Y%m%d-%H%M%S"))
+    profile_dir = tempfile.mkdtemp(prefix="kontur_bench_profile_")
+    session = BrowserSession(max_orders=session_orders, user_data_dir=profile_dir, profile_directory="Default")
+    ok_count = 0
+    browser_metrics: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    try:
+        for it in items:
+            payload = asdict(it)
+            payload["_uid"] = getattr(it, "_uid", None)
+            ok, msg = wizard.perform_order_item(payload, session)
+            ok_count += bool(ok)
+            if not ok:
+                backend.ui_print(f"[ERR] {it.order_name} — {msg}")
+        browser_metrics = _browser_metrics(session)
+    finally:
+        wall = time.perf_counter() - t0
+        session.close()
+        server.shutdown()
+        shutil.rmtree(profile_dir, ignore_errors=True)
+
+    problems = verify(server.orders, items)
+    result = {
+        "orders": orders,
+        "lines": lines,
+        "fill": fill,
+        "launch": launch,
+        "adaptive": adaptive,
+        "engine": engine,
+        "ok": ok_count,
+        "verified": orders - len(problems),
+        "problems": problems,
+        "wall": round(wall, 3),
+        "orders_per_min": round(orders / wall * 60, 2) if wall > 0 else 0.0,
+        "latencies": server.latencies,
+        "steps": timing.finish_run(run_dir),
+        "locators": locators.registry.stats(),
+        "timeouts": timeouts.controller.stats(),
+        "requests": dict(server.stats),
+        "browser": browser_metrics,
+        "run_dir": run_dir,
+    }
+    try:
+        with open(os.path.join(run_dir, "bench.json"), "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    except Exception:
+        logging.exception("Не удалось сохранить bench.json")
+    return result
+
+
+def format_result(result: Dict) -> str:
+    lines = [
+        f"Заказов: {result['orders']} (строк в заказе: {result['lines']}, заполнение: {result['fill']}, "
+        f"запуск: {result['launch']}, таймауты: {'адаптивные' if result['adaptive'] else 'из кода'}, "
+        f"заказ: {result['engine']}), "
+        f"успешно: {result['ok']}, "
+        f"подтверждено сервером: {result['verified']}",
+        f"Время: {result['wall']:.1f} с, {result['orders_per_min']:.2f} заказов/мин",
+        f"Запросов к порталу: {result['requests']}",
+        "",
+        timing.format_summary(result["steps"]),
+    ]
+    if result["problems"]:
+        lines += ["", "Расхождения:"] + [f" - {p}" for p in result["problems"]]
+    if result["browser"]:
+        heap = result["browser"].get("JSHeapUsedSize", 0) / 2 ** 20
+        lines.append(f"Браузер: JS heap {heap:.1f} МБ, узлов DOM {int(result['browser'].get('Nodes', 0))}")
+    lines += ["", f"Трасса: {result['run_dir']}"]
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Замер мастера заказа на локальной копии портала")
+    parser.add_argument("--orders", type=int, default=10, help="сколько заказов провести")
+    parser.add_argument("--lines", type=int, default=1, help="строк товаров в заказе")
+    parser.add_argument("--scale", type=float, default=1.0, help="множитель задержек портала (0 — без задержек)")
+    parser.add_argument("--profile", action="store_true", help="начинать заказ с экрана выбора организации")
+    parser.add_argument("--session-orders", type=int, default=backend.SESSION_MAX_ORDERS,
+                        help="заказов на один запуск браузера")
+    parser.add_argument("--fill", choices=("keys", "js"), default=backend.PRODUCTS_FILL_MODE,
+                        help="как заполнять шаг 'Товары' (см. PRODUCTS_FILL_MODE)")
+    parser.add_argument("--launch", choices=("default", "performance"), default=backend.LAUNCH_PROFILE,
+                        help="профиль запуска браузера (см. LAUNCH_PROFILE)")
+    parser.add_argument("--fixed-timeouts", action="store_true",
+                        help="таймауты из кода, без подстройки (см. ADAPTIVE_TIMEOUTS)")
+    parser.add_argument("--engine", choices=("ui", "api"), default=backend.ORDER_ENGINE,
+                        help="мастер в браузере или запросы к API с подписью в браузере (см. ORDER_ENGINE)")
+    parser.add_argument("--headful", action="store_true", help="показывать окно браузера")
+    parser.add_argument("--browser", help="путь к браузеру (по умолчанию — Chrome)")
+    parser.add_argument("--driver", help="путь к chromedriver (по умолчанию — Selenium Manager)")
+    parser.add_argument("--startup", action="store_true",
+                        help="только замер времени импорта main.py (см. STARTUP_IMPORT_BUDGET)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.startup:
+        startup = measure_startup()
+        print(format_startup(startup))
+        sys.exit(0 if startup["ok"] else 1)
+    backend.setup_logging()
+    res = run_bench(args.orders, args.lines, args.scale, args.profile, args.session_orders,
+                    not args.headful, args.browser, args.driver, args.fill, args.launch,
+                    not args.fixed_timeouts, args.engine)
+    print(format_result(res))
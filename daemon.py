@@ -0,0 +1,362 @@
+# daemon.py
+"""
+Резидентный режим: процесс держит загруженный справочник и прогретый браузер
+и принимает пачки позиций по HTTP на localhost. Повторные небольшие пачки в
+течение дня начинаются сразу — без импорта pandas/Selenium, чтения xlsx и
+запуска браузера.
+
+    python daemon.py serve                  # запустить (окно держать открытым)
+    python daemon.py submit orders.csv      # отправить пачку и дождаться отчёта
+    python daemon.py status
+    python daemon.py stop
+
+Формат пачки — как у python main.py --batch (CSV/XLSX/JSONL, см. batch_import).
+Клиент — только стандартная библиотека: файл читает сам демон.
+
+API (JSON): GET /status; POST /jobs {"path", "coalesce"}; GET /jobs/<id>; POST /shutdown.
+Каждый запрос — с заголовком X-Daemon-Token (токен из DAEMON_TOKEN_FILE, его
+создаёт serve), POST — с Content-Type: application/json. Так страница, открытая
+в браузере оператора, не сможет заказать коды или остановить демон (CSRF).
+"""
+import os
+import sys
+import json
+import time
+import hmac
+import uuid
+import queue
+import secrets
+import logging
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional
+
+DAEMON_HOST = "127.0.0.1"
+DAEMON_PORT = 8760
+# Клиент опрашивает состояние пачки с таким интервалом, сек
+POLL_INTERVAL = 1.0
+# Токен доступа к демону (создаётся при первом запуске serve, читается клиентом)
+DAEMON_TOKEN_FILE = os.path.join("data", "daemon.token")
+TOKEN_HEADER = "X-Daemon-Token"
+
+
+def load_token(create: bool = False) -> Optional[str]:
+    """Токен установки из DAEMON_TOKEN_FILE; create — создать, если файла нет."""
+    try:
+        with open(DAEMON_TOKEN_FILE, encoding="ascii") as f:
+            token = f.read().strip()
+        if token:
+            return token
+    except FileNotFoundError:
+        pass
+    if not create:
+        return None
+    os.makedirs(os.path.dirname(DAEMON_TOKEN_FILE) or ".", exist_ok=True)
+    token = secrets.token_hex(32)
+    fd = os.open(DAEMON_TOKEN_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="ascii") as f:
+        f.write(token)
+    return token
+
+
+# -----------------------------
+# Сервер
+# -----------------------------
+class OrderDaemon:
+    """Очередь пачек + один поток, который выполняет их на прогретом браузере."""
+
+    def __init__(self, nomenclature_path: str):
+        from backend import NomenclatureIndex, PARALLEL_WORKERS, PREWARM_MAX_AGE
+        from wizard import BrowserPool
+
+        self.nomenclature_path = nomenclature_path
+        self._index_stat = None
+        self.nomenclature = None
+        self._load_nomenclature(NomenclatureIndex)
+        # параллельный режим запускает свои браузеры на каждый прогон — держать нечего
+        self.pool = BrowserPool(size=1) if PARALLEL_WORKERS <= 1 else None
+        self.refresh_interval = PREWARM_MAX_AGE / 2
+        self.jobs: Dict[str, Dict] = {}
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run_jobs, name="order-daemon", daemon=True)
+
+    def _load_nomenclature(self, index_cls=None):
+        """(Пере)загружает справочник, если xlsx изменился с прошлой загрузки."""
+        st = os.stat(self.nomenclature_path)
+        stat_key = (st.st_mtime_ns, st.st_size)
+        if stat_key != self._index_stat:
+            if index_cls is None:
+                from backend import NomenclatureIndex as index_cls
+            self.nomenclature = index_cls.load(self.nomenclature_path)
+            self._index_stat = stat_key
+            logging.info(f"Справочник загружен: {self.nomenclature_path}")
+
+    def start(self):
+        if self.pool is not None:
+            self.pool.prewarm()
+        self._thread.start()
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join(timeout=600)
+        if self.pool is not None:
+            self.pool.close()
+
+    def submit(self, path: str, coalesce: Optional[str] = None) -> Dict:
+        from batch_import import load_batch
+
+        with self._lock:
+            self._load_nomenclature()
+            nomenclature = self.nomenclature
+        # разбор файла — без блокировки: /status и /jobs/<id> отвечают и на время большой пачки
+        items, errors = load_batch(path, nomenclature)
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "path": path,
+            "coalesce": coalesce,
+            "state": "queued" if items else "failed",
+            "submitted": time.time(),
+            "items": items,
+            "errors": [{"line": e.line, "message": e.message} for e in errors],
+            "results": [],
+            "run_dir": None,
+        }
+        with self._lock:
+            self.jobs[job["id"]] = job
+        if items:
+            self._queue.put(job["id"])
+        return self.job_view(job["id"])
+
+    def job_view(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            view = {k: v for k, v in job.items() if k != "items"}
+            view["count"] = len(job["items"])
+            return view
+
+    def status(self) -> Dict:
+        with self._lock:
+            states = [j["state"] for j in self.jobs.values()]
+        return {
+            "pid": os.getpid(),
+            "queued": states.count("queued"),
+            "running": states.count("running"),
+            "done": states.count("done"),
+            "browser": self.pool is not None and self.pool.browser_running,
+            "nomenclature": self.nomenclature_path,
+        }
+
+    def _run_jobs(self):
+        import timing
+        from main import execute_collected
+        from backend import browser_not_found
+
+        while True:
+            try:
+                job_id = self._queue.get(timeout=self.refresh_interval)
+            except queue.Empty:
+                # простой: держим страницу заказа свежей, чтобы следующая пачка началась сразу
+                if self.pool is not None:
+                    self.pool.prewarm()
+                continue
+            if job_id is None:
+                return
+            with self._lock:
+                job = self.jobs[job_id]
+                job["state"] = "running"
+                items, coalesce = job["items"], job["coalesce"]
+            browser_not_found.clear()
+            try:
+                results = execute_collected(items, coalesce, self.pool)
+                job_results = [
+                    {"uid": getattr(it, "_uid", None), "order_name": it.order_name, "gtin": it.gtin,
+                     "codes_count": it.codes_count, "ok": ok, "msg": msg}
+                    for ok, msg, it in results
+                ]
+                with self._lock:
+                    job["results"] = job_results
+                    job["run_dir"] = timing.current_run_dir()
+                    job["state"] = "done"
+            except Exception as e:
+                logging.exception(f"Пачка {job_id} завершилась ошибкой")
+                with self._lock:
+                    job["errors"].append({"line": 0, "message": f"Exception: {e}"})
+                    job["state"] = "failed"
+            # следующая пачка — снова с открытой страницы заказа
+            if self.pool is not None:
+                self.pool.prewarm()
+
+
+def _make_handler(daemon: OrderDaemon, server_ref: List, token: str):
+    from http.server import BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, data):
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self) -> Dict:
+            length = int(self.headers.get("Content-Length") or 0)
+            data = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(data, dict):
+                raise ValueError("тело запроса должно быть JSON-объектом")
+            return data
+
+        def _authorized(self) -> bool:
+            """Токен установки в заголовке; иначе — 403 (запрос не от клиента демона)."""
+            if hmac.compare_digest(self.headers.get(TOKEN_HEADER) or "", token):
+                return True
+            self._send(403, {"error": "нет токена демона"})
+            return False
+
+        def do_GET(self):
+            if not self._authorized():
+                return
+            if self.path == "/status":
+                self._send(200, daemon.status())
+            elif self.path.startswith("/jobs/"):
+                view = daemon.job_view(self.path[len("/jobs/"):])
+                self._send(200 if view else 404, view or {"error": "пачка не найдена"})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if not self._authorized():
+                return
+            content_type = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+            if content_type != "application/json":
+                self._send(415, {"error": "нужен Content-Type: application/json"})
+                return
+            try:
+                data = self._body()
+            except ValueError as e:
+                self._send(400, {"error": f"неверный JSON: {e}"})
+                return
+            if self.path == "/jobs":
+                path = data.get("path")
+                if not path or not os.path.exists(path):
+                    self._send(400, {"error": f"файл {path} не найден"})
+                    return
+                try:
+                    self._send(202, daemon.submit(path, data.get("coalesce")))
+                except Exception as e:
+                    logging.exception("Не удалось принять пачку")
+                    self._send(400, {"error": str(e)})
+            elif self.path == "/shutdown":
+                self._send(200, {"ok": True})
+                threading.Thread(target=server_ref[0].shutdown, daemon=True).start()
+            else:
+                self._send(404, {"error": "not found"})
+
+        def log_message(self, format, *args):
+            logging.info("[daemon] " + format % args)
+
+    return Handler
+
+
+def serve(host: str = DAEMON_HOST, port: int = DAEMON_PORT):
+    from http.server import ThreadingHTTPServer
+    from backend import NOMENCLATURE_XLSX, ui_print, setup_logging
+
+    setup_logging()
+    token = load_token(create=True)
+    daemon = OrderDaemon(NOMENCLATURE_XLSX)
+    server_ref: List = []
+    server = ThreadingHTTPServer((host, port), _make_handler(daemon, server_ref, token))
+    server_ref.append(server)
+    daemon.start()
+    ui_print(f"Демон заказа кодов слушает http://{host}:{port} (остановить: python daemon.py stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        daemon.stop()
+
+
+# -----------------------------
+# Клиент
+# -----------------------------
+def _request(method: str, path: str, data: Optional[Dict] = None, port: int = DAEMON_PORT) -> Dict:
+    token = load_token()
+    if token is None:
+        # файла токена нет — значит, serve ещё ни разу не запускался
+        raise urllib.error.URLError(f"нет файла токена {DAEMON_TOKEN_FILE}")
+    req = urllib.request.Request(
+        f"http://{DAEMON_HOST}:{port}{path}",
+        data=json.dumps(data).encode("utf-8") if data is not None else None,
+        method=method,
+        headers={"Content-Type": "application/json", TOKEN_HEADER: token},
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return json.loads(e.read() or b"{}")
+
+
+def submit(path: str, coalesce: Optional[str] = None, wait: bool = True, port: int = DAEMON_PORT) -> int:
+    job = _request("POST", "/jobs", {"path": os.path.abspath(path), "coalesce": coalesce}, port)
+    if "error" in job:
+        print(f"ERROR: {job['error']}")
+        return 1
+    for e in job["errors"]:
+        print(f" - строка {e['line']}: {e['message']}")
+    print(f"Пачка {job['id']}: позиций {job['count']}, состояние {job['state']}")
+    if not wait or job["state"] == "failed":
+        return 0 if job["state"] != "failed" else 1
+
+    while job["state"] in ("queued", "running"):
+        time.sleep(POLL_INTERVAL)
+        job = _request("GET", f"/jobs/{job['id']}", port=port)
+    for r in job["results"]:
+        print(f"[{'OK' if r['ok'] else 'ERR'}] uid={r['uid']} GTIN {r['gtin']} — {r['codes_count']} кодов "
+              f"— заявка '{r['order_name']}' — {r['msg']}")
+    ok = sum(1 for r in job["results"] if r["ok"])
+    print(f"Успешно: {ok}, Ошибок: {len(job['results']) - ok}. Трасса прогона: {job['run_dir']}")
+    return 0 if job["state"] == "done" and ok == len(job["results"]) else 1
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Резидентный режим заказа кодов маркировки")
+    parser.add_argument("--port", type=int, default=DAEMON_PORT)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("serve", help="запустить демон")
+    p_submit = sub.add_parser("submit", help="отправить пачку (CSV/XLSX/JSONL) на выполнение")
+    p_submit.add_argument("file")
+    p_submit.add_argument("--coalesce", choices=("gtin", "gtin_order", "order_lines", "batch_lines"),
+                          help="объединение позиций (см. main.py --coalesce)")
+    p_submit.add_argument("--no-wait", action="store_true", help="не ждать выполнения")
+    sub.add_parser("status", help="состояние демона")
+    sub.add_parser("stop", help="остановить демон")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        serve(port=args.port)
+        return 0
+    try:
+        if args.command == "submit":
+            return submit(args.file, args.coalesce, not args.no_wait, args.port)
+        if args.command == "status":
+            print(json.dumps(_request("GET", "/status", port=args.port), ensure_ascii=False, indent=2))
+        elif args.command == "stop":
+            _request("POST", "/shutdown", {}, args.port)
+            print("Демон остановлен.")
+    except urllib.error.URLError:
+        print(f"Демон не запущен (http://{DAEMON_HOST}:{args.port}). Запуск: python daemon.py serve")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+# dispatcher.py
+"""
+Выдача позиций пачки на выполнение: по приоритету, в темпе, который портал
+выдерживает без отказов, и не больше заданного числа одновременно.
+
+Темп — token bucket: DISPATCH_RATE_PER_MIN заказов в минуту, до DISPATCH_BURST
+подряд без ожидания (после простоя). Отказ портала стоит целого перезапуска
+заказа, поэтому позиция лучше подождёт токен здесь, чем получит отказ там.
+
+    dispatcher = Dispatcher(items, max_in_flight=workers)
+    for idx, item in dispatcher:        # ждёт токен и свободное место
+        ...                             # запустить позицию
+        dispatcher.done()               # позиция завершилась (или в колбэке future)
+
+Ожидание токенов пишется в трассу прогона шагом "dispatch_wait".
+"""
+import time
+import logging
+import threading
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import timing
+from backend import (
+    OrderItem, DISPATCH_RATE_PER_MIN, DISPATCH_BURST, DISPATCH_MAX_IN_FLIGHT, URGENT_MARKERS, URGENT_PRIORITY,
+)
+
+
+def priority_of(item: OrderItem) -> int:
+    """Приоритет позиции: OrderItem.priority + URGENT_PRIORITY для срочных заявок."""
+    priority = item.priority or 0
+    if any(marker in str(item.order_name).lower() for marker in URGENT_MARKERS):
+        priority += URGENT_PRIORITY
+    return priority
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше burst в запасе. acquire() ждёт токен."""
+
+    def __init__(self, rate: float, burst: int = 1, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Берёт токен (в долг, если его нет). Возвращает, сколько ждать до него, сек."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self) -> float:
+        """Ждёт токен; возвращает время ожидания, сек."""
+        wait = self._reserve()
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+
+class Dispatcher:
+    """Позиции пачки по приоритету, не чаще TokenBucket и не больше max_in_flight одновременно."""
+
+    def __init__(self, items: List[OrderItem], rate_per_min: Optional[float] = DISPATCH_RATE_PER_MIN,
+                 burst: int = DISPATCH_BURST, max_in_flight: int = DISPATCH_MAX_IN_FLIGHT,
+                 priority: Callable[[OrderItem], int] = priority_of):
+        # sorted устойчива: при равном приоритете — исходный порядок
+        self._order = sorted(range(len(items)), key=lambda i: -priority(items[i]))
+        self._items = items
+        self.bucket = TokenBucket(rate_per_min / 60, burst) if rate_per_min else None
+        self.max_in_flight = max(1, max_in_flight)
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self.waited = 0.0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[Tuple[int, OrderItem]]:
+        """(индекс в исходном списке, позиция) — когда есть место и токен."""
+        for idx in self._order:
+            self._slots.acquire()
+            if self.bucket is not None:
+                start = time.time()
+                waited = self.bucket.acquire()
+                if waited > 0:
+                    self.waited += waited
+                    timing.record("dispatch_wait", start, waited)
+                    logging.info(f"Темп заказов: позиция ждала {waited:.1f} с")
+            yield idx, self._items[idx]
+
+    def done(self):
+        """Позиция завершилась — место для следующей."""
+        self._slots.release()
@@ -0,0 +1,154 @@
+# journal.py
+"""
+Журнал выполнения позиций: append-only таблица событий в SQLite.
+
+Каждая позиция (по _uid) проходит состояния
+    queued -> sent -> signed -> done | failed
+queued пишется вместе с данными позиции, поэтому после падения процесса или
+браузера незавершённые позиции можно перезапустить: python main.py --resume.
+
+SQLite в режиме WAL: записи переживают падение процесса, а параллельные
+воркеры (отдельные процессы) пишут в один файл без порчи.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, List, Optional
+
+JOURNAL_PATH = os.path.join("runs", "journal.sqlite3")
+
+QUEUED = "queued"      # позиция поставлена в прогон
+SENT = "sent"          # нажато "Отправить в ГИС МТ" (черновик заказа создан в Контуре)
+SIGNED = "signed"      # нажато "Подписать и отправить в ГИС МТ"
+DONE = "done"          # позиция выполнена (пишется только после signed)
+FAILED = "failed"      # позиция завершилась ошибкой
+
+# При --resume не перезапускаются позиции, по которым записано signed: заказ уже
+# ушёл в ГИС МТ. done без signed (старые журналы) этого не гарантирует. Позиции
+# с sent без signed тоже не перезапускаются: черновик уже есть в портале, новый
+# заказ стал бы дублем (после них пишется failed, поэтому смотрим на флаг sent).
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts      REAL NOT NULL,
+    run_id  TEXT NOT NULL,
+    uid     TEXT NOT NULL,
+    state   TEXT NOT NULL,
+    message TEXT,
+    payload TEXT
+);
+CREATE INDEX IF NOT EXISTS events_run_uid ON events (run_id, uid);
+"""
+
+
+class Journal:
+    def __init__(self, path: str = JOURNAL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # соединение нельзя наследовать через fork — в новом процессе открываем своё
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def record(self, run_id: str, uid: Optional[str], state: str, message: str = "",
+               payload: Optional[Dict] = None):
+        if not uid:
+            return
+        try:
+            with self._lock:
+                self._connection().execute(
+                    "INSERT INTO events (ts, run_id, uid, state, message, payload) VALUES (?, ?, ?, ?, ?, ?)",
+                    (time.time(), run_id, uid, state, message,
+                     json.dumps(payload, ensure_ascii=False) if payload is not None else None),
+                )
+        except Exception:
+            # журнал не должен ронять заказ — только логируем
+            logging.exception(f"Не удалось записать в журнал: uid={uid} state={state}")
+
+    def has_state(self, run_id: str, uid: Optional[str], state: str) -> bool:
+        """Было ли у позиции uid в прогоне run_id состояние state."""
+        if not uid:
+            return False
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT 1 FROM events WHERE run_id = ? AND uid = ? AND state = ? LIMIT 1", (run_id, uid, state)
+            ).fetchone()
+        return row is not None
+
+    def last_run_id(self) -> Optional[str]:
+        with self._lock:
+            row = self._connection().execute("SELECT run_id FROM events ORDER BY id DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def run_state(self, run_id: str) -> List[Dict]:
+        """
+        Позиции прогона в порядке постановки: [{uid, state, message, payload, sent, signed}],
+        state — последнее записанное состояние, sent/signed — были ли записаны SENT/SIGNED.
+        """
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT uid, state, message, payload FROM events WHERE run_id = ? ORDER BY id", (run_id,)
+            ).fetchall()
+        items: Dict[str, Dict] = {}
+        for uid, state, message, payload in rows:
+            entry = items.setdefault(uid, {"uid": uid, "payload": None, "sent": False, "signed": False})
+            entry["state"] = state
+            entry["sent"] = entry["sent"] or state == SENT
+            entry["signed"] = entry["signed"] or state == SIGNED
+            entry["message"] = message
+            if payload is not None:
+                entry["payload"] = json.loads(payload)
+        return list(items.values())
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+# журнал текущего процесса (см. attach) — им пользуется мастер заказа
+_journal: Optional[Journal] = None
+_run_id: Optional[str] = None
+
+
+def attach(run_id: Optional[str], path: str = JOURNAL_PATH) -> Journal:
+    """Подключает процесс (в т.ч. воркер) к журналу прогона run_id."""
+    global _journal, _run_id
+    if _journal is None or _journal.path != path:
+        _journal = Journal(path)
+    _run_id = run_id
+    return _journal
+
+
+def mark(uid: Optional[str], state: str, message: str = "", payload: Optional[Dict] = None):
+    """Записывает переход позиции в журнал текущего прогона (если он подключён)."""
+    if _journal is not None and _run_id is not None:
+        _journal.record(_run_id, uid, state, message, payload)
+
+
+def has_state(uid: Optional[str], state: str) -> bool:
+    """Было ли у позиции uid состояние state в текущем прогоне (журнал не подключён — False)."""
+    if _journal is None or _run_id is None:
+        return False
+    return _journal.has_state(_run_id, uid, state)
+
+
+def current_path() -> Optional[str]:
+    return _journal.path if _journal is not None else None
+
+
+def current_run_id() -> Optional[str]:
+    return _run_id
@@ -0,0 +1,200 @@
+# locators.py
+"""
+Реестр локаторов мастера заказа.
+
+У каждого элемента — упорядоченный список кандидатов: data-test-id/data-tid,
+затем по тексту или aria-роли, последним — позиционный XPath (как было раньше). Все кандидаты
+проверяются в одном ожидании, поэтому сломавшийся кандидат не стоит
+отдельного таймаута. Кандидат, который сработал, запоминается и на
+следующей позиции прогона проверяется первым.
+
+timeout — таймаут по умолчанию: фактически элемент ждём столько, сколько
+выучил timeouts.py по прошлым ожиданиям этого элемента.
+
+    el = locators.find(driver, "send_button", timeout=10)
+"""
+import logging
+import threading
+from typing import Callable, Dict, List, Tuple
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, TimeoutException
+
+import timeouts
+
+Locator = Tuple[str, str]
+
+# Позиционные XPath карточек организации/склада — последний кандидат (см. LOCATORS).
+# Экран определяется по всем XPath-кандидатам карточки сразу (xpath_union, DETECT_SCREEN_JS).
+PROFILE_CARD_XPATH = '//*[@id="root"]/div/div/div[1]/div[2]/div/div/div/div/div[2]/div/div/div/div/div/div/div[1]/div/div/div/div[1]/div/div'
+WAREHOUSE_CARD_XPATH = '//*[@id="root"]/div/div/div[2]/div/div/div[1]/div[3]/ul/li/div[2]'
+
+LOCATORS: Dict[str, List[Locator]] = {
+    # только XPath: кандидаты карточек объединяются в одно выражение для DETECT_SCREEN_JS
+    "profile_card": [
+        (By.XPATH, "//*[@id='root']//*[contains(@data-test-id, 'rganizationCard') or contains(@data-tid, 'rganizationCard')]"),
+        (By.XPATH, "//*[@id='root']//*[@role='button' or self::a][.//*[starts-with(normalize-space(text()), 'ИНН')]]"),
+        (By.XPATH, PROFILE_CARD_XPATH),
+    ],
+    "warehouse_card": [
+        (By.XPATH, "//*[@id='root']//*[contains(@data-test-id, 'arehouseCard') or contains(@data-tid, 'arehouseCard')]"),
+        (By.XPATH, "//*[@id='root']//li[contains(@data-test-id, 'arehouse') or contains(@data-tid, 'arehouse')]"),
+        (By.XPATH, WAREHOUSE_CARD_XPATH),
+    ],
+    "order_codes_button": [
+        (By.XPATH, "//button[.//span[normalize-space(text())='Заказать коды']]"),
+        (By.XPATH, '//*[@id="root"]/div/div/div[2]/div/div[1]/div/div/div[2]/div/div[2]/div/div/div/span[1]/span/button/div[2]/span[2]'),
+    ],
+    "production_rf": [
+        (By.XPATH, "//label[contains(normalize-space(.), 'Производство РФ')]"),
+        (By.XPATH, '/html/body/div[5]/div/div[2]/div/div/div/div/div[2]/div[2]/div/div[1]/span/span/div/div[2]/div/label/div'),
+    ],
+    "order_type_next": [
+        (By.XPATH, "//*[@data-tid='Modal__root' or @role='dialog']//button[.//span[normalize-space(text())='Далее']]"),
+        (By.XPATH, "//button[.//span[normalize-space(text())='Далее']]"),
+        (By.XPATH, '/html/body/div[5]/div/div[2]/div/div/div/div/div[2]/div[3]/div/div/div/div[2]/div/div/span[1]/span/button/div[2]/span'),
+    ],
+    "fill_from_catalog": [
+        (By.XPATH, "//*[normalize-space(text())='Наполнить из справочника']"),
+        (By.XPATH, '//*[@id="root"]/div/div/div[2]/div/span/div/div[2]/div/div/span/div/div[2]/div'),
+    ],
+    "order_number_input": [
+        (By.XPATH, "//label[.//span[contains(text(), 'Заказ кодов')]]//input"),
+        (By.XPATH, '//*[@id="root"]/div/div/div[2]/div/span/div/div[1]/div/div[1]/div[1]/div[1]/div/span/label/span[2]/input'),
+    ],
+    "catalog_next": [
+        (By.XPATH, "//button[@data-tid='Button__root'][.//span[contains(text(), 'Далее к заполнению реквизитов')]]"),
+        (By.XPATH, "//button[.//span[contains(text(), 'Далее к заполнению реквизитов')]]"),
+    ],
+    "cis_type_label": [
+        (By.CSS_SELECTOR, "[data-test-id='cisTypeField'] [data-tid='Select__label']"),
+    ],
+    "cis_type_button": [
+        (By.CSS_SELECTOR, "[data-test-id='cisTypeField'] button[data-tid='Button__root']"),
+        (By.CSS_SELECTOR, "[data-test-id='cisTypeField'] button"),
+    ],
+    "requisites_next": [
+        (By.XPATH, "//button[@data-tid='Button__root'][.//span[contains(text(), 'Далее к загрузке товаров')]]"),
+        (By.XPATH, "//button[.//span[contains(text(), 'Далее к загрузке товаров')]]"),
+    ],
+    "gtin_search_input": [
+        (By.CSS_SELECTOR, '[data-test-id="productCatalogSearchInput"] input'),
+    ],
+    "quantity_input": [
+        (By.CSS_SELECTOR, '[data-test-id="codesQuantityInput"] input'),
+    ],
+    "send_button": [
+        (By.CSS_SELECTOR, '[data-test-id="codesOrderSendToGISMT"] button'),
+        (By.XPATH, "//button[normalize-space(.)='Отправить в ГИС МТ']"),
+    ],
+    "sign_dialog": [
+        (By.CSS_SELECTOR, '[data-test-id="codesOrderSignCert"]'),
+    ],
+    "sign_cert_button": [
+        (By.CSS_SELECTOR, '[data-test-id="codesOrderSignCert"] button'),
+        (By.XPATH, "//button[normalize-space(.)='Подписать сертификатом']"),
+    ],
+    "sign_send_button": [
+        (By.CSS_SELECTOR, '[data-test-id="signAndSendToGISMT"] button'),
+        (By.XPATH, "//button[normalize-space(.)='Подписать и отправить в ГИС МТ']"),
+    ],
+}
+
+
+class LocatorRegistry:
+    def __init__(self, locators: Dict[str, List[Locator]] = LOCATORS):
+        self.locators = locators
+        self._preferred: Dict[str, Locator] = {}
+        self._hits: Dict[Tuple[str, Locator], int] = {}
+        self._lock = threading.Lock()
+
+    def candidates(self, name: str) -> List[Locator]:
+        """Кандидаты элемента: сработавший в этом прогоне — первым."""
+        cands = self.locators[name]
+        preferred = self._preferred.get(name)
+        if preferred is None or preferred == cands[0]:
+            return cands
+        return [preferred] + [c for c in cands if c != preferred]
+
+    def _remember(self, name: str, loc: Locator):
+        with self._lock:
+            if self._preferred.get(name) != loc:
+                if loc != self.locators[name][0]:
+                    logging.info(f"Локатор '{name}': сработал запасной кандидат {loc[1]}")
+                self._preferred[name] = loc
+            self._hits[(name, loc)] = self._hits.get((name, loc), 0) + 1
+
+    def find(self, driver, name: str, timeout: float,
+             condition: Callable[[Locator], Callable] = EC.element_to_be_clickable):
+        """Ждёт элемент name по всем кандидатам сразу (condition — как в expected_conditions)."""
+        cands = self.candidates(name)
+
+        def any_candidate(d):
+            for loc in cands:
+                try:
+                    el = condition(loc)(d)
+                except (NoSuchElementException, StaleElementReferenceException):
+                    continue
+                if el:
+                    self._remember(name, loc)
+                    return el
+            return False
+
+        with timeouts.wait(name, timeout, TimeoutException) as budget:
+            return WebDriverWait(driver, budget, poll_frequency=0.1).until(
+                any_candidate, message=f"Элемент '{name}' не найден ни по одному локатору за {budget:.1f} с"
+            )
+
+    def find_nth(self, driver, name: str, n: int, timeout: float):
+        """Ждёт n-й (с 0) видимый элемент name (например, поле количества n-й строки товара)."""
+        cands = self.candidates(name)
+
+        def nth_visible(d):
+            for loc in cands:
+                elements = [e for e in d.find_elements(*loc) if e.is_displayed()]
+                if len(elements) > n:
+                    self._remember(name, loc)
+                    return elements[n]
+            return False
+
+        with timeouts.wait(name, timeout, TimeoutException) as budget:
+            return WebDriverWait(driver, budget, poll_frequency=0.1,
+                                 ignored_exceptions=(StaleElementReferenceException,)).until(
+                nth_visible, message=f"Элемент '{name}' #{n + 1} не найден ни по одному локатору за {budget:.1f} с"
+            )
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Элемент -> {локатор: сколько раз сработал} (для диагностики смены вёрстки)."""
+        out: Dict[str, Dict[str, int]] = {}
+        for (name, loc), count in self._hits.items():
+            out.setdefault(name, {})[loc[1]] = count
+        return out
+
+    def reset(self):
+        with self._lock:
+            self._preferred.clear()
+            self._hits.clear()
+
+
+# реестр текущего процесса: запомненные кандидаты живут, пока жив процесс (прогон)
+registry = LocatorRegistry()
+
+
+def find(driver, name: str, timeout: float, condition: Callable[[Locator], Callable] = EC.element_to_be_clickable):
+    return registry.find(driver, name, timeout, condition)
+
+
+def find_nth(driver, name: str, n: int, timeout: float):
+    return registry.find_nth(driver, name, n, timeout)
+
+
+def css_selector(name: str) -> str:
+    """CSS-кандидаты элемента одной строкой — для поиска внутри execute_script."""
+    return ", ".join(value for by, value in LOCATORS[name] if by == By.CSS_SELECTOR)
+
+
+def xpath_union(name: str) -> str:
+    """XPath-кандидаты элемента одним выражением (a | b | c) — для поиска внутри execute_script."""
+    return " | ".join(value for by, value in LOCATORS[name] if by == By.XPATH)
@@ -0,0 +1,145 @@
+# logs.py
+"""
+Лог без ожидания диска: потоки и процессы только кладут записи в очередь
+(QueueHandler), в файл пишет один поток главного процесса (QueueListener).
+Параллельные воркеры шлют записи через multiprocessing.Queue в тот же
+слушатель — получается один связный лог прогона.
+
+Формат "json" — по записи на строку:
+    {"ts", "level", "logger", "msg", "pid", "thread", "uid", "step", "duration", "ok", "exc"}
+uid — позиция (timing.order), step — текущий шаг (timing.span); duration/ok
+есть у записей о завершении шага (логгер "timing"). "text" — прежний формат.
+
+    logs.setup("kontur_log.log")                  # главный процесс
+    logs.setup_worker(queue)                      # воркер: queue = logs.worker_queue()
+"""
+import copy
+import json
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import List
+
+import timing
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+# поля записи, которые уходят в JSON, если заданы (extra=... или фильтром)
+EXTRA_FIELDS = ("uid", "step", "duration", "ok")
+
+_lock = threading.Lock()
+_handlers: List[logging.Handler] = []
+_listeners: List[QueueListener] = []
+_worker_queue = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        for name in EXTRA_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                data[name] = value
+        exc = record.exc_text or (self.formatException(record.exc_info) if record.exc_info else None)
+        if exc:
+            data["exc"] = exc
+        return json.dumps(data, ensure_ascii=False)
+
+
+class _ContextFilter(logging.Filter):
+    """uid и шаг из контекста потока, который пишет запись (в воркере — его позиция)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "uid", None) is None:
+            record.uid = timing.current_uid()
+        if getattr(record, "step", None) is None:
+            record.step = timing.current_step()
+        return True
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # сообщение и трейсбек — строками: запись уходит в другой поток/процесс,
+        # а аргументы и exc_info не всегда сериализуются
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+def _queue_handler(q) -> QueueHandler:
+    handler = _QueueHandler(q)
+    handler.addFilter(_ContextFilter())
+    return handler
+
+
+def setup(path: str, fmt: str = "json", level: int = logging.INFO):
+    """Главный процесс: корневой логгер -> очередь -> фоновый поток -> файл path."""
+    with _lock:
+        if _listeners:
+            return
+        file_handler = logging.FileHandler(path, encoding="utf-8")
+        file_handler.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+        _handlers.append(file_handler)
+
+        q: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+        listener = QueueListener(q, *_handlers, respect_handler_level=True)
+        listener.start()
+        _listeners.append(listener)
+
+        root = logging.getLogger()
+        for h in list(root.handlers):
+            root.removeHandler(h)
+        root.addHandler(_queue_handler(q))
+        root.setLevel(level)
+    atexit.register(shutdown)
+
+
+def worker_queue():
+    """Очередь для процессов-воркеров (передаётся в initargs); None — лог не настроен через setup."""
+    global _worker_queue
+    with _lock:
+        if not _listeners:
+            return None
+        if _worker_queue is None:
+            import multiprocessing
+
+            _worker_queue = multiprocessing.Queue(-1)
+            listener = QueueListener(_worker_queue, *_handlers, respect_handler_level=True)
+            listener.start()
+            _listeners.append(listener)
+        return _worker_queue
+
+
+def setup_worker(q, level: int = logging.INFO):
+    """Процесс-воркер: все записи — в очередь главного процесса."""
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(_queue_handler(q))
+    root.setLevel(level)
+
+
+def shutdown():
+    """Дописывает очереди и закрывает файл (при выходе вызывается сам)."""
+    global _worker_queue
+    with _lock:
+        for listener in _listeners:
+            listener.stop()
+        for h in _handlers:
+            h.close()
+        _listeners.clear()
+        _handlers.clear()
+        _worker_queue = None
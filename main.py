@@ -1,23 +1,27 @@
 import os
+import argparse
 import logging
 import json
 import copy
 import uuid
-import pandas as pd
-from typing import List, Optional, Tuple
-from dataclasses import asdict
-
-# Импортируем ваши backend-функции/классы
-from backend import OrderItem, perform_order_item, ui_print, lookup_gtin
-
-# Попытка импортировать глобальный browser_not_found для итогового отчёта
-try:
-    from backend import browser_not_found  # type: ignore
-except Exception:
-    browser_not_found = []
-
-# Настройка логгирования (можешь убрать / настроить путь)
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+import timing
+import journal
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from dataclasses import asdict, fields
+
+# Импортируем ваши backend-функции/классы. Selenium (wizard) и pandas здесь не
+# импортируются: до первого меню грузится только лёгкое, остальное — в фоне (Startup)
+from backend import (
+    OrderItem, ui_print, lookup_gtin, NomenclatureIndex, setup_logging, browser_not_found,
+    PARALLEL_WORKERS, COALESCE_POLICY, PREWARM_BROWSER,
+)
+from batch_import import load_batch
+from batch_optimizer import COALESCE_POLICIES, coalesce_items, expand_result
+from dispatcher import Dispatcher
+
+if TYPE_CHECKING:
+    from wizard import BrowserPool, BrowserSession
 
 # ==== Опции выбора ====
 simplified_options = [
@@ -112,15 +116,18 @@ def choose_delete_index(collected: List[OrderItem]) -> Optional[int]:
 
 
 
-def safe_perform(it: OrderItem) -> Tuple[bool, str]:
+def safe_perform(it: OrderItem, session: Optional["BrowserSession"] = None) -> Tuple[bool, str]:
     """
     Обёртка над perform_order_item.
     Передаём в perform_order_item словарь asdict + _uid (если есть), и защищаемся от исключений/None.
+    session — браузер из пула, переиспользуется между позициями.
     """
+    from wizard import perform_order_item
+
     try:
         payload = asdict(it)
         payload["_uid"] = getattr(it, "_uid", None)
-        res = perform_order_item(payload)
+        res = perform_order_item(payload, session)
         if res is None:
             logging.error("perform_order_item вернула None")
             return False, "perform_order_item вернула None"
@@ -134,14 +141,340 @@ def safe_perform(it: OrderItem) -> Tuple[bool, str]:
         return False, f"Exception: {e}"
 
 
-def main():
+def _item_payload(it: OrderItem) -> Dict:
+    """Позиция -> словарь для журнала/снимка (с _uid)."""
+    payload = asdict(it)
+    payload["_uid"] = getattr(it, "_uid", None)
+    return payload
+
+
+def _item_from_payload(payload: Dict) -> OrderItem:
+    """Позиция из записи журнала (лишние ключи, например _members, пропускаются)."""
+    item_fields = {f.name for f in fields(OrderItem)}
+    it = OrderItem(**{k: v for k, v in payload.items() if k in item_fields})
+    setattr(it, "_uid", payload.get("_uid"))
+    return it
+
+
+def execute_collected(collected: List[OrderItem], coalesce: Optional[str] = COALESCE_POLICY,
+                      pool: Optional["BrowserPool"] = None,
+                      groups: Optional[Dict[str, List[OrderItem]]] = None):
+    """
+    Выполняет накопленные позиции (снимок collected) и печатает итоговый отчёт.
+    Общая часть для интерактивного ввода и пакетного режима (--batch).
+    coalesce — политика объединения позиций с одинаковым GTIN (см. batch_optimizer);
+    отчёт всё равно печатается по исходным позициям. groups — уже объединённые
+    позиции (uid -> исходные позиции, см. coalesce_items), например из журнала при --resume.
+    pool — уже запущенные (прогретые) браузеры; если не передан, создаётся на прогон.
+    Возвращает результаты по исходным позициям: [(ok, msg, item)].
+    """
+    from wizard import BrowserPool, execute_parallel
+
+    # делаем жёсткую глубокую копию коллекции (snapshot)
+    to_process = copy.deepcopy(collected)
+
+    # сохраняем snapshot на диск для дебага (включаем _uid в дамп)
+    try:
+        snapshot = [_item_payload(x) for x in to_process]
+        with open("last_snapshot.json", "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2)
+        logging.info("Saved last_snapshot.json (snapshot of to_process).")
+    except Exception:
+        logging.exception("Не удалось сохранить last_snapshot.json")
+
+    # контроль того, что snapshot действительно сформирован
+    if not to_process:
+        ui_print("Нет накопленных позиций — выходим.")
+        return []
+
+    # перед запуском проверим, что в snapshot нет позиций, которые были удалены (защитный лог)
+    current_uids = {getattr(x, "_uid", None) for x in collected}
+    snapshot_uids = [getattr(x, "_uid", None) for x in to_process]
+    # если какие-то UID отсутствуют — логируем (но всё равно запускаем snapshot)
+    missing = [u for u in snapshot_uids if u not in current_uids]
+    if missing:
+        logging.warning(f"В snapshot есть UID'ы, которых нет в текущем collected: {missing}")
+        # это маловероятно при deepcopy, но логируем для диагностики
+
+    # позиции с одинаковым GTIN -> один заказ с суммарным количеством
+    if coalesce:
+        to_process, groups = coalesce_items(to_process, coalesce)
+        if len(to_process) < len(snapshot_uids):
+            ui_print(f"Объединение по '{coalesce}': {len(snapshot_uids)} позиций -> {len(to_process)} заказ(ов).")
+            for uid, members in groups.items():
+                if len(members) > 1:
+                    logging.info(f"Объединённый заказ uid={uid}: {[getattr(m, '_uid', None) for m in members]}")
+
+    results = []
+    success_count = 0
+    fail_count = 0
+    run_dir = timing.start_run()
+
+    # журнал прогона: по нему --resume перезапустит незавершённые позиции
+    journal.attach(os.path.basename(run_dir))
+    for it in to_process:
+        payload = _item_payload(it)
+        if groups and len(groups.get(payload["_uid"], [])) > 1:
+            # исходные позиции целиком — --resume отчитается по каждой (см. resume_run)
+            payload["_members"] = [_item_payload(m) for m in groups[payload["_uid"]]]
+        journal.mark(payload["_uid"], journal.QUEUED, payload=payload)
+
+    def report(ok: bool, msg: str, executed: OrderItem):
+        nonlocal success_count, fail_count
+        # done — только если заказ подписан: мастер возвращает ok и для неотправленных
+        # позиций ("НЕ НАЙДЕН"), а --resume пропускает только подписанные
+        uid = getattr(executed, "_uid", None)
+        signed = ok and journal.has_state(uid, journal.SIGNED)
+        state = journal.DONE if signed else journal.FAILED
+        journal.mark(uid, state, msg if signed or not ok else f"не подписан: {msg}")
+        # результат объединённого заказа — по каждой исходной позиции
+        for ok_, msg_, it in expand_result(ok, msg, executed, groups):
+            if it is not executed:
+                journal.mark(getattr(it, "_uid", None), state, msg_)
+            if ok_:
+                success_count += 1
+            else:
+                fail_count += 1
+            results.append((ok_, msg_, it))
+            ui_print(f"[{'OK' if ok_ else 'ERR'}] uid={getattr(it, '_uid', None)} {it.simpl_name} — {msg_}")
+
+    if PARALLEL_WORKERS > 1 and len(to_process) > 1:
+        ui_print(f"\nБудет выполнено {len(to_process)} задач(и) ПАРАЛЛЕЛЬНО ({PARALLEL_WORKERS} браузеров).")
+        ui_print("Запуск...")
+        execute_parallel(to_process, PARALLEL_WORKERS, on_result=report)
+    else:
+        ui_print(f"\nБудет выполнено {len(to_process)} задач(и) ПОСЛЕДОВАТЕЛЬНО.")
+        ui_print("Запуск...")
+        # один браузер на весь прогон (перезапуск — по SESSION_MAX_ORDERS или при падении)
+        own_pool = pool is None
+        if own_pool:
+            pool = BrowserPool(size=1)
+        try:
+            # срочные позиции — первыми; темп — не быстрее, чем портал принимает (см. dispatcher)
+            dispatcher = Dispatcher(to_process, max_in_flight=1)
+            for _, it in dispatcher:
+                uid = getattr(it, "_uid", None)
+                ui_print(f"Запуск позиции uid={uid}: {it.simpl_name} | GTIN {it.gtin} | заявка '{it.order_name}'")
+                try:
+                    with pool.session() as session:
+                        ok, msg = safe_perform(it, session)
+                finally:
+                    dispatcher.done()
+                report(ok, msg, it)
+        finally:
+            if own_pool:
+                pool.close()
+
+    ui_print("\n=== Выполнение завершено ===")
+    ui_print(f"Успешно: {success_count}, Ошибок: {fail_count}.")
+
+    # сводка по времени шагов (трасса для сравнения прогонов — в run_dir)
+    ui_print("\nВремя по шагам, сек:")
+    ui_print(timing.format_summary(timing.finish_run(run_dir)))
+    ui_print(f"Трасса прогона: {run_dir} (перезапуск незавершённого: python main.py --resume)")
+
+    # подробный отчёт
+    if any(not r[0] for r in results):
+        print("\nНеудачные позиции:")
+        for ok, msg, it in results:
+            if not ok:
+                print(f" - uid={getattr(it,'_uid',None)} | {it.simpl_name} | GTIN {it.gtin} | заявка '{it.order_name}' => {msg}")
+
+    if browser_not_found:
+        print("\nGTIN, не найденные в справочнике (browser_not_found):")
+        for g in sorted(set(browser_not_found)):
+            print(" -", g)
+
+    return results
+
+
+def run_batch_file(path: str, nomenclature: NomenclatureIndex, assume_yes: bool = False,
+                   coalesce: Optional[str] = COALESCE_POLICY, pool: Optional["BrowserPool"] = None):
+    """Пакетный режим: позиции из файла (CSV/XLSX/JSONL) сразу идут на выполнение."""
+    if not os.path.exists(path):
+        ui_print(f"ERROR: файл {path} не найден.")
+        return
+
+    collected, errors = load_batch(path, nomenclature)
+    if errors:
+        print(f"\nСтроки с ошибками ({len(errors)}) — не добавлены:")
+        for e in errors:
+            print(f" - строка {e.line}: {e.message}")
+
+    if not collected:
+        ui_print("Нет позиций для выполнения — выходим.")
+        return
+
+    print_collected(collected)
+    if not assume_yes:
+        confirm = input(f"Подтвердите выполнение {len(collected)} задач(и)? (y/n): ").strip().lower()
+        if confirm != "y":
+            ui_print("Выполнение отменено пользователем.")
+            return
+
+    execute_collected(collected, coalesce, pool)
+
+
+def resume_run(run_id: Optional[str] = None, assume_yes: bool = False, pool: Optional["BrowserPool"] = None):
+    """
+    Перезапуск прогона по журналу: позиции, дошедшие до подписи (записано signed),
+    пропускаются; отправленные, но не подписанные (записано sent) — тоже, с
+    предупреждением: их черновик надо проверить в портале. Остальные выполняются
+    заново с теми же _uid; объединённые заказы — вместе с исходными позициями
+    (_members), чтобы отчёт и журнал дошли до каждой из них.
+    """
+    jr = journal.Journal()
+    run_id = run_id or jr.last_run_id()
+    if not run_id:
+        ui_print("Журнал пуст — нечего возобновлять.")
+        return
+    entries = jr.run_state(run_id)
+    jr.close()
+    if not entries:
+        ui_print(f"Прогон {run_id} в журнале не найден.")
+        return
+
+    # исходные позиции объединённых заказов: их итог пишется через объединённый заказ
+    member_uids = {m.get("_uid") for e in entries for m in (e["payload"] or {}).get("_members") or []
+                   if isinstance(m, dict)}
+    collected: List[OrderItem] = []
+    groups: Dict[str, List[OrderItem]] = {}
+    skipped = 0
+    unsigned = 0
+    for e in entries:
+        if e["uid"] in member_uids:
+            continue
+        if e["signed"]:
+            skipped += 1
+            continue
+        if e["sent"]:
+            # повторный заказ стал бы дублем черновика, который уже есть в портале
+            unsigned += 1
+            ui_print(f"⚠ uid={e['uid']}: заказ был отправлен в ГИС МТ, но не подписан — "
+                     f"подпиши или удали черновик в Контуре; позиция не перезапускается.")
+            continue
+        if not e["payload"]:
+            logging.warning(f"В журнале нет данных позиции uid={e['uid']} — пропускаем")
+            continue
+        it = _item_from_payload(dict(e["payload"], _uid=e["uid"]))
+        members = e["payload"].get("_members")
+        if members and all(isinstance(m, dict) for m in members):
+            groups[e["uid"]] = [_item_from_payload(m) for m in members]
+        elif members:
+            # журнал старого формата: только uid исходных позиций — отчёт по объединённому заказу
+            logging.warning(f"uid={e['uid']}: в журнале нет данных исходных позиций {members}")
+        collected.append(it)
+
+    ui_print(f"Прогон {run_id}: завершено {skipped}, отправлено без подписи {unsigned}, "
+             f"к перезапуску {len(collected)}.")
+    if not collected:
+        return
+
+    print_collected(collected)
+    if not assume_yes:
+        confirm = input(f"Подтвердите выполнение {len(collected)} задач(и)? (y/n): ").strip().lower()
+        if confirm != "y":
+            ui_print("Выполнение отменено пользователем.")
+            return
+
+    # позиции уже объединены в исходном прогоне — заново не объединяем
+    execute_collected(collected, None, pool, groups or None)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Kontur Automation — заказ кодов маркировки")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="пакетный файл позиций (CSV/XLSX/JSONL) вместо интерактивного ввода")
+    parser.add_argument("--resume", nargs="?", const="", metavar="RUN_ID",
+                        help="перезапустить незавершённые позиции прогона из журнала (по умолчанию — последнего)")
+    parser.add_argument("-y", "--yes", action="store_true",
+                        help="не спрашивать подтверждение перед выполнением пакета")
+    parser.add_argument("--coalesce", choices=COALESCE_POLICIES, default=COALESCE_POLICY,
+                        help="объединять позиции в меньшее число заказов: gtin_order/gtin — одинаковые GTIN "
+                             "в пределах заявки/по всей пачке, order_lines/batch_lines — многострочные заказы "
+                             "(строка на GTIN) в пределах заявки/по всей пачке")
+    return parser.parse_args(argv)
+
+
+def _start_pool() -> "BrowserPool":
+    from wizard import BrowserPool
+
+    pool = BrowserPool(size=1)
+    pool.prewarm()
+    return pool
+
+
+class Startup:
+    """
+    Тяжёлая часть запуска в фоновых потоках, пока оператор уже видит меню:
+    справочник (кэш или pandas + xlsx) и браузер (импорт Selenium, запуск,
+    страница заказа). Результат берётся там, где он впервые нужен.
+    Браузер запускается, когда понятно, что он понадобится (start_browser —
+    после первой позиции, пакет, --resume): выход без выполнения его не ждёт.
+    """
+
+    def __init__(self, prewarm: bool = True):
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="startup")
+        # параллельный режим запускает свои браузеры сам
+        self._prewarm = prewarm
+        self._pool: Optional[Future] = None
+        self._nomenclature: Optional[Future] = None
+
+    def start_browser(self):
+        """Запускает браузер и открывает страницу заказа в фоне (один раз)."""
+        if self._prewarm and self._pool is None:
+            self._pool = self._executor.submit(_start_pool)
+
+    def load_nomenclature(self, path: str):
+        # справочник нормализуется и индексируется один раз (кэш на диске между запусками)
+        self._nomenclature = self._executor.submit(NomenclatureIndex.load, path)
+
+    def nomenclature(self) -> NomenclatureIndex:
+        return self._nomenclature.result()
+
+    def pool(self) -> Optional["BrowserPool"]:
+        """Прогретый пул; None — прогрева нет или он не удался (браузер запустит execute_collected)."""
+        self.start_browser()
+        if self._pool is None:
+            return None
+        try:
+            return self._pool.result()
+        except Exception as e:
+            logging.warning(f"Прогрев браузера не удался: {e} — браузер запустится при выполнении")
+            return None
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._pool is not None and self._pool.exception() is None:
+            self._pool.result().close()
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    setup_logging()
+
+    startup = Startup(prewarm=PREWARM_BROWSER and PARALLEL_WORKERS <= 1)
+    try:
+        run(args, startup)
+    finally:
+        startup.close()
+
+
+def run(args: argparse.Namespace, startup: Startup):
+    if args.resume is not None:
+        resume_run(args.resume or None, args.yes, startup.pool())
+        return
+
     NOMENCLATURE_XLSX = "data/nomenclature.xlsx"
     if not os.path.exists(NOMENCLATURE_XLSX):
         ui_print(f"ERROR: файл {NOMENCLATURE_XLSX} не найден.")
         return
+    startup.load_nomenclature(NOMENCLATURE_XLSX)
 
-    df = pd.read_excel(NOMENCLATURE_XLSX)
-    df.columns = df.columns.str.strip()
+    if args.batch:
+        startup.start_browser()
+        run_batch_file(args.batch, startup.nomenclature(), args.yes, args.coalesce, startup.pool())
+        return
 
     ui_print("=== Kontur Automation — ввод позиций ===")
     collected: List[OrderItem] = []
@@ -179,6 +512,8 @@ def main():
             # даём уникальный id позиции
             setattr(it, "_uid", uuid.uuid4().hex)
             collected.append(it)
+            # браузер открывает страницу заказа, пока оператор вводит остальные позиции
+            startup.start_browser()
             ui_print(f"Добавлено по GTIN: {gtin_input} — {codes_count} кодов — заявка '{order_name}'")
             print_collected(collected)
 
@@ -204,7 +539,7 @@ def main():
                 ui_print("Неверно введено количество кодов. Попробуй ещё раз.")
                 continue
 
-            gtin, full_name = lookup_gtin(df, simpl, size, units, color, venchik)
+            gtin, full_name = lookup_gtin(startup.nomenclature(), simpl, size, units, color, venchik)
             if not gtin:
                 ui_print(f"GTIN не найден для ({simpl}, {size}, {units}, {color}, {venchik}) — позиция не добавлена.")
                 continue
@@ -220,6 +555,7 @@ def main():
             )
             setattr(it, "_uid", uuid.uuid4().hex)
             collected.append(it)
+            startup.start_browser()
             ui_print(f"Добавлено: {simpl} ({size}, {units} уп., {color or 'без цвета'}) — GTIN {gtin} — {codes_count} кодов — заявка '{order_name}'")
             print_collected(collected)
 
@@ -255,66 +591,7 @@ def main():
                     ui_print("Выполнение отменено пользователем.")
                     continue
 
-                # делаем жёсткую глубокую копию коллекции (snapshot)
-                to_process = copy.deepcopy(collected)
-
-                # сохраняем snapshot на диск для дебага (включаем _uid в дамп)
-                try:
-                    snapshot = []
-                    for x in to_process:
-                        d = asdict(x)
-                        d["_uid"] = getattr(x, "_uid", None)
-                        snapshot.append(d)
-                    with open("last_snapshot.json", "w", encoding="utf-8") as f:
-                        json.dump(snapshot, f, ensure_ascii=False, indent=2)
-                    logging.info("Saved last_snapshot.json (snapshot of to_process).")
-                except Exception:
-                    logging.exception("Не удалось сохранить last_snapshot.json")
-
-                # контроль того, что snapshot действительно сформирован
-                if not to_process:
-                    ui_print("Нет накопленных позиций — выходим.")
-                    return
-
-                # перед запуском проверим, что в snapshot нет позиций, которые были удалены (защитный лог)
-                current_uids = {getattr(x, "_uid", None) for x in collected}
-                snapshot_uids = [getattr(x, "_uid", None) for x in to_process]
-                # если какие-то UID отсутствуют — логируем (но всё равно запускаем snapshot)
-                missing = [u for u in snapshot_uids if u not in current_uids]
-                if missing:
-                    logging.warning(f"В snapshot есть UID'ы, которых нет в текущем collected: {missing}")
-                    # это маловероятно при deepcopy, но логируем для диагностики
-
-                ui_print(f"\nБудет выполнено {len(to_process)} задач(и) ПОСЛЕДОВАТЕЛЬНО.")
-                ui_print("Запуск...")
-                results = []
-                success_count = 0
-                fail_count = 0
-                for it in to_process:
-                    uid = getattr(it, "_uid", None)
-                    ui_print(f"Запуск позиции uid={uid}: {it.simpl_name} | GTIN {it.gtin} | заявка '{it.order_name}'")
-                    ok, msg = safe_perform(it)
-                    results.append((ok, msg, it))
-                    if ok:
-                        success_count += 1
-                    else:
-                        fail_count += 1
-                    ui_print(f"[{'OK' if ok else 'ERR'}] uid={uid} {it.simpl_name} — {msg}")
-
-                ui_print("\n=== Выполнение завершено ===")
-                ui_print(f"Успешно: {success_count}, Ошибок: {fail_count}.")
-
-                # подробный отчёт
-                if any(not r[0] for r in results):
-                    print("\nНеудачные позиции:")
-                    for ok, msg, it in results:
-                        if not ok:
-                            print(f" - uid={getattr(it,'_uid',None)} | {it.simpl_name} | GTIN {it.gtin} | заявка '{it.order_name}' => {msg}")
-
-                if browser_not_found:
-                    print("\nGTIN, не найденные в справочнике (browser_not_found):")
-                    for g in sorted(set(browser_not_found)):
-                        print(" -", g)
+                execute_collected(collected, args.coalesce, startup.pool())
 
                 # Оставляем collected как есть (так безопаснее); при желании можно удалить успешно выполненные позиции
                 return
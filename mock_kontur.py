@@ -0,0 +1,482 @@
+# mock_kontur.py
+"""
+Локальная копия мастера "Заказ кодов" Контур.Маркировки для замеров и
+проверки автоматизации без mk.kontur.ru и сертификата.
+
+Воспроизводит только то, на что опирается backend: data-test-id полей
+(cisTypeField, productCatalogSearchInput, codesQuantityInput,
+codesOrderSendToGISMT, codesOrderSignCert, signAndSendToGISMT), тексты кнопок
+мастера и элементы по абсолютным XPath из обработчиков экранов. Задержки
+портала (загрузка страницы, переходы, поиск по справочнику, отправка,
+подпись) настраиваются.
+
+Запуск вручную:
+    python mock_kontur.py --port 8765
+    set KONTUR_BASE_URL=http://127.0.0.1:8765 && python main.py
+
+Подписанные заказы складываются в память сервера: GET /_mock/orders.
+Как у портала, страница тянет бандл приложения (с Cache-Control), картинки,
+шрифт и счётчик аналитики — чтобы профиль запуска браузера (блокировка
+ресурсов, дисковый кэш) давал измеримую разницу; счётчики запросов —
+GET /_mock/stats.
+
+API заказа (для ORDER_ENGINE = "api", см. api_engine.py) — под
+/api/v1/organizations/<id>/: POST codes-orders (черновик), POST
+codes-orders/<n>/send. Подписывает отправленный заказ страница
+/organizations/<id>/codes-orders/<n> — она открывается сразу с диалогом
+подписи, а кнопка подписи шлёт POST codes-orders/<n>/sign (как сертификат в
+портале). Как у портала, запросы без cookie сессии, выданной при загрузке
+страницы, получают 401.
+Сквозной замер — bench.py.
+"""
+import re
+import sys
+import json
+import html
+import time
+import base64
+import secrets
+import logging
+import argparse
+import threading
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+# Задержки портала, сек
+DEFAULT_LATENCIES = {
+    "page_load": 0.3,    # ответ сервера на загрузку страницы
+    "bundle": 0.5,       # JS-бандл приложения (кэшируется браузером)
+    "asset": 0.3,        # картинки, шрифты, счётчики аналитики — каждый запрос
+    "transition": 0.2,   # смена экрана/открытие модалки после клика
+    "search": 0.4,       # ответ поиска по справочнику товаров
+    "send": 0.5,         # "Отправить в ГИС МТ" -> диалог подписи
+    "sign": 0.8,         # "Подписать и отправить в ГИС МТ" -> заказ принят
+    "api": 0.05,         # ответ API на создание заказа (отправка и подпись — send/sign)
+}
+
+SESSION_COOKIE = "mk_session"
+_API_RE = re.compile(r"^/api/v1/organizations/[^/]+/codes-orders(?:/(\d+)/(send|sign))?$")
+_ORDER_PAGE_RE = re.compile(r"^/organizations/([^/]+)/codes-orders/(\d+)$")
+_GTIN_RE = re.compile(r"^\d{8,14}$")
+
+# -----------------------------
+# DOM-контракт: элементы по позиционным XPath (как в обработчиках backend)
+# -----------------------------
+# относительно #root
+PROFILE_CARD = "div/div/div[1]/div[2]/div/div/div/div/div[2]/div/div/div/div/div/div/div[1]/div/div/div/div[1]/div/div"
+WAREHOUSE_CARD = "div/div/div[2]/div/div/div[1]/div[3]/ul/li/div[2]"
+ORDER_CODES_BUTTON = "div/div/div[2]/div/div[1]/div/div/div[2]/div/div[2]/div/div/div/span[1]/span/button/div[2]/span[2]"
+FILL_FROM_CATALOG = "div/div/div[2]/div/span/div/div[2]/div/div/span/div/div[2]/div"
+ORDER_NUMBER_INPUT = "div/div/div[2]/div/span/div/div[1]/div/div[1]/div[1]/div[1]/div/span/label/span[2]/input"
+ORDER_NUMBER_CAPTION = "div/div/div[2]/div/span/div/div[1]/div/div[1]/div[1]/div[1]/div/span/label/span[1]"
+# относительно модалки /html/body/div[5]
+RF_LABEL = "div/div[2]/div/div/div/div/div[2]/div[2]/div/div[1]/span/span/div/div[2]/div/label/div"
+ORDER_TYPE_NEXT = "div/div[2]/div/div/div/div/div[2]/div[3]/div/div/div/div[2]/div/div/span[1]/span/button/div[2]/span"
+
+_STEP_RE = re.compile(r"([a-z0-9]+)(?:\[(\d+)\])?$")
+_VOID_TAGS = {"input"}
+
+
+def _markup(leaves: Dict[str, Tuple[str, str]]) -> str:
+    """
+    Разметка, в которой элементы находятся ровно по заданным позиционным путям:
+    {"div/div[2]/span": (атрибуты, текст)}. Недостающие соседи (div[1] перед
+    div[2] и т.п.) заполняются пустыми элементами.
+    """
+    tree: Dict = {}
+    for path, leaf in leaves.items():
+        node = tree
+        for step in path.split("/"):
+            tag, pos = _STEP_RE.match(step).groups()
+            node = node.setdefault((tag, int(pos or 1)), {})
+        node[None] = leaf
+
+    def render(node: Dict) -> str:
+        out = []
+        keys = [k for k in node if k is not None]
+        for tag in dict.fromkeys(k[0] for k in keys):
+            for pos in range(1, max(k[1] for k in keys if k[0] == tag) + 1):
+                child = node.get((tag, pos), {})
+                attrs, text = child.get(None, ("", ""))
+                opening = f"<{tag} {attrs}".rstrip()
+                if tag in _VOID_TAGS:
+                    out.append(opening + " />")
+                else:
+                    out.append(f"{opening}>{html.escape(text)}{render(child)}</{tag}>")
+        return "".join(out)
+
+    return render(tree)
+
+
+SCREENS = {
+    "profile": _markup({PROFILE_CARD: ('data-action="profile"', "ООО «Тест» — выбрать организацию")}),
+    "warehouses": _markup({WAREHOUSE_CARD: ('data-action="warehouse"', "Склад №1")}),
+    "order_entry": _markup({ORDER_CODES_BUTTON: ('data-action="order_codes"', "Заказать коды")}),
+    "order_type": _markup({
+        RF_LABEL: ('data-action="rf"', "Производство РФ"),
+        ORDER_TYPE_NEXT: ('data-action="order_type_next"', "Далее"),
+    }),
+    "catalog": _markup({
+        FILL_FROM_CATALOG: ('data-action="fill_from_catalog"', "Наполнить из справочника"),
+        ORDER_NUMBER_CAPTION: ("", "Заказ кодов №"),
+        ORDER_NUMBER_INPUT: ('data-field="order_name"', ""),
+    }) + '<button data-action="catalog_next"><span>Далее к заполнению реквизитов</span></button>',
+    "requisites": (
+        '<div data-test-id="cisTypeField">'
+        '<button data-tid="Button__root" aria-controls="cis-menu" data-action="cis_open">'
+        '<span data-tid="Select__label">Единица товара</span></button>'
+        '<div id="cis-menu" class="menu" style="display:none">'
+        '<div data-action="cis_pick">Единица товара</div><div data-action="cis_pick">Групповая упаковка</div>'
+        '</div></div>'
+        '<button data-action="requisites_next"><span>Далее к загрузке товаров</span></button>'
+    ),
+    "products": (
+        '<div data-test-id="productCatalogSearchInput"><input placeholder="Поиск по справочнику товаров" /></div>'
+        '<div id="search-menu" class="menu"></div>'
+        '<table><tbody id="lines"></tbody></table>'
+        '<div id="products-error" class="error"></div>'
+        '<div data-test-id="codesOrderSendToGISMT"><button data-action="send">Отправить в ГИС МТ</button></div>'
+    ),
+    "sign_cert": '<div class="dialog"><div data-test-id="codesOrderSignCert">'
+                 '<button data-action="sign_cert">Подписать сертификатом</button></div></div>',
+    "sign_send": '<div class="dialog"><div data-test-id="signAndSendToGISMT">'
+                 '<button data-action="sign_send">Подписать и отправить в ГИС МТ</button></div></div>',
+    "done": "<div><h2>Заказ кодов отправлен в ГИС МТ</h2></div>",
+}
+
+# Мастер на странице: экраны переключаются так же, как в SPA портала — без перезагрузки
+APP_JS = r"""
+const CFG = window.MOCK_CONFIG, SCREENS = window.MOCK_SCREENS;
+const root = document.getElementById('root'), modal = document.getElementById('modal');
+let order = {order_name: '', lines: []}, options = [], highlighted = -1, searchTimer = null;
+
+const later = (sec, fn) => setTimeout(fn, sec * 1000);
+const show = (name) => { root.innerHTML = SCREENS[name]; };
+const showModal = (name) => { modal.innerHTML = SCREENS[name]; modal.style.display = 'block'; };
+const hideModal = () => { modal.innerHTML = ''; modal.style.display = 'none'; };
+const searchInput = () => root.querySelector('[data-test-id="productCatalogSearchInput"] input');
+
+function renderOptions(gtins) {
+  options = gtins; highlighted = -1;
+  const menu = document.getElementById('search-menu');
+  if (menu) menu.innerHTML = gtins.map((g) =>
+    `<div data-tid="MenuItem__root" role="option" data-action="pick_option" data-gtin="${g}">${g} — Перчатки медицинские (тест)</div>`).join('');
+}
+
+function addLine(gtin) {
+  renderOptions([]);
+  searchInput().value = '';
+  later(CFG.transition, () => {
+    const row = document.createElement('tr');
+    row.dataset.gtin = gtin;
+    row.innerHTML = `<td>${gtin}</td><td data-test-id="codesQuantityInput"><input value="" /></td>`;
+    document.getElementById('lines').appendChild(row);
+  });
+}
+
+const actions = {
+  profile: () => later(CFG.transition, () => show('warehouses')),
+  warehouse: () => later(CFG.transition, () => show('order_entry')),
+  order_codes: () => later(CFG.transition, () => showModal('order_type')),
+  rf: (el) => el.classList.add('checked'),
+  order_type_next: () => later(CFG.transition, () => {
+    hideModal(); order = {order_name: '', lines: []}; show('catalog');
+  }),
+  fill_from_catalog: (el) => el.classList.toggle('checked'),
+  catalog_next: () => {
+    order.order_name = root.querySelector('[data-field="order_name"]').value;
+    later(CFG.transition, () => show('requisites'));
+  },
+  cis_open: () => { document.getElementById('cis-menu').style.display = 'block'; },
+  cis_pick: (el) => {
+    root.querySelector('[data-tid="Select__label"]').textContent = el.textContent;
+    document.getElementById('cis-menu').style.display = 'none';
+  },
+  requisites_next: () => later(CFG.transition, () => show('products')),
+  pick_option: (el) => addLine(el.dataset.gtin),
+  send: () => {
+    const rows = Array.from(root.querySelectorAll('#lines tr'));
+    order.lines = rows.map((r) => ({gtin: r.dataset.gtin, codes_count: parseInt(r.querySelector('input').value, 10)}));
+    const error = document.getElementById('products-error');
+    if (!order.lines.length || order.lines.some((l) => !(l.codes_count > 0))) {
+      error.textContent = 'Добавьте товары и укажите количество кодов';
+      return;
+    }
+    error.textContent = '';
+    later(CFG.send, () => showModal('sign_cert'));
+  },
+  sign_cert: () => later(CFG.transition, () => showModal('sign_send')),
+  sign_send: () => later(CFG.sign, () => {
+    // страница отправленного заказа (API) подписывает его сама, мастер — отдаёт заказ серверу
+    const request = CFG.sign_url ? fetch(CFG.sign_url, {method: 'POST', body: '{}'})
+                                 : fetch('/_mock/orders', {method: 'POST', body: JSON.stringify(order)});
+    request.finally(() => { hideModal(); show('done'); });
+  }),
+};
+
+document.addEventListener('click', (e) => {
+  // клик может прийти и в кнопку вокруг элемента с действием (поиск по тексту находит button)
+  const el = e.target.closest('[data-action]') || e.target.querySelector('[data-action]');
+  if (el && actions[el.dataset.action]) actions[el.dataset.action](el);
+});
+
+document.addEventListener('input', (e) => {
+  if (!e.target.closest('[data-test-id="productCatalogSearchInput"]')) return;
+  const q = e.target.value.trim();
+  clearTimeout(searchTimer);
+  renderOptions([]);
+  searchTimer = later(CFG.search, () => renderOptions(/^\d{8,14}$/.test(q) ? [q] : []));
+});
+
+document.addEventListener('keydown', (e) => {
+  if (!e.target.closest('[data-test-id="productCatalogSearchInput"]')) return;
+  if (e.key === 'ArrowDown' && options.length) {
+    highlighted = Math.min(highlighted + 1, options.length - 1);
+    e.preventDefault();
+  } else if (e.key === 'Enter' && highlighted >= 0) {
+    addLine(options[highlighted]);
+    e.preventDefault();
+  }
+});
+
+if (CFG.start) showModal(CFG.start); else show(CFG.profile ? 'profile' : 'warehouses');
+"""
+
+PAGE_CSS = """
+@font-face { font-family: "Lab Grotesque"; src: url("/static/fonts/lab-grotesque.woff2") format("woff2"); }
+body { font-family: "Lab Grotesque", sans-serif; margin: 0; }
+.banners img { width: 1px; height: 1px; }
+#root { padding: 16px; }
+#modal { position: fixed; inset: 0; background: rgba(0, 0, 0, .3); display: none; }
+#modal > div { background: #fff; margin: 10vh auto; padding: 16px; width: 480px; }
+.menu > div { padding: 4px; cursor: pointer; }
+.error { color: #c00; }
+.checked { font-weight: bold; }
+"""
+
+
+def render_page(latencies: Dict[str, float], profile: bool = False, **extra) -> str:
+    """
+    Страница портала. Модалки рисуются в /html/body/div[5], как у портала.
+    extra — в конфиг страницы (start — модалка при открытии, sign_url — куда слать подпись).
+    """
+    config = dict(latencies, profile=profile, **extra)
+    return (
+        "<!DOCTYPE html><html><head><meta charset='utf-8'><title>Контур.Маркировка (mock)</title>"
+        f"<style>{PAGE_CSS}</style>"
+        f"<script>window.MOCK_CONFIG = {json.dumps(config)};"
+        f" window.MOCK_SCREENS = {json.dumps(SCREENS, ensure_ascii=False)};</script>"
+        "</head><body>"
+        '<div id="root"></div><div></div><div></div><div></div><div id="modal"></div>'
+        '<p class="banners">' + "".join(f'<img src="/static/img/banner-{n}.png" alt="">' for n in range(6)) + "</p>"
+        '<script src="/static/app.js"></script>'
+        '<script async src="/static/mc.yandex.ru/tag.js"></script>'
+        "</body></html>"
+    )
+
+
+# -----------------------------
+# HTTP-сервер
+# -----------------------------
+class MockKonturServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latencies: Dict[str, float], profile: bool = False):
+        super().__init__(address, _Handler)
+        self.latencies = latencies
+        self.page = render_page(latencies, profile).encode("utf-8")
+        self.stats: Dict[str, int] = {}
+        self.orders: List[Dict] = []
+        self.orders_lock = threading.Lock()
+        # cookie сессий, выданные страницей, и черновики заказов API (номер -> заказ)
+        self.sessions: set = set()
+        self.drafts: Dict[int, Dict] = {}
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+_PIXEL_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: MockKonturServer
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json; charset=utf-8",
+              cache: bool = False, cookie: Optional[str] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if cache:
+            self.send_header("Cache-Control", "public, max-age=86400")
+        if cookie:
+            self.send_header("Set-Cookie", f"{SESSION_COOKIE}={cookie}; Path=/; HttpOnly")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _count(self, kind: str):
+        with self.server.orders_lock:
+            self.server.stats[kind] = self.server.stats.get(kind, 0) + 1
+
+    def do_GET(self):
+        latencies = self.server.latencies
+        if self.path.startswith("/organizations/"):
+            self._count("page")
+            time.sleep(latencies.get("page_load", 0))
+            cookie = None
+            if self._session() is None:
+                cookie = secrets.token_hex(16)
+                with self.server.orders_lock:
+                    self.server.sessions.add(cookie)
+            page = self.server.page
+            match = _ORDER_PAGE_RE.match(self.path)
+            if match:
+                # отправленный заказ: сразу диалог подписи
+                org, order_id = match.groups()
+                page = render_page(latencies, start="sign_cert",
+                                   sign_url=f"/api/v1/organizations/{org}/codes-orders/{order_id}/sign"
+                                   ).encode("utf-8")
+            self._send(200, page, "text/html; charset=utf-8", cookie=cookie)
+        elif self.path == "/static/app.js":
+            self._count("bundle")
+            time.sleep(latencies.get("bundle", 0))
+            self._send(200, APP_JS.encode("utf-8"), "application/javascript; charset=utf-8", cache=True)
+        elif self.path.startswith("/static/"):
+            kind = self.path.rsplit(".", 1)[-1]
+            self._count(kind)
+            time.sleep(latencies.get("asset", 0))
+            if kind == "png":
+                self._send(200, _PIXEL_PNG, "image/png", cache=True)
+            elif kind == "js":
+                self._send(200, b"/* counter */", "application/javascript", cache=True)
+            else:
+                self._send(200, b"\0" * 2048, "font/woff2", cache=True)
+        elif self.path == "/_mock/orders":
+            with self.server.orders_lock:
+                body = json.dumps(self.server.orders, ensure_ascii=False)
+            self._send(200, body.encode("utf-8"))
+        elif self.path == "/_mock/stats":
+            with self.server.orders_lock:
+                body = json.dumps(self.server.stats)
+            self._send(200, body.encode("utf-8"))
+        else:
+            self._send(404, b"{}")
+
+    def _session(self) -> Optional[str]:
+        """Cookie сессии запроса, если её выдал этот сервер."""
+        morsel = SimpleCookie(self.headers.get("Cookie") or "").get(SESSION_COOKIE)
+        with self.server.orders_lock:
+            return morsel.value if morsel and morsel.value in self.server.sessions else None
+
+    def _json(self, status: int, data: Dict):
+        self._send(status, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+    def _api(self, data: Dict):
+        match = _API_RE.match(self.path)
+        if match is None:
+            self._json(404, {"error": "not found"})
+            return
+        self._count("api")
+        if self._session() is None:
+            self._json(401, {"error": "unauthorized"})
+            return
+        latencies = self.server.latencies
+        order_id, action = match.groups()
+        if order_id is None:
+            time.sleep(latencies.get("api", 0))
+            lines = data.get("lines") or []
+            unknown = [line.get("gtin") for line in lines if not _GTIN_RE.match(str(line.get("gtin")))]
+            if unknown:
+                self._json(422, {"error": "unknown_gtins", "unknown_gtins": unknown})
+                return
+            if not lines or any(not isinstance(line.get("codes_count"), int) or line["codes_count"] <= 0
+                                for line in lines):
+                self._json(400, {"error": "Добавьте товары и укажите количество кодов"})
+                return
+            with self.server.orders_lock:
+                new_id = len(self.server.drafts) + 1
+                self.server.drafts[new_id] = {
+                    "order_name": data.get("order_name", ""),
+                    "lines": [{"gtin": line["gtin"], "codes_count": line["codes_count"]} for line in lines],
+                    "state": "draft",
+                }
+            self._json(201, {"id": new_id, "state": "draft"})
+            return
+
+        expected = {"send": "draft", "sign": "sent"}[action]
+        with self.server.orders_lock:
+            draft = self.server.drafts.get(int(order_id))
+            state = draft["state"] if draft else None
+        if draft is None:
+            self._json(404, {"error": "order not found"})
+            return
+        if state != expected:
+            self._json(409, {"error": f"order is {state}"})
+            return
+        time.sleep(latencies.get(action, 0))
+        with self.server.orders_lock:
+            draft["state"] = "sent" if action == "send" else "signed"
+            if action == "sign":
+                self.server.orders.append({"order_name": draft["order_name"], "lines": draft["lines"]})
+        if action == "sign":
+            logging.info(f"[mock] заказ подписан на странице заказа: {draft['order_name']} — строк {len(draft['lines'])}")
+        self._json(200, {"id": int(order_id), "state": draft["state"]})
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if self.path.startswith("/api/"):
+            self._api(data)
+            return
+        if self.path != "/_mock/orders":
+            self._send(404, b"{}")
+            return
+        with self.server.orders_lock:
+            self.server.orders.append(data)
+        logging.info(f"[mock] заказ подписан: {data.get('order_name')} — строк {len(data.get('lines', []))}")
+        self._send(200, b"{}")
+
+    def do_DELETE(self):
+        if self.path != "/_mock/orders":
+            self._send(404, b"{}")
+            return
+        with self.server.orders_lock:
+            self.server.orders.clear()
+            self.server.drafts.clear()
+        self._send(200, b"{}")
+
+    def log_message(self, format, *args):
+        logging.debug("[mock] " + format % args)
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, latencies: Optional[Dict[str, float]] = None,
+                 profile: bool = False) -> MockKonturServer:
+    """Запускает сервер в фоновом потоке (port=0 — свободный порт). Остановка: server.shutdown()."""
+    server = MockKonturServer((host, port), dict(DEFAULT_LATENCIES, **(latencies or {})), profile)
+    threading.Thread(target=server.serve_forever, name="mock-kontur", daemon=True).start()
+    return server
+
+
+def scaled_latencies(scale: float) -> Dict[str, float]:
+    return {k: v * scale for k, v in DEFAULT_LATENCIES.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальная копия мастера заказа кодов Контур.Маркировки")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--scale", type=float, default=1.0, help="множитель задержек портала (0 — без задержек)")
+    parser.add_argument("--profile", action="store_true", help="начинать с экрана выбора организации")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    srv = MockKonturServer((args.host, args.port), scaled_latencies(args.scale), args.profile)
+    print(f"Mock Контур.Маркировки: {srv.base_url} (KONTUR_BASE_URL={srv.base_url})")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,13 @@
+# tests/conftest.py
+"""
+Модульные тесты чистой логики (без браузера и портала): python -m pytest -q
+Модули проекта лежат в корне репозитория — добавляем его в sys.path.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+NOMENCLATURE_XLSX = os.path.join(ROOT, "data", "nomenclature.xlsx")
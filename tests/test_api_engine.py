@@ -0,0 +1,76 @@
+# tests/test_api_engine.py
+"""Заказ через API на mock_kontur (без браузера: драйвер только отдаёт cookie сессии)."""
+import json
+import urllib.request
+from http.cookies import SimpleCookie
+
+import pytest
+
+import journal
+from api_engine import ApiClient, ApiFallback
+from mock_kontur import SESSION_COOKIE, start_server
+
+
+class FakeDriver:
+    def __init__(self, base_url):
+        resp = urllib.request.urlopen(f"{base_url}/organizations/x/warehouses")
+        self.cookie = SimpleCookie(resp.headers["Set-Cookie"])[SESSION_COOKIE].value
+
+    def get_cookies(self):
+        return [{"name": SESSION_COOKIE, "value": self.cookie}]
+
+    def execute_script(self, script):
+        return "pytest"
+
+
+@pytest.fixture
+def server():
+    srv = start_server(latencies={k: 0 for k in ("page_load", "api", "send", "sign")})
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def item(gtin="04650118040564", count=3, lines=None):
+    return {"order_name": "250911 ЭМ 52", "gtin": gtin, "codes_count": count, "lines": lines}
+
+
+def client_for(server, **kwargs):
+    return ApiClient(f"{server.base_url}/api/v1/organizations/x", **kwargs)
+
+
+def test_create_and_send(server):
+    driver = FakeDriver(server.base_url)
+    checkpoints = []
+    ok, msg, order_id = client_for(server).perform_order(
+        item(lines=[{"gtin": "04650118040571", "codes_count": 2}]), lambda: driver,
+        lambda it, state, message="": checkpoints.append(state))
+    assert (ok, order_id) == (True, "1"), msg
+    assert checkpoints == [journal.SENT]
+    assert server.drafts[1]["state"] == "sent"
+    assert server.drafts[1]["lines"] == [{"gtin": "04650118040564", "codes_count": 3},
+                                         {"gtin": "04650118040571", "codes_count": 2}]
+
+
+def test_unknown_gtin_is_item_error(server):
+    driver = FakeDriver(server.base_url)
+    ok, msg, order_id = client_for(server).perform_order(item(gtin="нет"), lambda: driver, lambda *a: None)
+    assert (ok, order_id) == (False, None)
+    assert "НЕ НАЙДЕН" in msg and server.drafts == {}
+
+
+def test_unauthorized_falls_back_and_disables(server):
+    class NoSession(FakeDriver):
+        def get_cookies(self):
+            return [{"name": SESSION_COOKIE, "value": "stale"}]
+
+    driver = NoSession(server.base_url)
+    client = client_for(server, fallback_limit=2)
+    for _ in range(2):
+        assert not client.disabled
+        with pytest.raises(ApiFallback):
+            client.perform_order(item(), lambda: driver, lambda *a: None)
+    assert client.disabled
+    # заказ не создан — подписывать нечего
+    with urllib.request.urlopen(f"{server.base_url}/_mock/orders") as resp:
+        assert json.load(resp) == []
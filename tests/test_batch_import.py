@@ -0,0 +1,86 @@
+# tests/test_batch_import.py
+import pytest
+
+from batch_import import iter_batch_rows, load_batch
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_csv_semicolon_russian_headers(tmp_path):
+    path = write(tmp_path, "batch.csv",
+                 "Заявка;GTIN;Количество кодов;Приоритет\n"
+                 "250911 ЭМ 50;4650118040564;4;\n"
+                 "\n"
+                 "250911 ЭМ 51;4650118040564;2.0;3\n")
+    items, errors = load_batch(path, None)
+    assert errors == []
+    assert [(it.order_name, it.gtin, it.codes_count, it.priority) for it in items] == [
+        ("250911 ЭМ 50", "04650118040564", 4, 0),
+        ("250911 ЭМ 51", "04650118040564", 2, 3),
+    ]
+    assert len({getattr(it, "_uid") for it in items}) == 2
+
+
+def test_csv_comma_english_headers(tmp_path):
+    path = write(tmp_path, "batch.csv", "order_name,gtin,codes_count\nz 1,04650118040564,1\n")
+    rows = list(iter_batch_rows(path))
+    assert rows == [(2, {"order_name": "z 1", "gtin": "04650118040564", "codes_count": "1"})]
+
+
+def test_gtin_numeric_cell_is_zero_padded(tmp_path):
+    path = write(tmp_path, "batch.jsonl", '{"order_name": "z", "gtin": 4650118040564.0, "codes_count": 1}\n')
+    items, errors = load_batch(path, None)
+    assert errors == [] and items[0].gtin == "04650118040564"
+
+
+@pytest.mark.parametrize("count, message", [
+    ("2.7", "неверное количество кодов"),
+    ("nan", "неверное количество кодов"),
+    ("inf", "неверное количество кодов"),
+    ("", "неверное количество кодов"),
+    ("0", "количество кодов должно быть > 0"),
+])
+def test_bad_codes_count(tmp_path, count, message):
+    path = write(tmp_path, "batch.csv", f"order_name;gtin;codes_count\nz;1;{count}\n")
+    items, errors = load_batch(path, None)
+    assert items == []
+    assert [e.line for e in errors] == [2] and errors[0].message.startswith(message)
+
+
+def test_row_errors(tmp_path):
+    path = write(tmp_path, "batch.csv",
+                 "order_name;gtin;codes_count;priority;size\n"
+                 ";1;1;;\n"
+                 "z;1;1;high;\n"
+                 "z;;1;;M\n"
+                 "z;1;1;1.0;\n")
+    items, errors = load_batch(path, None)
+    assert [(e.line, e.message.split(":")[0]) for e in errors] == [
+        (2, "не указана заявка (order_name)"),
+        (3, "неверный приоритет"),
+        (4, "нужен GTIN или упрощенно + размер + единиц в упаковке"),
+    ]
+    assert [it.priority for it in items] == [1]
+
+
+def test_jsonl_bad_lines(tmp_path):
+    path = write(tmp_path, "batch.jsonl",
+                 '{"order_name": "z", "gtin": "1", "codes_count": 1}\n'
+                 "{oops\n"
+                 "[1, 2]\n"
+                 "\n"
+                 '{"заявка": "y", "gtin": "2", "кодов": "3"}\n')
+    items, errors = load_batch(path, None)
+    assert [e.line for e in errors] == [2, 3]
+    assert errors[0].message.startswith("неверный JSON")
+    assert "JSON-объектом" in errors[1].message
+    assert [(it.order_name, it.codes_count) for it in items] == [("z", 1), ("y", 3)]
+
+
+def test_unsupported_extension(tmp_path):
+    with pytest.raises(ValueError):
+        list(iter_batch_rows(write(tmp_path, "batch.txt", "")))
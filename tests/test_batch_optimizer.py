@@ -0,0 +1,83 @@
+# tests/test_batch_optimizer.py
+import pytest
+
+from backend import OrderItem
+from batch_optimizer import coalesce_items, expand_result, merge_order_names
+
+
+def item(uid, gtin, count, order="250911 ЭМ 52", priority=0):
+    it = OrderItem(order_name=order, simpl_name="нитрил", size="M", units_per_pack="100",
+                   codes_count=count, gtin=gtin, priority=priority)
+    setattr(it, "_uid", uid)
+    return it
+
+
+def uids(items):
+    return [getattr(it, "_uid") for it in items]
+
+
+def test_merge_order_names():
+    assert merge_order_names(["250911 ЭМ (Петров) 52", "250911 ЭМ (Петров) 53"]) == "250911 ЭМ (Петров) 52, 53"
+    assert merge_order_names(["a 1", "a 1"]) == "a 1"
+    assert merge_order_names(["x", "y"]) == "x, y"
+
+
+def test_gtin_policy_sums_counts_across_orders():
+    items = [item("a", "1", 3, "z 1"), item("b", "2", 5), item("c", "1", 4, "z 2", priority=2)]
+    merged, mapping = coalesce_items(items, "gtin")
+    assert len(merged) == 2
+    first = merged[0]
+    assert (first.gtin, first.codes_count, first.order_name, first.priority) == ("1", 7, "z 1, 2", 2)
+    assert uids(mapping[getattr(first, "_uid")]) == ["a", "c"]
+    # одиночная позиция остаётся как есть, со своим uid
+    assert merged[1] is items[1] and uids(mapping["b"]) == ["b"]
+
+
+def test_gtin_order_policy_keeps_orders_apart():
+    items = [item("a", "1", 3, "z 1"), item("b", "1", 4, "z 2"), item("c", "1", 1, "z 1")]
+    merged, _ = coalesce_items(items, "gtin_order")
+    assert [(m.order_name, m.codes_count) for m in merged] == [("z 1", 4), ("z 2", 4)]
+
+
+def test_order_lines_policy_builds_multi_line_orders():
+    items = [item("a", "1", 3), item("b", "2", 5), item("c", "1", 2)]
+    merged, mapping = coalesce_items(items, "order_lines")
+    assert len(merged) == 1
+    m = merged[0]
+    assert (m.gtin, m.codes_count) == ("1", 5)
+    assert m.lines == [{"gtin": "2", "codes_count": 5}]
+    assert sorted(uids(mapping[getattr(m, "_uid")])) == ["a", "b", "c"]
+
+
+def test_multi_line_orders_split_by_max_lines():
+    items = [item(str(n), str(n), 1) for n in range(5)] + [item("x", "0", 2)]
+    merged, _ = coalesce_items(items, "batch_lines", max_lines=2)
+    assert [1 + len(m.lines) for m in merged] == [2, 2, 1]
+    # позиции одного GTIN — в одном заказе
+    assert (merged[0].gtin, merged[0].codes_count) == ("0", 3)
+
+
+def test_items_without_gtin_are_not_merged():
+    items = [item("a", "", 1), item("b", "", 2)]
+    merged, _ = coalesce_items(items, "gtin")
+    assert uids(merged) == ["a", "b"]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        coalesce_items([], "by_color")
+
+
+def test_expand_result_reports_every_member():
+    items = [item("a", "1", 3), item("b", "1", 4)]
+    merged, mapping = coalesce_items(items, "gtin")
+    results = expand_result(False, "ошибка", merged[0], mapping)
+    assert [(ok, getattr(it, "_uid")) for ok, _, it in results] == [(False, "a"), (False, "b")]
+    assert all(msg.startswith("ошибка [в составе объединённого заказа") for _, msg, _ in results)
+
+
+def test_expand_result_single_or_without_mapping():
+    single = item("a", "1", 3)
+    assert expand_result(True, "OK", single, None) == [(True, "OK", single)]
+    _, mapping = coalesce_items([single], "gtin")
+    assert expand_result(True, "OK", single, mapping) == [(True, "OK", single)]
@@ -0,0 +1,54 @@
+# tests/test_dispatcher.py
+from backend import OrderItem, URGENT_PRIORITY
+from dispatcher import Dispatcher, TokenBucket, priority_of
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def item(order_name="заявка", priority=0):
+    return OrderItem(order_name=order_name, simpl_name="s", size="M", units_per_pack="1",
+                     codes_count=1, gtin="1", priority=priority)
+
+
+def test_bucket_burst_then_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, burst=3, clock=clock, sleep=clock.sleep)
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.acquire() == 0.5
+    assert bucket.acquire() == 0.5
+
+
+def test_bucket_refills_while_idle_up_to_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1.0, burst=2, clock=clock, sleep=clock.sleep)
+    bucket.acquire(), bucket.acquire()
+    clock.now += 100
+    assert [bucket.acquire() for _ in range(2)] == [0.0, 0.0]
+    assert bucket.acquire() == 1.0
+
+
+def test_priority_of_urgent_marker():
+    assert priority_of(item(priority=3)) == 3
+    assert priority_of(item("СРОЧНО 250911", priority=1)) == 1 + URGENT_PRIORITY
+
+
+def test_dispatcher_orders_by_priority_stably():
+    items = [item("a"), item("b", 5), item("c"), item("срочно d")]
+    dispatcher = Dispatcher(items, rate_per_min=None, max_in_flight=4)
+    order = []
+    for idx, it in dispatcher:
+        order.append(idx)
+        dispatcher.done()
+    assert order == [3, 1, 0, 2]
+    assert len(dispatcher) == 4 and dispatcher.waited == 0
@@ -0,0 +1,32 @@
+# tests/test_journal.py
+from journal import DONE, FAILED, QUEUED, SENT, SIGNED, Journal
+
+
+def test_run_state(tmp_path):
+    j = Journal(str(tmp_path / "journal.sqlite3"))
+    try:
+        j.record("r1", "a", QUEUED, payload={"gtin": "1"})
+        j.record("r1", "b", QUEUED, payload={"gtin": "2"})
+        j.record("r1", "a", SENT)
+        j.record("r1", "a", FAILED, "не подписан")
+        j.record("r1", "b", SENT)
+        j.record("r1", "b", SIGNED)
+        j.record("r1", "b", DONE, "OK")
+        j.record("r2", "c", QUEUED)
+        j.record("r1", None, DONE)   # без uid — не пишется
+
+        state = j.run_state("r1")
+        assert [e["uid"] for e in state] == ["a", "b"]
+        a, b = state
+        assert (a["state"], a["message"], a["sent"], a["signed"], a["payload"]) == (
+            FAILED, "не подписан", True, False, {"gtin": "1"})
+        assert (b["state"], b["sent"], b["signed"]) == (DONE, True, True)
+        assert [e["sent"] for e in j.run_state("r2")] == [False]
+
+        assert j.has_state("r1", "a", SENT)
+        assert not j.has_state("r1", "a", SIGNED)
+        assert not j.has_state("r2", "a", QUEUED)
+        assert not j.has_state("r1", None, QUEUED)
+        assert j.last_run_id() == "r2"
+    finally:
+        j.close()
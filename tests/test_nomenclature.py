@@ -0,0 +1,178 @@
+# tests/test_nomenclature.py
+import os
+import random
+import shutil
+
+import pandas as pd
+import pytest
+
+import backend
+from backend import NomenclatureIndex
+from conftest import NOMENCLATURE_XLSX
+
+
+def reference_lookup(df: pd.DataFrame, simpl_name, size, units_per_pack, color=None, venchik=None):
+    """Прежний lookup_gtin (полный проход по таблице) — эталон для индекса.
+    Отличие одно: в частичном поиске колонка 'венчик' (в старом коде — 'Венчик', KeyError)."""
+    simpl = simpl_name.strip().lower()
+    size_l = str(size).strip().lower()
+    units_str = str(units_per_pack).strip()
+    color_l = color.strip().lower() if color else None
+    venchik_l = venchik.strip().lower() if venchik else None
+
+    def norm(col, lower=True):
+        s = df[col].astype(str).str.strip()
+        return s.str.lower() if lower else s
+
+    cond = (norm(backend.COL_SIMPL) == simpl) & norm(backend.COL_SIZE).str.contains(size_l, regex=False) \
+        & (norm(backend.COL_UNITS, lower=False) == units_str)
+    if venchik_l:
+        cond &= norm(backend.COL_VENCHIK) == venchik_l
+    if color_l:
+        cond &= norm(backend.COL_COLOR) == color_l
+    matches = df[cond]
+    if matches.empty:
+        cond2 = norm(backend.COL_SIMPL).str.contains(simpl, regex=False) \
+            & norm(backend.COL_SIZE).str.contains(size_l, regex=False)
+        if venchik_l:
+            cond2 &= norm(backend.COL_VENCHIK) == venchik_l
+        if color_l:
+            cond2 &= norm(backend.COL_COLOR) == color_l
+        matches = df[cond2]
+    if matches.empty:
+        return None
+    return str(matches.iloc[0][backend.COL_GTIN]).strip()
+
+
+@pytest.fixture(scope="module")
+def nomenclature_df():
+    if not os.path.exists(NOMENCLATURE_XLSX):
+        pytest.skip("нет data/nomenclature.xlsx")
+    df = pd.read_excel(NOMENCLATURE_XLSX)
+    df.columns = df.columns.str.strip()
+    return df
+
+
+@pytest.fixture(scope="module")
+def index(nomenclature_df):
+    return NomenclatureIndex.from_dataframe(nomenclature_df)
+
+
+def _text(value):
+    return "" if value != value else str(value)  # NaN -> ""
+
+
+@pytest.fixture(scope="module")
+def queries(nomenclature_df):
+    """Запросы по строкам справочника: точные, с частью названия/размера, с чужими единицами."""
+    rng = random.Random(1)
+    rows = nomenclature_df.sample(n=150, random_state=1)
+    out = []
+    for _, r in rows.iterrows():
+        simpl, size = _text(r[backend.COL_SIMPL]), _text(r[backend.COL_SIZE])
+        units = _text(r[backend.COL_UNITS])
+        color = _text(r[backend.COL_COLOR]) or None
+        venchik = _text(r[backend.COL_VENCHIK]) or None
+        out.append((simpl, size, units, color, venchik))
+        out.append((simpl.split()[0], size[-3:], units, None, None))
+        out.append((simpl.upper(), size, "999", color, venchik))
+        out.append((simpl, size, units, rng.choice(["синий", "черный"]), None))
+    out.append(("нет такого товара", "M", "1", None, None))
+    return out
+
+
+def test_lookup_matches_reference(nomenclature_df, index, queries):
+    for q in queries:
+        gtin, _ = index.lookup(*q)
+        assert gtin == reference_lookup(nomenclature_df, *q), q
+
+
+def test_lookup_gtin_accepts_dataframe(nomenclature_df, queries):
+    q = queries[0]
+    assert backend.lookup_gtin(nomenclature_df, *q)[0] == reference_lookup(nomenclature_df, *q)
+
+
+def test_resolve_bulk_matches_lookup(index, queries):
+    requests = pd.DataFrame(
+        [{"simpl_name": s, "size": z, "units_per_pack": u, "color": c, "venchik": v} for s, z, u, c, v in queries]
+    )
+    resolved, missing = index.resolve_bulk(requests)
+    for pos, q in enumerate(queries):
+        expected, _ = index.lookup(*q)
+        assert resolved.at[pos, "gtin"] == expected, q
+        assert (pos in missing) == (expected is None)
+
+
+def test_lookup_without_optional_columns():
+    df = pd.DataFrame({backend.COL_GTIN: ["1", "2"], backend.COL_SIMPL: ["Нитрил", "Латекс"],
+                       backend.COL_SIZE: ["M", "L"], backend.COL_UNITS: [100, 50]})
+    index = NomenclatureIndex.from_dataframe(df)
+    assert index.lookup("латекс", "l", "50") == ("2", "")
+    assert index.lookup("нитрил", "m", "1") == ("1", "")   # частичный поиск без единиц
+    assert list(df.columns) == [backend.COL_GTIN, backend.COL_SIMPL, backend.COL_SIZE, backend.COL_UNITS]
+
+
+# -----------------------------
+# Кэш справочника
+# -----------------------------
+@pytest.fixture
+def xlsx_copy(tmp_path):
+    if not os.path.exists(NOMENCLATURE_XLSX):
+        pytest.skip("нет data/nomenclature.xlsx")
+    path = tmp_path / "nomenclature.xlsx"
+    shutil.copy2(NOMENCLATURE_XLSX, path)
+    return str(path), str(tmp_path / "nomenclature.cache.pkl")
+
+
+def _count_excel_reads(monkeypatch):
+    reads = []
+    original = NomenclatureIndex.from_excel.__func__
+
+    def from_excel(cls, path=backend.NOMENCLATURE_XLSX):
+        reads.append(path)
+        return original(cls, path)
+
+    monkeypatch.setattr(NomenclatureIndex, "from_excel", classmethod(from_excel))
+    return reads
+
+
+def test_cache_reused_while_file_unchanged(xlsx_copy, monkeypatch):
+    path, cache = xlsx_copy
+    reads = _count_excel_reads(monkeypatch)
+    first = NomenclatureIndex.load(path, cache)
+    second = NomenclatureIndex.load(path, cache)
+    assert len(reads) == 1
+    assert second.gtins == first.gtins
+
+
+def test_cache_survives_touch_without_changes(xlsx_copy, monkeypatch):
+    path, cache = xlsx_copy
+    reads = _count_excel_reads(monkeypatch)
+    NomenclatureIndex.load(path, cache)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    NomenclatureIndex.load(path, cache)
+    assert len(reads) == 1   # sha256 тот же — xlsx не перечитывается
+
+
+def test_cache_rebuilt_when_file_changes(xlsx_copy, monkeypatch, tmp_path):
+    path, cache = xlsx_copy
+    reads = _count_excel_reads(monkeypatch)
+    NomenclatureIndex.load(path, cache)
+    df = pd.DataFrame({backend.COL_GTIN: ["4650118040564"], backend.COL_SIMPL: ["тест"],
+                       backend.COL_SIZE: ["M"], backend.COL_UNITS: ["1"]})
+    df.to_excel(path, index=False)
+    index = NomenclatureIndex.load(path, cache)
+    assert len(reads) == 2
+    assert index.lookup("тест", "m", "1")[0] == "4650118040564"
+
+
+def test_corrupt_or_old_cache_is_ignored(xlsx_copy, monkeypatch):
+    path, cache = xlsx_copy
+    reads = _count_excel_reads(monkeypatch)
+    with open(cache, "wb") as f:
+        f.write(b"not a pickle")
+    NomenclatureIndex.load(path, cache)
+    monkeypatch.setattr(backend, "NOMENCLATURE_CACHE_VERSION", backend.NOMENCLATURE_CACHE_VERSION + 1)
+    NomenclatureIndex.load(path, cache)
+    assert len(reads) == 2
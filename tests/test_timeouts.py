@@ -0,0 +1,70 @@
+# tests/test_timeouts.py
+import pytest
+
+import timeouts
+from timeouts import AdaptiveTimeouts
+
+
+@pytest.fixture
+def controller(tmp_path):
+    return AdaptiveTimeouts(str(tmp_path / "latency.sqlite3"))
+
+
+def feed(controller, step, duration, n=timeouts.MIN_SAMPLES):
+    for _ in range(n):
+        controller.observe(step, duration)
+
+
+def test_default_until_enough_samples(controller):
+    feed(controller, "page_ready", 0.1, timeouts.MIN_SAMPLES - 1)
+    assert controller.budget("page_ready", 20) == 20
+    controller.observe("page_ready", 0.1)
+    assert controller.budget("page_ready", 20) == timeouts.MIN_BUDGET
+
+
+def test_disabled_returns_default(tmp_path):
+    controller = AdaptiveTimeouts(str(tmp_path / "latency.sqlite3"), enabled=False)
+    feed(controller, "page_ready", 0.1)
+    assert controller.budget("page_ready", 20) == 20
+
+
+def test_learned_budget_clamped(controller):
+    feed(controller, "fast", 1.0)
+    assert controller.budget("fast", 20) == pytest.approx(1.0 * timeouts.MARGIN + timeouts.SLACK)
+    feed(controller, "slow", 50.0)
+    assert controller.budget("slow", 10) == 10 * timeouts.MAX_FACTOR
+
+
+def test_floor_steps_never_below_default(controller):
+    feed(controller, "sign_dialog", 0.1)
+    assert controller.budget("sign_dialog", 15) == 15
+
+
+def test_backoff_after_timeout(controller):
+    feed(controller, "page_ready", 1.0)
+    learned = controller.budget("page_ready", 20)
+    controller.observe("page_ready", learned, ok=False)
+    assert controller.budget("page_ready", 20) == pytest.approx(learned * timeouts.BACKOFF)
+    for _ in range(10):
+        controller.observe("page_ready", learned, ok=False)
+    # не дольше таймаута из кода
+    assert controller.budget("page_ready", 20) == 20
+    controller.observe("page_ready", 1.0)
+    assert controller.budget("page_ready", 20) == pytest.approx(learned)
+
+
+def test_wait_records_timeout(controller):
+    feed(controller, "page_ready", 1.0)
+    learned = controller.budget("page_ready", 20)
+    with pytest.raises(TimeoutError):
+        with controller.wait("page_ready", 20, TimeoutError) as budget:
+            assert budget == learned
+            raise TimeoutError
+    assert controller.budget("page_ready", 20) > learned
+
+
+def test_samples_persist(controller, tmp_path):
+    feed(controller, "page_ready", 1.0)
+    controller.flush()
+    fresh = AdaptiveTimeouts(controller.path)
+    assert fresh.budget("page_ready", 20) == controller.budget("page_ready", 20)
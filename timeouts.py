@@ -0,0 +1,210 @@
+# timeouts.py
+"""
+Адаптивные таймауты ожиданий мастера заказа.
+
+Каждое ожидание (элемент по имени локатора, переход экрана, загрузка
+страницы...) сообщает, сколько оно заняло. Успешные замеры копятся по шагу
+(последние WINDOW) и сохраняются в runs/latency.sqlite3 между запусками.
+Бюджет шага — p99 замеров * MARGIN + SLACK, но не меньше MIN_BUDGET и не
+больше MAX_FACTOR * заданный в коде таймаут. Пока замеров меньше MIN_SAMPLES,
+действует заданный в коде таймаут.
+
+Быстрый портал — бюджет сжимается и сломанный шаг падает за секунды, а не за
+10-20 с; медленный — бюджет растёт вслед за замерами. После таймаута бюджет
+шага увеличивается в BACKOFF раз (до заданного в коде), после успеха
+возвращается к выученному. Ожидания после "Отправить в ГИС МТ" и подписи
+(FLOOR_STEPS) не сжимаются ниже заданного в коде: поспешный таймаут там
+стоит неподтверждённой отправки или подписи, а не пары секунд.
+
+    el = locators.find(driver, "send_button", timeout=10)   # 10 — таймаут по умолчанию
+    python timeouts.py                                       # выученные бюджеты по шагам
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional
+
+import timing
+from backend import ADAPTIVE_TIMEOUTS
+
+LATENCY_DB_PATH = os.path.join("runs", "latency.sqlite3")
+
+WINDOW = 100          # последних успешных замеров на шаг
+MIN_SAMPLES = 10      # меньше замеров — бюджет = таймаут по умолчанию
+MARGIN = 2.0          # запас к p99
+SLACK = 1.0           # + сек (пауза GC, медленный кадр браузера)
+MIN_BUDGET = 2.0      # сек, меньше не ждём никогда
+MAX_FACTOR = 2.0      # не больше MAX_FACTOR * таймаут по умолчанию
+BACKOFF = 1.5         # множитель бюджета после каждого таймаута подряд
+FLUSH_EVERY = 50      # замеров в буфере до записи в SQLite
+
+# шаги, бюджет которых не меньше таймаута из кода (только растёт по замерам)
+FLOOR_STEPS = frozenset({
+    "sign_dialog", "sign_cert_button", "sign_send_button", "sign_close",
+    "screen_transition:products", "screen_transition:signing",
+})
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts       REAL NOT NULL,
+    step     TEXT NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS samples_step ON samples (step, id);
+"""
+
+
+class AdaptiveTimeouts:
+    def __init__(self, path: str = LATENCY_DB_PATH, enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._samples: Optional[Dict[str, Deque[float]]] = None
+        self._timeouts: Dict[str, int] = {}   # шаг -> таймаутов подряд
+        self._pending: List[tuple] = []
+        self._pid: Optional[int] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def _loaded(self) -> Dict[str, Deque[float]]:
+        # замеры прошлых запусков читаем один раз на процесс (воркеры — каждый свои)
+        if self._samples is None or self._pid != os.getpid():
+            samples: Dict[str, Deque[float]] = {}
+            try:
+                conn = self._connect()
+                try:
+                    rows = conn.execute(
+                        "SELECT step, duration FROM (SELECT step, duration, id, ROW_NUMBER() OVER "
+                        "(PARTITION BY step ORDER BY id DESC) AS n FROM samples) WHERE n <= ? ORDER BY id",
+                        (WINDOW,),
+                    ).fetchall()
+                finally:
+                    conn.close()
+                for step, duration in rows:
+                    samples.setdefault(step, deque(maxlen=WINDOW)).append(duration)
+            except Exception:
+                logging.warning(f"Замеры таймаутов {self.path} не прочитаны — начинаем с нуля", exc_info=True)
+            self._samples, self._pid, self._pending = samples, os.getpid(), []
+        return self._samples
+
+    def budget(self, step: str, default: float) -> float:
+        """Сколько ждать шаг step (default — таймаут, заданный в коде)."""
+        if not self.enabled:
+            return default
+        with self._lock:
+            values = self._loaded().get(step)
+            streak = self._timeouts.get(step, 0)
+        if not values or len(values) < MIN_SAMPLES:
+            return default
+        learned = timing.percentile(sorted(values), 99) * MARGIN + SLACK
+        learned = min(max(learned, MIN_BUDGET), default * MAX_FACTOR)
+        if step in FLOOR_STEPS:
+            learned = max(learned, default)
+        if streak:
+            # после таймаута — осторожнее, но не дольше заданного в коде (если выученный меньше)
+            return max(learned, min(learned * BACKOFF ** streak, default))
+        return learned
+
+    def observe(self, step: str, duration: float, ok: bool = True):
+        """Итог ожидания: ok — дождались за duration сек, иначе — таймаут."""
+        with self._lock:
+            samples = self._loaded()
+            if not ok:
+                self._timeouts[step] = self._timeouts.get(step, 0) + 1
+                return
+            self._timeouts.pop(step, None)
+            samples.setdefault(step, deque(maxlen=WINDOW)).append(duration)
+            self._pending.append((time.time(), step, round(duration, 4)))
+            flush = len(self._pending) >= FLUSH_EVERY
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """Сохраняет накопленные замеры (конец позиции, выход из процесса)."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        try:
+            conn = self._connect()
+            try:
+                conn.executemany("INSERT INTO samples (ts, step, duration) VALUES (?, ?, ?)", pending)
+                # старше окна замеры не нужны
+                conn.execute(
+                    "DELETE FROM samples WHERE id IN (SELECT id FROM (SELECT id, ROW_NUMBER() OVER "
+                    "(PARTITION BY step ORDER BY id DESC) AS n FROM samples) WHERE n > ?)",
+                    (WINDOW,),
+                )
+            finally:
+                conn.close()
+        except Exception:
+            logging.warning(f"Не удалось сохранить замеры таймаутов в {self.path}", exc_info=True)
+
+    @contextmanager
+    def wait(self, step: str, default: float, expected=Exception):
+        """
+        with controller.wait("page_ready", 20) as budget: WebDriverWait(driver, budget)...
+        Исключение expected (обычно TimeoutException) считается таймаутом шага.
+        """
+        t0 = time.perf_counter()
+        try:
+            yield self.budget(step, default)
+        except expected:
+            self.observe(step, time.perf_counter() - t0, ok=False)
+            raise
+        self.observe(step, time.perf_counter() - t0)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Шаг -> {n, p50, p99, budget} (budget — при таймауте по умолчанию 10 с)."""
+        with self._lock:
+            samples = {step: sorted(v) for step, v in self._loaded().items()}
+        return {
+            step: {
+                "n": len(values),
+                "p50": timing.percentile(values, 50),
+                "p99": timing.percentile(values, 99),
+                "budget": round(self.budget(step, 10), 2),
+            }
+            for step, values in samples.items()
+        }
+
+
+# контроллер текущего процесса
+controller = AdaptiveTimeouts(enabled=ADAPTIVE_TIMEOUTS)
+
+
+def budget(step: str, default: float) -> float:
+    return controller.budget(step, default)
+
+
+def observe(step: str, duration: float, ok: bool = True):
+    controller.observe(step, duration, ok)
+
+
+def wait(step: str, default: float, expected=Exception):
+    return controller.wait(step, default, expected)
+
+
+def flush():
+    controller.flush()
+
+
+if __name__ == "__main__":
+    stats = controller.stats()
+    if not stats:
+        print(f"Нет замеров ({LATENCY_DB_PATH}).")
+        raise SystemExit(0)
+    width = max([len("шаг")] + [len(step) for step in stats])
+    print(f"{'шаг'.ljust(width)}  {'n':>4}  {'p50':>7}  {'p99':>7}  {'бюджет@10с':>10}")
+    for step, st in sorted(stats.items()):
+        print(f"{step.ljust(width)}  {st['n']:>4}  {st['p50']:>7.2f}  {st['p99']:>7.2f}  {st['budget']:>10.2f}")
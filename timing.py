@@ -0,0 +1,202 @@
+# timing.py
+"""
+Замеры времени шагов мастера заказа.
+
+Каждый прогон пишет трассу в runs/<run_id>/trace-<pid>.jsonl — по строке на
+шаг: {"run_id", "uid", "step", "start", "duration", "ok", "pid"}. Файл свой у
+каждого процесса, поэтому параллельные воркеры не мешают друг другу.
+В конце прогона по трассе строится сводка p50/p95/max по шагам.
+
+Сравнить прогоны: python timing.py runs/<run_a> [runs/<run_b>]
+"""
+import os
+import sys
+import json
+import math
+import time
+import glob
+import uuid
+import logging
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+RUNS_DIR = "runs"
+
+# завершение шагов span() — в общий лог (logs.py: поля step/duration/ok)
+_log = logging.getLogger("timing")
+
+# uid позиции, которая сейчас выполняется в этом потоке (см. order())
+_current_uid: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("kontur_uid", default=None)
+# самый вложенный шаг span(), который сейчас выполняется в этом потоке (для логов)
+_current_step: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("kontur_step", default=None)
+
+_run_id: Optional[str] = None
+_run_dir: Optional[str] = None
+
+
+def start_run(run_id: Optional[str] = None) -> str:
+    """Начинает новый прогон: создаёт runs/<run_id>/ и возвращает путь к нему."""
+    # суффикс — чтобы прогоны, начатые в одну секунду (пачки демона), не слились в журнале
+    run_id = run_id or f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    run_dir = os.path.join(RUNS_DIR, run_id)
+    os.makedirs(run_dir, exist_ok=True)
+    attach_run(run_dir)
+    logging.info(f"Прогон {run_id}: трасса шагов в {run_dir}")
+    return run_dir
+
+
+def attach_run(run_dir: Optional[str]):
+    """Подключает процесс (например, воркер) к уже начатому прогону."""
+    global _run_id, _run_dir
+    _run_dir = run_dir
+    _run_id = os.path.basename(run_dir) if run_dir else None
+
+
+def current_run_dir() -> Optional[str]:
+    return _run_dir
+
+
+def current_uid() -> Optional[str]:
+    return _current_uid.get()
+
+
+def current_step() -> Optional[str]:
+    return _current_step.get()
+
+
+@contextmanager
+def order(uid: Optional[str]):
+    """Все span() внутри относятся к позиции uid."""
+    token = _current_uid.set(uid)
+    try:
+        yield
+    finally:
+        _current_uid.reset(token)
+
+
+def record(step: str, start: float, duration: float, ok: bool = True, uid: Optional[str] = None):
+    """Записывает готовый замер в трассу текущего прогона."""
+    if _run_dir is None:
+        return
+    rec = {
+        "run_id": _run_id,
+        "uid": uid if uid is not None else _current_uid.get(),
+        "step": step,
+        "start": round(start, 3),
+        "duration": round(duration, 4),
+        "ok": ok,
+        "pid": os.getpid(),
+    }
+    try:
+        with open(os.path.join(_run_dir, f"trace-{os.getpid()}.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    except Exception:
+        logging.exception("Не удалось записать замер в трассу")
+
+
+@contextmanager
+def span(step: str, uid: Optional[str] = None):
+    """Замер шага: with span("gtin_search"): ... (ok=False, если шаг упал с исключением)."""
+    start = time.time()
+    t0 = time.perf_counter()
+    token = _current_step.set(step)
+    ok = True
+    try:
+        yield
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        _current_step.reset(token)
+        duration = time.perf_counter() - t0
+        record(step, start, duration, ok, uid)
+        _log.info(f"{step}: {duration:.3f} с{'' if ok else ' (ошибка)'}",
+                  extra={"step": step, "duration": round(duration, 4), "ok": ok, "uid": uid or _current_uid.get()})
+
+
+def load_spans(run_dir: str) -> List[Dict]:
+    spans = []
+    for path in sorted(glob.glob(os.path.join(run_dir, "trace-*.jsonl"))):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    spans.append(json.loads(line))
+    spans.sort(key=lambda r: r["start"])
+    return spans
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    # nearest-rank: без интерполяции, на малых выборках честнее
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def summarize(spans: List[Dict]) -> Dict[str, Dict]:
+    """Шаг -> {count, errors, p50, p95, max, total} (секунды), в порядке первого появления шага."""
+    by_step: Dict[str, List[Dict]] = {}
+    for r in spans:
+        by_step.setdefault(r["step"], []).append(r)
+    summary = {}
+    for step, recs in by_step.items():
+        values = sorted(r["duration"] for r in recs)
+        summary[step] = {
+            "count": len(values),
+            "errors": sum(1 for r in recs if not r.get("ok", True)),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "max": values[-1],
+            "total": round(sum(values), 4),
+        }
+    return summary
+
+
+def format_summary(summary: Dict[str, Dict]) -> str:
+    if not summary:
+        return "Нет замеров."
+    width = max(len("шаг"), *(len(step) for step in summary))
+    lines = [f"{'шаг'.ljust(width)}  {'n':>4}  {'ошиб':>4}  {'p50':>7}  {'p95':>7}  {'max':>7}"]
+    for step, st in summary.items():
+        lines.append(f"{step.ljust(width)}  {st['count']:>4}  {st['errors']:>4}  "
+                     f"{st['p50']:>7.2f}  {st['p95']:>7.2f}  {st['max']:>7.2f}")
+    return "\n".join(lines)
+
+
+def finish_run(run_dir: Optional[str] = None) -> Dict[str, Dict]:
+    """Строит сводку по трассе прогона, сохраняет её в summary.json и возвращает."""
+    run_dir = run_dir or _run_dir
+    if not run_dir:
+        return {}
+    summary = summarize(load_spans(run_dir))
+    try:
+        with open(os.path.join(run_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    except Exception:
+        logging.exception("Не удалось сохранить summary.json")
+    return summary
+
+
+def _compare(run_a: str, run_b: str) -> str:
+    a = summarize(load_spans(run_a))
+    b = summarize(load_spans(run_b))
+    steps = list(dict.fromkeys(list(a) + list(b)))
+    width = max(len("шаг"), *(len(s) for s in steps))
+    lines = [f"{'шаг'.ljust(width)}  {'p50 A':>7}  {'p50 B':>7}  {'p95 A':>7}  {'p95 B':>7}"]
+    for step in steps:
+        sa, sb = a.get(step, {}), b.get(step, {})
+        cells = [f"{st[k]:>7.2f}" if k in st else f"{'-':>7}" for st, k in ((sa, "p50"), (sb, "p50"), (sa, "p95"), (sb, "p95"))]
+        lines.append(f"{step.ljust(width)}  " + "  ".join(cells))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 2:
+        print(format_summary(summarize(load_spans(sys.argv[1]))))
+    elif len(sys.argv) == 3:
+        print(_compare(sys.argv[1], sys.argv[2]))
+    else:
+        print("Использование: python timing.py <run_dir> [<run_dir_to_compare>]")
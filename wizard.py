@@ -0,0 +1,1086 @@
+# wizard.py
+"""
+Браузерная часть: запуск драйвера, сессии и пул браузеров, мастер заказа
+кодов (экраны и их обработчики), параллельное выполнение.
+
+Импортирует Selenium, поэтому main.py подключает модуль только перед
+выполнением позиций (или в фоне, при прогреве браузера), а не при старте.
+Настройки — в backend.py.
+"""
+import os
+import time
+import logging
+import queue
+import shutil
+import tempfile
+import threading
+import multiprocessing
+import multiprocessing.util
+from contextlib import contextmanager
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from urllib.parse import urlsplit
+from typing import Callable, List, Dict, Optional, Tuple
+
+# selenium
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.common.action_chains import ActionChains
+from selenium.common.exceptions import (
+    TimeoutException, StaleElementReferenceException,
+    ElementClickInterceptedException, ElementNotInteractableException,
+)
+
+import timing
+import journal
+import logs
+import locators
+import timeouts
+import artifacts
+import api_engine
+from dispatcher import Dispatcher
+from backend import (
+    YANDEX_DRIVER_PATH, YANDEX_BROWSER_PATH, USER_DATA_DIR, PROFILE_DIRECTORY, ORDER_ENTRY_URL,
+    GTIN_OPTION_SELECTOR, SESSION_MAX_ORDERS, PREWARM_MAX_AGE, HEADLESS, LAUNCH_PROFILE,
+    BLOCKED_URL_PATTERNS, BROWSER_CACHE_DIR, DISABLE_EXTENSIONS, PERFORMANCE_ARGS, PARALLEL_WORKERS,
+    DISPATCH_MAX_IN_FLIGHT,
+    SETTLE_DELAYS, TYPE_CHAR_DELAY, PRODUCTS_FILL_MODE,
+    STEP_RETRY_ATTEMPTS, RETRY_DELAY, RETRY_MAX_DELAY, RETRY_FIND_TIMEOUT, ORDER_RESTARTS, ORDER_ENGINE, API_ORDER_URL,
+    OrderItem, order_lines, ui_print, setup_logging, browser_not_found,
+)
+
+
+# -----------------------------
+# Browser: драйвер, сессия и пул сессий
+# -----------------------------
+def build_driver_options(user_data_dir: str = USER_DATA_DIR,
+                         profile_directory: str = PROFILE_DIRECTORY) -> Options:
+    options = Options()
+    # пустой путь — браузер по умолчанию (Chrome), например для bench.py
+    if YANDEX_BROWSER_PATH:
+        options.binary_location = YANDEX_BROWSER_PATH
+
+    # headless (background) — используй современный режим, если поддерживается
+    if HEADLESS:
+        # New headless mode
+        options.add_argument("--headless=new")
+        options.add_argument("--disable-gpu")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument(f"--user-data-dir={user_data_dir}")
+        options.add_argument(f"--profile-directory={profile_directory}")
+        options.add_argument("--disable-blink-features=AutomationControlled")
+    else:
+        # be careful with concurrent profile usage
+        options.add_argument(f"--user-data-dir={user_data_dir}")
+        options.add_argument(f"--profile-directory={profile_directory}")
+
+    # Common options
+    options.add_argument("--disable-features=VizDisplayCompositor")
+    options.add_argument("--disable-popup-blocking")
+    # prevent Selenium from stealing focus (but some behaviors on Windows still bring window forward)
+    options.add_argument("--disable-backgrounding-occluded-windows")
+    # консоль браузера для артефактов ошибок (driver.get_log("browser"))
+    options.set_capability("goog:loggingPrefs", {"browser": "ALL"})
+
+    if LAUNCH_PROFILE == "performance":
+        for arg in PERFORMANCE_ARGS:
+            options.add_argument(arg)
+        # свой кэш на каждый профиль (worker_0, worker_1, ...): один кэш двум браузерам не поделить
+        cache_dir = os.path.join(BROWSER_CACHE_DIR, os.path.basename(os.path.normpath(user_data_dir)))
+        options.add_argument(f"--disk-cache-dir={cache_dir}")
+        if DISABLE_EXTENSIONS:
+            options.add_argument("--disable-extensions")
+        # driver.get возвращается после DOMContentLoaded — готовность SPA проверяет wait_page_ready
+        options.page_load_strategy = "eager"
+    return options
+
+
+def create_driver(user_data_dir: str = USER_DATA_DIR, profile_directory: str = PROFILE_DIRECTORY):
+    service = Service(YANDEX_DRIVER_PATH) if YANDEX_DRIVER_PATH else Service()
+    driver = webdriver.Chrome(service=service, options=build_driver_options(user_data_dir, profile_directory))
+    if LAUNCH_PROFILE == "performance" and BLOCKED_URL_PATTERNS:
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+        except Exception:
+            logging.warning("CDP Network.setBlockedURLs недоступен — ресурсы не блокируются", exc_info=True)
+    return driver
+
+
+class BrowserSession:
+    """
+    Один запущенный браузер, который переиспользуется между позициями.
+    Перед каждой позицией проверяется, что браузер жив; после max_orders
+    позиций или после падения драйвер перезапускается.
+    """
+
+    def __init__(self, max_orders: int = SESSION_MAX_ORDERS,
+                 user_data_dir: str = USER_DATA_DIR, profile_directory: str = PROFILE_DIRECTORY):
+        self.max_orders = max_orders
+        self.user_data_dir = user_data_dir
+        self.profile_directory = profile_directory
+        self.driver = None
+        self.orders_done = 0
+        self.warmed_at: Optional[float] = None
+
+    def is_alive(self) -> bool:
+        if self.driver is None:
+            return False
+        try:
+            self.driver.execute_script("return document.readyState")
+            return True
+        except Exception:
+            return False
+
+    def get_driver(self):
+        """Возвращает рабочий драйвер: запускает/перезапускает браузер при необходимости."""
+        if self.driver is not None and self.orders_done >= self.max_orders:
+            logging.info(f"Сессия браузера отработала {self.orders_done} позиций — перезапуск")
+            self.close()
+        elif self.driver is not None and not self.is_alive():
+            logging.warning("Браузер не отвечает — перезапуск сессии")
+            self.close()
+        if self.driver is None:
+            self.driver = create_driver(self.user_data_dir, self.profile_directory)
+            self.orders_done = 0
+        return self.driver
+
+    def prewarm(self, url: str):
+        """Запускает браузер и заранее открывает url (страницу, с которой начинается заказ)."""
+        t0 = time.perf_counter()
+        try:
+            driver = self.get_driver()
+            driver.get(url)
+            wait_page_ready(driver)
+            self.warmed_at = time.monotonic()
+            logging.info(f"Браузер прогрет за {time.perf_counter() - t0:.1f} с")
+        except Exception:
+            logging.warning("Не удалось прогреть браузер — запустится на первой позиции", exc_info=True)
+            self.invalidate()
+
+    def take_warm_page(self) -> bool:
+        """True — браузер недавно прогрет и уже стоит на странице заказа (срабатывает один раз)."""
+        warmed, self.warmed_at = self.warmed_at, None
+        return warmed is not None and time.monotonic() - warmed < PREWARM_MAX_AGE
+
+    def order_finished(self):
+        self.orders_done += 1
+
+    def invalidate(self):
+        """Сессия в неизвестном состоянии (необработанная ошибка) — следующий get_driver начнёт с нуля."""
+        self.close()
+
+    def close(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+        self.driver = None
+        self.orders_done = 0
+        self.warmed_at = None
+
+
+class BrowserPool:
+    """
+    Пул браузерных сессий. Сессии создаются лениво и возвращаются в пул
+    после позиции; use: with pool.session() as s: perform_order_item(item, s)
+    """
+
+    def __init__(self, size: int = 1, max_orders: int = SESSION_MAX_ORDERS):
+        self._sessions: "queue.Queue[BrowserSession]" = queue.Queue()
+        self._all: List[BrowserSession] = []
+        for _ in range(max(1, size)):
+            s = BrowserSession(max_orders=max_orders)
+            self._all.append(s)
+            self._sessions.put(s)
+        self._prewarm_threads: List[threading.Thread] = []
+
+    @property
+    def browser_running(self) -> bool:
+        """Запущен ли браузер хотя бы в одной сессии пула."""
+        return any(s.driver is not None for s in self._all)
+
+    @contextmanager
+    def session(self):
+        s = self._sessions.get()
+        try:
+            yield s
+        finally:
+            self._sessions.put(s)
+
+    def prewarm(self, url: Optional[str] = None):
+        """
+        Прогревает сессии пула в фоновых потоках. Позиция, пришедшая во время
+        прогрева, ждёт его окончания (сессия занята), а не запускает второй браузер.
+        """
+        def warm():
+            with self.session() as s:
+                s.prewarm(url or ORDER_ENTRY_URL)
+
+        # демон прогревает пул при каждом простое — завершённые потоки не копим
+        self._prewarm_threads = [t for t in self._prewarm_threads if t.is_alive()]
+        for n in range(len(self._all)):
+            t = threading.Thread(target=warm, name=f"browser-prewarm-{n}", daemon=True)
+            t.start()
+            self._prewarm_threads.append(t)
+
+    def close(self):
+        # браузер, который ещё запускается в потоке прогрева, иначе останется висеть
+        for t in self._prewarm_threads:
+            t.join(timeout=60)
+        for s in self._all:
+            s.close()
+
+
+# -----------------------------
+# Waits: ожидание событий страницы вместо time.sleep
+# -----------------------------
+def settle(name: str):
+    """Настраиваемая минимальная пауза (см. SETTLE_DELAYS)."""
+    delay = SETTLE_DELAYS.get(name, 0)
+    if delay > 0:
+        time.sleep(delay)
+
+
+def wait_page_ready(driver, timeout: float = 20):
+    """DOM документа разобран и React-приложение отрисовало содержимое #root (картинок не ждём)."""
+    with timeouts.wait("page_ready", timeout, TimeoutException) as budget:
+        WebDriverWait(driver, budget).until(lambda d: d.execute_script(
+            "return document.readyState !== 'loading' && !!document.querySelector('#root > *');"
+        ))
+
+
+def wait_gone(driver, element, timeout: float = 5, step: Optional[str] = None) -> bool:
+    """
+    Ждёт, пока элемент пропадёт из DOM или станет невидимым. False — если не дождались.
+    step — имя шага для адаптивного таймаута (timeout тогда — по умолчанию).
+    """
+    try:
+        if step is None:
+            WebDriverWait(driver, timeout).until(EC.invisibility_of_element(element))
+        else:
+            with timeouts.wait(step, timeout, TimeoutException) as budget:
+                WebDriverWait(driver, budget).until(EC.invisibility_of_element(element))
+        return True
+    except TimeoutException:
+        return False
+
+
+def wait_value(driver, element, expected: str, timeout: float = 3) -> bool:
+    """Ждёт, пока value поля станет равным expected (React мог ещё не применить ввод)."""
+    try:
+        WebDriverWait(driver, timeout).until(lambda d: element.get_attribute("value") == expected)
+        return True
+    except TimeoutException:
+        return False
+
+
+def wait_gtin_option(driver, gtin: str, timeout: float = 10):
+    """
+    Ждёт в выпадающем списке поиска по справочнику вариант, содержащий GTIN
+    (без ведущих нулей), и возвращает его. Другие варианты (ответ на часть
+    GTIN или на прошлый запрос) не подходят — TimeoutException.
+    """
+    digits = str(gtin).lstrip("0") or str(gtin)
+
+    def option_present(d):
+        for o in d.find_elements(By.CSS_SELECTOR, GTIN_OPTION_SELECTOR):
+            if o.is_displayed() and digits in o.text:
+                return o
+        return False
+
+    # список перерисовывается по мере ответа поиска — устаревшие элементы просто пропускаем
+    with timeouts.wait("gtin_option", timeout, TimeoutException) as budget:
+        return WebDriverWait(driver, budget, ignored_exceptions=(StaleElementReferenceException,)).until(option_present)
+
+
+# -----------------------------
+# Retry: повтор действия шага на месте и контрольные точки заказа
+# -----------------------------
+# После этих ошибок действие имеет смысл повторить на той же странице: элемент был,
+# но перерисован, перекрыт или ещё не готов. Таймаут ожидания элемента не повторяем —
+# иначе каждая попытка ждёт весь бюджет шага заново.
+TRANSIENT_ERRORS = (
+    StaleElementReferenceException, ElementClickInterceptedException, ElementNotInteractableException,
+)
+
+
+class WizardStuck(Exception):
+    """Мастер не может продолжить с текущей страницы — заказ начинается заново (см. ORDER_RESTARTS)."""
+
+
+def retry_step(step: str, action: Callable[[], object]):
+    """
+    Выполняет action, при временной ошибке (TRANSIENT_ERRORS) повторяет его
+    (до STEP_RETRY_ATTEMPTS[step] попыток, пауза растёт до RETRY_MAX_DELAY).
+    Последняя ошибка пробрасывается.
+    """
+    attempts = STEP_RETRY_ATTEMPTS.get(step, STEP_RETRY_ATTEMPTS["default"])
+    delay = RETRY_DELAY
+    for attempt in range(1, attempts + 1):
+        try:
+            return action()
+        except TRANSIENT_ERRORS as e:
+            if attempt >= attempts:
+                raise
+            logging.warning(f"Шаг '{step}': попытка {attempt}/{attempts} не удалась "
+                            f"({type(e).__name__}) — повтор через {delay:.2f} с")
+            timing.record(f"retry:{step}", time.time(), delay, ok=False)
+            time.sleep(delay)
+            delay = min(delay * 2, RETRY_MAX_DELAY)
+
+
+def click_step(driver, name: str, timeout: float, js: bool = False, scroll: bool = False):
+    """
+    Находит элемент name и кликает (js — через execute_script); при временной ошибке —
+    заново, но элемент ждёт уже не дольше RETRY_FIND_TIMEOUT.
+    """
+    tries = 0
+
+    def action():
+        nonlocal tries
+        wait = timeout if tries == 0 else min(timeout, RETRY_FIND_TIMEOUT)
+        tries += 1
+        el = locators.find(driver, name, wait)
+        if scroll:
+            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", el)
+        if js:
+            driver.execute_script("arguments[0].click();", el)
+        else:
+            el.click()
+        return el
+
+    return retry_step(name, action)
+
+
+def checkpoint(item: Dict, state: str, message: str = ""):
+    """Контрольная точка заказа: в журнал прогона и в item (после неё заказ не перезапускается)."""
+    item.setdefault("_checkpoints", []).append(state)
+    journal.mark(item.get("_uid"), state, message)
+
+
+# -----------------------------
+# Worker: выполняет заказ для одной позиции
+# -----------------------------
+# Маркеры экранов мастера. Проверяются одним execute_script, от последнего
+# экрана мастера к первому: модалки и следующие шаги рисуются поверх предыдущих.
+# Локаторы элементов мастера — в locators.py.
+DETECT_SCREEN_JS = """
+const q = (s) => document.querySelector(s);
+const visible = (e) => !!e && (e.offsetParent !== null || getComputedStyle(e).position === 'fixed');
+const x = (p) => document.evaluate(p, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+const hasText = (sel, t) => Array.from(document.querySelectorAll(sel)).some((e) => visible(e) && e.textContent.includes(t));
+if (q('[data-test-id="signAndSendToGISMT"]') || q('[data-test-id="codesOrderSignCert"]')) return 'signing';
+if (q('[data-test-id="productCatalogSearchInput"]')) return 'products';
+if (q('[data-test-id="cisTypeField"]')) return 'requisites';
+if (hasText('button', 'Далее к заполнению реквизитов')) return 'catalog';
+if (hasText('label', 'Производство РФ')) return 'order_type';
+if (hasText('button', 'Заказать коды')) return 'order_entry';
+if (visible(x(arguments[1]))) return 'warehouses';
+if (visible(x(arguments[0]))) return 'profile';
+return 'unknown';
+"""
+
+# Сколько ждать, пока страница придёт в один из известных экранов (по умолчанию, см. timeouts.py)
+SCREEN_TIMEOUT = 20
+# Сколько раз можно попасть на один и тот же экран за заказ (защита от зацикливания)
+SCREEN_MAX_VISITS = 2
+# Сколько ещё ждать диалог подписи, если после "Отправить в ГИС МТ" страница осталась на товарах
+SIGN_DIALOG_TIMEOUT = 20
+
+
+def detect_screen(driver) -> str:
+    """Определяет текущий экран мастера за один запрос к браузеру."""
+    return driver.execute_script(DETECT_SCREEN_JS, locators.xpath_union("profile_card"),
+                                 locators.xpath_union("warehouse_card"))
+
+
+def wait_screen(driver, leave: Optional[str] = None, timeout: float = SCREEN_TIMEOUT) -> str:
+    """
+    Ждёт, пока страница покажет известный экран (и, если задан leave, — отличный от него).
+    Если не дождались — возвращает то, что видно сейчас. Бюджет ожидания — свой
+    у каждого перехода (уход с экрана leave), переходы сильно различаются по времени.
+    """
+    def known(d):
+        screen = detect_screen(d)
+        return screen if screen != "unknown" and screen != leave else False
+
+    try:
+        with timeouts.wait(f"screen_transition:{leave or 'start'}", timeout, TimeoutException) as budget:
+            return WebDriverWait(driver, budget, poll_frequency=0.1).until(known)
+    except TimeoutException:
+        return detect_screen(driver)
+
+
+def _screen_profile(driver, item: Dict):
+    click_step(driver, "profile_card", 5)
+    logging.info("Выбрали профиль")
+
+
+def _screen_warehouses(driver, item: Dict):
+    click_step(driver, "warehouse_card", 5)
+    logging.info("Тыкнули профиль")
+
+
+def _screen_order_entry(driver, item: Dict):
+    # Step 1: 'Заказать коды'
+    click_step(driver, "order_codes_button", 5)
+    logging.info("Нажали Заказать Коды")
+    settle("modal")
+
+
+def _screen_order_type(driver, item: Dict):
+    # Step 2: 'Производство РФ'
+    try:
+        rf_btn = locators.find(driver, "production_rf", 5)
+        rf_btn.click()
+        logging.info("Нажали производство РФ")
+    except Exception:
+        logging.info("Производство РФ выбор: не найден/не понадобился")
+
+    # Step 3: Далее
+    next_btn = click_step(driver, "order_type_next", 5)
+    # модалка выбора типа заказа закрывается — дальше форма заказа
+    wait_gone(driver, next_btn)
+    settle("modal")
+
+
+def _screen_catalog(driver, item: Dict):
+    order_name = item['order_name']
+
+    # Step: "Наполнить из справочника"
+    try:
+        fill_from_catalog_checkbox = locators.find(driver, "fill_from_catalog", 5)
+        driver.execute_script("arguments[0].click();", fill_from_catalog_checkbox)
+    except Exception:
+        logging.info("Галочка 'Наполнить из справочника' не найдена/не нужна")
+
+    # Step: Fill "Заказ кодов №" — insert order_name from input
+    try:
+        order_number_input = locators.find(driver, "order_number_input", 5)
+        order_number_input.clear()
+        # typed input to trigger React listeners
+        order_number_input.send_keys(str(order_name))
+        if not wait_value(driver, order_number_input, str(order_name)):
+            logging.warning("Поле 'Заказ кодов №': значение не подтвердилось")
+    except Exception:
+        logging.warning("Поле 'Заказ кодов №' не найдено/не удалось заполнить")
+
+    # Step: Далее к заполнению реквизитов
+    next_req_button = locators.find(driver, "catalog_next", 5)
+
+    # Прокручиваем и кликаем через JS
+    driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", next_req_button)
+
+    # Проверяем, что кнопка видима и кликабельна
+    if next_req_button.is_displayed() and next_req_button.is_enabled():
+        driver.execute_script("arguments[0].click();", next_req_button)
+        logging.info("Кнопка нажата через JS")
+    else:
+        logging.info("Кнопка не кликабельна, пробуем другой метод")
+        ActionChains(driver).move_to_element(next_req_button).click().perform()
+
+
+def _screen_requisites(driver, item: Dict):
+    # Step: Ensure 'Единица товара' selected - try selecting if not
+    try:
+        # Находим лейбл выбранного значения
+        label = locators.find(driver, "cis_type_label", 5, EC.presence_of_element_located)
+        selected_text = label.text.strip()
+        if selected_text == "Единица товара":
+            logging.info("✅ Уже выбрано 'Единица товара', пропускаем выбор")
+        else:
+            logging.info("Выбираем 'Единица товара' явно")
+            wait = WebDriverWait(driver, 10)
+
+            # Находим кнопку селекта
+            select_button = locators.find(driver, "cis_type_button", 10)
+
+            # Получаем ID меню
+            menu_id = select_button.get_attribute("aria-controls")
+            logging.info(f"ID меню: {menu_id}")
+
+            # Кликаем чтобы открыть дропдаун
+            driver.execute_script("arguments[0].click();", select_button)
+
+            # Ждем появления меню
+            wait.until(EC.visibility_of_element_located((By.ID, menu_id)))
+
+            # Находим опцию по тексту
+            option_xpath = f"//*[@id='{menu_id}']//*[normalize-space(text())='Единица товара']"
+            option = wait.until(EC.element_to_be_clickable((By.XPATH, option_xpath)))
+
+            # Кликаем на опцию
+            driver.execute_script("arguments[0].click();", option)
+
+            # Ждем закрытия меню
+            wait.until(EC.invisibility_of_element_located((By.ID, menu_id)))
+
+            # Подтверждаем выбор
+            selected_text = label.text.strip()
+            if selected_text == "Единица товара":
+                logging.info("✅ 'Единица товара' выбрано успешно")
+            else:
+                raise ValueError(f"Не удалось выбрать, текущее значение: {selected_text}")
+    except Exception:
+        logging.info("Не удалось установить 'Единица товара' (возможно уже выбрано)")
+
+    # Step: Далее к загрузке товаров
+    next_upload_btn = locators.find(driver, "requisites_next", 10)
+
+    # Прокручиваем к кнопке и кликаем через JS
+    driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", next_upload_btn)
+    next_upload_btn.click()
+    logging.info("Попытка клика через обычный click() выполнена")
+
+    # Проверка, что кнопка пропала (следствие перехода на следующую страницу)
+    try:
+        WebDriverWait(driver, 5).until(EC.staleness_of(next_upload_btn))
+        logging.info("✅ Кнопка 'Далее к загрузке товаров' успешно нажата")
+    except TimeoutException:
+        logging.warning("Кнопка не исчезла после клика, пробуем JS-клик")
+        driver.execute_script("arguments[0].click();", next_upload_btn)
+        wait_gone(driver, next_upload_btn)
+        logging.info("Попытка клика через JS выполнена")
+
+
+def _fill_product_line(driver, gtin: str, codes_count: int, row: int = 0):
+    """
+    Одна строка товара на шаге "Товары": поиск GTIN по справочнику, выбор
+    варианта, количество кодов. row — номер строки в заказе (с 0).
+    """
+    # Ввод GTIN и количество (работаем строго с выпадающим элементом, ожидаем option, кликаем по тому, что содержит GTIN)
+    with timing.span("gtin_search"):
+        # Вводим GTIN
+        gtin_input = locators.find(driver, "gtin_search_input", 10)
+        gtin_input.clear()
+        gtin_input.send_keys(str(gtin))
+        logging.info(f"Введен GTIN: {gtin}")
+        settle("gtin_search")
+
+    with timing.span("gtin_select"):
+        # кликаем именно вариант с этим GTIN; не появился — строка не заполнена
+        # (выбор клавиатурой взял бы первый вариант списка, возможно чужой товар)
+        try:
+            option = wait_gtin_option(driver, gtin)
+            try:
+                option.click()
+            except (StaleElementReferenceException, ElementClickInterceptedException):
+                # список перерисовался между поиском варианта и кликом
+                driver.execute_script("arguments[0].click();", wait_gtin_option(driver, gtin))
+        except TimeoutException:
+            raise TimeoutException(f"В справочнике портала нет варианта с GTIN {gtin}")
+        logging.info(f"✅ GTIN выбран: {gtin}")
+
+        # После выбора GTIN DOM может обновиться, поэтому нужно заново найти элементы
+        # Ввод количества кодов - находим поле заново после обновления DOM
+        # (у каждой строки товара своё поле — берём поле строки row)
+        qty_input = locators.find_nth(driver, "quantity_input", row, 10)
+
+    _fill_quantity(driver, qty_input, codes_count)
+
+
+def _fill_quantity(driver, qty_input, codes_count: int):
+    """Количество кодов в поле строки товара (клик, очистка, ввод, TAB, проверка)."""
+    with timing.span("quantity"):
+        # Прокручиваем к полю и кликаем на него
+        driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", qty_input)
+
+        # Очищаем поле (несколько способов)
+        qty_input.click()
+        qty_input.send_keys(Keys.CONTROL + "a")  # Выделяем весь текст
+        qty_input.send_keys(Keys.DELETE)         # Удаляем выделенный текст
+
+        # Вводим значение (посимвольно — только если задан TYPE_CHAR_DELAY)
+        if TYPE_CHAR_DELAY > 0:
+            for char in str(codes_count):
+                qty_input.send_keys(char)
+                time.sleep(TYPE_CHAR_DELAY)
+        else:
+            qty_input.send_keys(str(codes_count))
+
+        # Убеждаемся, что значение установилось
+        wait_value(driver, qty_input, str(codes_count))
+
+        # Имитируем потерю фокуса (TAB) для активации валидации
+        qty_input.send_keys(Keys.TAB)
+
+        # Проверяем, что значение установилось правильно
+        current_qty = qty_input.get_attribute("value")
+        if current_qty != str(codes_count):
+            logging.warning(f"⚠ Количество не совпадает: ожидалось {codes_count}, получено {current_qty}")
+            # Пробуем установить значение через JavaScript
+            driver.execute_script("""
+                arguments[0].value = arguments[1];
+                var event = new Event('input', { bubbles: true });
+                arguments[0].dispatchEvent(event);
+                var changeEvent = new Event('change', { bubbles: true });
+                arguments[0].dispatchEvent(changeEvent);
+            """, qty_input, str(codes_count))
+            wait_value(driver, qty_input, str(codes_count))
+        else:
+            logging.info(f"✅ Количество кодов подтверждено: {codes_count}")
+
+
+# Все строки товаров за один запрос к браузеру: для каждой строки ввести GTIN в поиск,
+# дождаться варианта с этим GTIN, кликнуть его, дождаться поля количества строки,
+# выставить значение (через setter прототипа — так ввод видит React) и проверить его.
+# Следующая строка начинается только после проверки предыдущей.
+FILL_PRODUCTS_JS = """
+const [lines, searchSel, optionSel, qtySel, timeoutMs] = arguments;
+const callback = arguments[arguments.length - 1];
+const setter = Object.getOwnPropertyDescriptor(HTMLInputElement.prototype, 'value').set;
+const visible = (e) => !!e && e.offsetParent !== null;
+const setValue = (el, v) => {
+  el.focus();
+  setter.call(el, v);
+  el.dispatchEvent(new Event('input', {bubbles: true}));
+  el.dispatchEvent(new Event('change', {bubbles: true}));
+};
+const waitFor = (fn, ms) => new Promise((resolve, reject) => {
+  const t0 = Date.now();
+  (function poll() {
+    let v = null;
+    try { v = fn(); } catch (e) {}
+    if (v) return resolve(v);
+    if (Date.now() - t0 > ms) return reject(new Error('timeout'));
+    setTimeout(poll, 50);
+  })();
+});
+(async () => {
+  const values = [];
+  for (let i = 0; i < lines.length; i++) {
+    const [gtin, count] = [String(lines[i][0]), String(lines[i][1])];
+    let stage = 'search';
+    try {
+      const input = await waitFor(() => Array.from(document.querySelectorAll(searchSel)).find(visible), timeoutMs);
+      setValue(input, gtin);
+      const digits = gtin.replace(/^0+/, '');
+      const option = await waitFor(() => Array.from(document.querySelectorAll(optionSel))
+        .find((o) => visible(o) && o.textContent.includes(digits)), timeoutMs);
+      stage = 'quantity';
+      option.scrollIntoView({block: 'center'});
+      for (const type of ['mousedown', 'mouseup', 'click']) {
+        option.dispatchEvent(new MouseEvent(type, {bubbles: true, cancelable: true}));
+      }
+      const qty = await waitFor(() => Array.from(document.querySelectorAll(qtySel)).filter(visible)[i], timeoutMs);
+      setValue(qty, count);
+      qty.dispatchEvent(new FocusEvent('focusout', {bubbles: true}));
+      qty.blur();
+      await waitFor(() => qty.value === count, 1000);
+      values.push(qty.value);
+    } catch (e) {
+      callback({ok: false, row: i, stage: stage, error: String(e), values: values});
+      return;
+    }
+  }
+  callback({ok: true, values: values});
+})();
+"""
+
+
+def _fill_products_js(driver, lines: List[Tuple[str, int]], timeout: float = 10) -> Dict:
+    """
+    Заполняет строки товаров одним execute_async_script. Возвращает
+    {"ok": True} или {"ok": False, "row": строка, "stage": "search"|"quantity", "error": ...}:
+    строки до row заполнены и проверены, на стадии "quantity" строка row уже добавлена.
+    """
+    with timing.span("products_js"):
+        # таймаут скриптов — общий для сессии браузера: после заполнения возвращаем прежний
+        previous = driver.timeouts.script
+        driver.set_script_timeout(timeout * (3 * len(lines) + 1))
+        try:
+            return driver.execute_async_script(
+                FILL_PRODUCTS_JS, [[g, c] for g, c in lines], locators.css_selector("gtin_search_input"),
+                GTIN_OPTION_SELECTOR, locators.css_selector("quantity_input"), int(timeout * 1000),
+            )
+        except Exception as e:
+            # скрипт прервался — по числу добавленных строк понимаем, где остановились
+            added = sum(1 for el in driver.find_elements(By.CSS_SELECTOR, locators.css_selector("quantity_input"))
+                        if el.is_displayed())
+            if added:
+                return {"ok": False, "row": added - 1, "stage": "quantity", "error": str(e)}
+            return {"ok": False, "row": 0, "stage": "search", "error": str(e)}
+        finally:
+            driver.set_script_timeout(previous)
+
+
+def _screen_products(driver, item: Dict):
+    gtin = item['gtin']
+    lines = order_lines(item)
+    failed = []
+    start = 0
+
+    # Step: строки товаров одним скриптом (PRODUCTS_FILL_MODE = "js")
+    if PRODUCTS_FILL_MODE == "js":
+        res = _fill_products_js(driver, lines)
+        if res.get("ok"):
+            logging.info(f"✅ Строки товаров заполнены скриптом: {len(lines)}")
+            start = len(lines)
+        else:
+            start = res["row"]
+            logging.warning(f"Заполнение скриптом остановилось на строке {start + 1} ({res['stage']}): "
+                            f"{res.get('error')} — продолжаем вводом с клавиатуры")
+            if res["stage"] == "quantity":
+                # строка уже добавлена — вводим только количество
+                line_gtin, line_count = lines[start]
+                try:
+                    _fill_quantity(driver, locators.find_nth(driver, "quantity_input", start, 10), line_count)
+                except Exception as e:
+                    logging.error(f"Ошибка при вводе количества: {e}")
+                    artifacts.capture(driver, "gtin_qty", item.get("_uid"))
+                    failed.append(line_gtin)
+                start += 1
+
+    # Step: строки товаров (обычно одна; многострочный заказ — см. OrderItem.lines)
+    for row, (line_gtin, line_count) in enumerate(lines[start:], start=start):
+        try:
+            _fill_product_line(driver, line_gtin, line_count, row)
+        except Exception as e:
+            logging.error(f"Ошибка при вводе GTIN или количества: {e}")
+            artifacts.capture(driver, "gtin_qty", item.get("_uid"))
+            failed.append(line_gtin)
+    if failed:
+        # заказ без части строк (или пустой) не отправляем: позиции получат ошибку и уйдут в --resume
+        browser_not_found.extend(failed)
+        if len(lines) == 1:
+            return False, f"GTIN {gtin} НЕ НАЙДЕН В СПРАВОЧНИКЕ"
+        return False, f"Не удалось заполнить строки заказа: GTIN {', '.join(failed)}"
+    if len(lines) > 1:
+        gtin = ", ".join(g for g, _ in lines)
+
+    # Step: Нажать "Отправить в ГИС МТ"
+    try:
+        with timing.span("send_to_gismt"):
+            click_step(driver, "send_button", 10, scroll=True)
+
+            # Проверка, что кнопка действительно нажата: появился диалог подписи
+            try:
+                locators.find(driver, "sign_dialog", 10, EC.presence_of_element_located)
+                logging.info("✅ Кнопка 'Отправить в ГИС МТ' нажата")
+                checkpoint(item, journal.SENT)
+            except TimeoutException:
+                logging.warning("⚠️ Кнопка 'Отправить в ГИС МТ' возможно не сработала")
+                checkpoint(item, journal.SENT, "не подтверждено")
+
+    except Exception as e:
+        # строки уже проверены — GTIN здесь ни при чём, заказ просто не отправлен
+        logging.error(f"Ошибка при нажатии кнопки 'Отправить в ГИС МТ': {e}")
+        artifacts.capture(driver, "send_to_gismt", item.get("_uid"))
+        return False, f"Заказ не отправлен в ГИС МТ (GTIN {gtin}): {e}"
+
+
+def _screen_signing(driver, item: Dict):
+    # Step: Подписать сертификатом
+    logging.info("Нажимаем ПОДПИСАТЬ СЕРТИФИКАТОМ")
+    try:
+        with timing.span("sign_cert"):
+            # Ждём кнопку "Подписать сертификатом" и кликаем через JS (надёжнее для React)
+            click_step(driver, "sign_cert_button", 15, js=True)
+            logging.info("✅ Нажата кнопка 'Подписать сертификатом'")
+
+    except Exception as e:
+        logging.error(f"Ошибка при нажатии кнопки 'Подписать сертификатом': {e}")
+        artifacts.capture(driver, "sign_cert", item.get("_uid"))
+        return False, f"Заказ отправлен, но не подписан ('Подписать сертификатом'): {e}"
+
+    # Step: Подписать и отправить в ГИС МТ
+    try:
+        with timing.span("sign_and_send"):
+            # Ждём кнопку и кликаем через JS для надежности
+            sign_send_button = click_step(driver, "sign_send_button", 15, js=True, scroll=True)
+            logging.info("✅ Кнопка 'Подписать и отправить в ГИС МТ' нажата")
+
+            # Ждём завершения отправки: диалог подписи закрывается
+            if wait_gone(driver, sign_send_button, timeout=30, step="sign_close"):
+                checkpoint(item, journal.SIGNED)
+            else:
+                logging.warning("Диалог подписи не закрылся после 'Подписать и отправить в ГИС МТ'")
+                # клик был — считаем подписанным, чтобы --resume не создал дубль заказа
+                checkpoint(item, journal.SIGNED, "не подтверждено")
+            settle("after_sign")
+
+    except Exception as e:
+        logging.error(f"Ошибка при нажатии кнопки 'Подписать и отправить в ГИС МТ': {e}")
+        artifacts.capture(driver, "sign_and_send", item.get("_uid"))
+        return False, f"Заказ отправлен, но не подписан ('Подписать и отправить в ГИС МТ'): {e}"
+
+    # success
+    return True, f"OK: {item['simpl_name']} ({item['order_name']})"
+
+
+# экран -> обработчик. Обработчик выполняет действия экрана и либо возвращает None
+# (мастер идёт дальше), либо итог заказа (ok, msg).
+SCREEN_HANDLERS: Dict[str, Callable[..., Optional[Tuple[bool, str]]]] = {
+    "profile": _screen_profile,
+    "warehouses": _screen_warehouses,
+    "order_entry": _screen_order_entry,
+    "order_type": _screen_order_type,
+    "catalog": _screen_catalog,
+    "requisites": _screen_requisites,
+    "products": _screen_products,
+    "signing": _screen_signing,
+}
+
+
+def run_order_wizard(driver, item: Dict) -> Tuple[bool, str]:
+    """
+    Проходит мастер "Заказ кодов": определяет текущий экран и запускает только
+    его обработчик, пока обработчик подписи не вернёт итог. Шаги, которые
+    портал не показал (профиль уже выбран и т.п.), не стоят таймаута.
+    Если мастер застрял (экран не распознан или не меняется) — WizardStuck.
+    """
+    visits: Dict[str, int] = {}
+    with timing.span("page_transition"):
+        screen = wait_screen(driver)
+    while True:
+        if screen == "unknown":
+            raise WizardStuck("Не удалось определить экран мастера заказа")
+        if screen == "products" and journal.SENT in item.get("_checkpoints", []):
+            # "Отправить в ГИС МТ" уже нажата: заполнить и отправить ещё раз — второй заказ в портале.
+            # Ждём диалог подписи дальше; не дождались — ошибка позиции (без перезапуска, см. checkpoint)
+            with timing.span("page_transition"):
+                screen = wait_screen(driver, leave="products", timeout=SIGN_DIALOG_TIMEOUT)
+            if screen == "products":
+                raise WizardStuck("Заказ отправлен в ГИС МТ, но диалог подписи не появился — проверьте заказ в портале")
+            continue
+        visits[screen] = visits.get(screen, 0) + 1
+        if visits[screen] > SCREEN_MAX_VISITS:
+            raise WizardStuck(f"Мастер заказа не продвигается дальше экрана '{screen}'")
+
+        logging.info(f"Экран мастера: {screen}")
+        try:
+            with timing.span(f"screen:{screen}"):
+                result = SCREEN_HANDLERS[screen](driver, item)
+        except TimeoutException:
+            logging.warning(f"Экран '{screen}': элемент не найден/не кликабелен")
+            artifacts.capture(driver, f"screen_{screen}", item.get("_uid"))
+            result = None
+        except Exception as e:
+            # как и раньше, шаги best-effort: логируем и смотрим, куда пришла страница
+            logging.warning(f"Экран '{screen}': ошибка {e}")
+            artifacts.capture(driver, f"screen_{screen}", item.get("_uid"))
+            result = None
+        if result is not None:
+            return result
+        with timing.span("page_transition"):
+            screen = wait_screen(driver, leave=screen)
+
+
+def _portal_driver(session: BrowserSession):
+    """Драйвер сессии на странице портала — cookies для API снимаются с её домена."""
+    driver = session.get_driver()
+    if urlsplit(driver.current_url).netloc != urlsplit(ORDER_ENTRY_URL).netloc:
+        driver.get(ORDER_ENTRY_URL)
+        wait_page_ready(driver)
+    return driver
+
+
+def perform_order_item(item: Dict, session: Optional[BrowserSession] = None):
+    """
+    Запускается в отдельном процессе. Получает словарь item (OrderItem -> asdict).
+    Делает браузерную автоматизацию для создания заявки (ORDER_ENGINE = "api" —
+    заказ создаётся и отправляется запросами к API, подписывается в браузере;
+    мастер целиком — если API не справился до создания заказа, см. api_engine).
+    session — уже запущенный браузер (BrowserSession); если не передан,
+    браузер запускается и закрывается на эту одну позицию.
+    Возвращает (True/False, message)
+    """
+    # В процессе логируем в файл
+    logging.info(f"Worker start for order: {item.get('order_name')} - {item.get('simpl_name')}")
+
+    # Браузер берём из сессии (пул), либо, как раньше, запускаем на одну позицию
+    own_session = session is None
+    if own_session:
+        session = BrowserSession(max_orders=1)
+
+    try:
+        with timing.order(item.get("_uid")), timing.span("order"):
+            driver = None
+            if ORDER_ENGINE == "api" and not api_engine.client.disabled:
+                run_item = dict(item, _checkpoints=[])
+                try:
+                    ok, msg, order_id = api_engine.perform_order(run_item, lambda: _portal_driver(session),
+                                                                 checkpoint)
+                except api_engine.ApiFallback as e:
+                    logging.warning(f"API: {e} — заказ через мастер в браузере")
+                else:
+                    if order_id is None:
+                        return ok, msg
+                    # заказ уже отправлен (SENT в run_item) — мастер только подписывает,
+                    # при ошибке заново не начинаем: будет дубль заказа
+                    try:
+                        with timing.span("open_signing"):
+                            driver = session.get_driver()
+                            driver.get(API_ORDER_URL.format(order_id=order_id))
+                            wait_page_ready(driver)
+                        return run_order_wizard(driver, run_item)
+                    except Exception as exc:
+                        logging.warning(f"Заказ {order_id}: подпись в браузере не удалась: {exc}")
+                        artifacts.capture(driver, "sign", item.get("_uid"))
+                        if not isinstance(exc, (WizardStuck, TimeoutException)):
+                            session.invalidate()
+                        return False, f"Заказ {order_id} отправлен, но не подписан: {exc}"
+            for attempt in range(ORDER_RESTARTS + 1):
+                # контрольные точки — свои у каждой попытки (см. checkpoint)
+                run_item = dict(item, _checkpoints=[])
+                try:
+                    with timing.span("browser_start"):
+                        driver = session.get_driver()
+                    with timing.span("open_entry"):
+                        if session.take_warm_page():
+                            logging.info("Страница заказа уже открыта (браузер прогрет)")
+                        else:
+                            driver.get(ORDER_ENTRY_URL)
+                            wait_page_ready(driver)
+                    return run_order_wizard(driver, run_item)
+                except Exception as exc:
+                    if isinstance(exc, WizardStuck):
+                        logging.warning(f"{exc}")
+                        artifacts.capture(driver, "stuck", item.get("_uid"))
+                    elif isinstance(exc, TimeoutException):
+                        # страница не успела (бюджет ожидания выучен по быстрым прогонам) —
+                        # браузер исправен, перезапускать его незачем
+                        logging.warning(f"Таймаут ожидания страницы: {exc.msg or exc}")
+                        artifacts.capture(driver, "timeout", item.get("_uid"))
+                    else:
+                        logging.exception("Unhandled exception in worker")
+                        session.invalidate()
+                    # после отправки в ГИС МТ заново не начинаем — будет дубль заказа (см. --resume)
+                    if run_item["_checkpoints"] or attempt >= ORDER_RESTARTS:
+                        return False, str(exc)
+                    logging.warning(f"Заказ начинается заново ({attempt + 1}/{ORDER_RESTARTS})")
+                    timing.record("order_restart", time.time(), 0.0, ok=False)
+    finally:
+        session.order_finished()
+        timeouts.flush()
+        if own_session:
+            session.close()
+
+# -----------------------------
+# Parallel: несколько браузеров на клонах авторизованного профиля
+# -----------------------------
+# Кэши и lock-файлы браузера не копируем — они не нужны для авторизации и
+# занимают большую часть профиля (а lock-файлы мешают второму экземпляру)
+PROFILE_CLONE_IGNORE = shutil.ignore_patterns(
+    "Cache", "Code Cache", "GPUCache", "GrShaderCache", "ShaderCache", "DawnCache",
+    "Service Worker", "Crashpad", "Singleton*", "lockfile", "*.tmp",
+)
+
+
+def clone_profile(dest_user_data_dir: str, src_user_data_dir: str = USER_DATA_DIR,
+                  profile_directory: str = PROFILE_DIRECTORY) -> str:
+    """
+    Копирует профиль (cookies, Local Storage, ключ шифрования из 'Local State')
+    в отдельный user-data-dir, чтобы несколько браузеров не делили один профиль.
+    """
+    os.makedirs(dest_user_data_dir, exist_ok=True)
+    local_state = os.path.join(src_user_data_dir, "Local State")
+    if os.path.exists(local_state):
+        shutil.copy2(local_state, dest_user_data_dir)
+    try:
+        shutil.copytree(
+            os.path.join(src_user_data_dir, profile_directory),
+            os.path.join(dest_user_data_dir, profile_directory),
+            ignore=PROFILE_CLONE_IGNORE,
+            dirs_exist_ok=True,
+        )
+    except shutil.Error as e:
+        # занятые открытым браузером файлы пропускаем — для входа они не критичны
+        logging.warning(f"Клон профиля {dest_user_data_dir}: не скопировано файлов: {len(e.args[0])}")
+    return dest_user_data_dir
+
+
+# сессия браузера текущего процесса-воркера (см. _init_parallel_worker)
+_worker_session: Optional[BrowserSession] = None
+
+
+def _init_parallel_worker(profiles: "multiprocessing.Queue", run_dir: Optional[str] = None,
+                          journal_path: Optional[str] = None, journal_run_id: Optional[str] = None,
+                          log_queue: Optional["multiprocessing.Queue"] = None):
+    global _worker_session
+    # лог воркера — в очередь главного процесса, в файл пишет его слушатель (см. logs.py)
+    if log_queue is not None:
+        logs.setup_worker(log_queue)
+    else:
+        setup_logging()
+    timing.attach_run(run_dir)
+    if journal_path:
+        journal.attach(journal_run_id, journal_path)
+    user_data_dir = profiles.get()
+    _worker_session = BrowserSession(user_data_dir=user_data_dir)
+    # atexit в дочерних процессах multiprocessing не вызывается — используем Finalize
+    multiprocessing.util.Finalize(None, _worker_session.close, exitpriority=10)
+    multiprocessing.util.Finalize(None, artifacts.flush, exitpriority=5)
+    logging.info(f"Parallel worker {os.getpid()} использует профиль {user_data_dir}")
+
+
+def _parallel_worker(payload: Dict):
+    """Выполняется в процессе-воркере. Возвращает (ok, msg, GTIN'ы не найденные в браузере)."""
+    start = len(browser_not_found)
+    try:
+        res = perform_order_item(payload, _worker_session)
+        ok, msg = res
+    except Exception as e:
+        logging.exception("Ошибка при выполнении задачи в воркере")
+        ok, msg = False, f"Exception: {e}"
+    not_found = browser_not_found[start:]
+    del browser_not_found[start:]
+    return bool(ok), str(msg), not_found
+
+
+def execute_parallel(items: List[OrderItem], workers: int = PARALLEL_WORKERS,
+                     on_result: Optional[Callable[[bool, str, OrderItem], None]] = None) -> List[Tuple[bool, str, OrderItem]]:
+    """
+    Выполняет позиции в workers процессах, у каждого свой браузер на клоне профиля.
+    Позиции выдаются воркерам по приоритету и в темпе Dispatcher (см. dispatcher.py).
+    Результаты возвращаются в исходном порядке items в формате (ok, msg, item);
+    on_result вызывается по мере готовности (из потока результатов пула).
+    GTIN'ы, не найденные в браузере, собираются в общий browser_not_found.
+    """
+    workers = max(1, min(workers, len(items)))
+    clone_root = tempfile.mkdtemp(prefix="kontur_profiles_")
+    results: List[Optional[Tuple[bool, str, OrderItem]]] = [None] * len(items)
+    try:
+        ui_print(f"Подготовка {workers} копий профиля браузера...")
+        profiles = multiprocessing.Queue()
+        for n in range(workers):
+            profiles.put(clone_profile(os.path.join(clone_root, f"worker_{n}")))
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_parallel_worker,
+                                 initargs=(profiles, timing.current_run_dir(),
+                                           journal.current_path(), journal.current_run_id(),
+                                           logs.worker_queue())) as executor:
+            dispatcher = Dispatcher(items, max_in_flight=min(workers, DISPATCH_MAX_IN_FLIGHT))
+
+            def finish(idx: int, fut):
+                it = items[idx]
+                try:
+                    ok, msg, not_found = fut.result()
+                    browser_not_found.extend(not_found)
+                except Exception as e:
+                    logging.exception("Воркер завершился с ошибкой")
+                    ok, msg = False, f"Exception: {e}"
+                try:
+                    results[idx] = (ok, msg, it)
+                    if on_result:
+                        on_result(ok, msg, it)
+                finally:
+                    dispatcher.done()
+
+            # следующая позиция уходит в пул, когда освободился воркер и есть токен темпа
+            for idx, it in dispatcher:
+                payload = asdict(it)
+                payload["_uid"] = getattr(it, "_uid", None)
+                executor.submit(_parallel_worker, payload).add_done_callback(partial(finish, idx))
+    finally:
+        shutil.rmtree(clone_root, ignore_errors=True)
+    return results